@@ -0,0 +1,49 @@
+"""
+Benchmarks of the Udmurt analyzer. Run them from the root of the
+repository: python -m benchmarks --help. They only measure and report
+the speed and memory; the checks that the optimizations do not change
+the analyses are in tests/.
+"""
+
+import subprocess
+import sys
+import time
+
+MODES = ('strict', 'nodiacritics', 'oldorth')
+
+
+def run_isolated(code):
+    """
+    Run a piece of Python code in a fresh interpreter, so that
+    nothing is shared with previous runs. Return the time it took
+    the code to run. Interpreter shutdown,
+    which takes a while with millions of grammar objects, is not
+    counted.
+    """
+    code = 'import time\nt1 = time.time()\n' + code + '\nprint(time.time() - t1)\n'
+    proc = subprocess.run([sys.executable, '-c', code], check=True,
+                          stdout=subprocess.PIPE)
+    return float(proc.stdout.decode('utf-8').strip().splitlines()[-1])
+
+
+def best_time(func, repeats):
+    """
+    Call the function several times and return the shortest time.
+    """
+    times = []
+    for i in range(repeats):
+        t1 = time.time()
+        func()
+        times.append(time.time() - t1)
+    return min(times)
+
+
+def peak_rss():
+    """
+    Return the peak resident memory of the current process in megabytes.
+    """
+    import resource
+    maxRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return maxRss / 1048576
+    return maxRss / 1024
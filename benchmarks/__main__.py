@@ -0,0 +1,69 @@
+import json
+import os
+import sys
+from . import MODES
+from .analyzer import benchmark_startup, benchmark_lexicons, benchmark_normalization, benchmark_rule_index
+from .samples import text_sample
+from .server import benchmark_server
+from .suite import BASELINE_FILE, RESULTS_FILE, run_suite, compare_results
+
+
+def main(args=None):
+    import argparse
+    argParser = argparse.ArgumentParser(prog='python -m benchmarks',
+                                        description='Benchmarks of the Udmurt analyzer.')
+    argParser.add_argument('--suite', action='store_true',
+                           help='run the benchmark suite and compare the results with the baseline')
+    argParser.add_argument('--modes', nargs='+', default=list(MODES), choices=MODES)
+    argParser.add_argument('--words', type=int, default=2000, help='size of the word sample')
+    argParser.add_argument('--repeats', type=int, default=3)
+    argParser.add_argument('--output', default=RESULTS_FILE, help='where to write the results')
+    argParser.add_argument('--baseline', default=BASELINE_FILE)
+    argParser.add_argument('--save-baseline', action='store_true', help='store the results as the new baseline')
+    argParser.add_argument('--tolerance', type=float, default=0.25,
+                           help='slowdown (share of the baseline value) reported as a regression')
+    argParser.add_argument('--cg-executable', default=None)
+    argParser.add_argument('--no-prepare', action='store_true', help='do not time pre_build.prepare_files()')
+    argParser.add_argument('--server', action='store_true',
+                           help='load test the HTTP server with concurrent one-sentence requests')
+    argParser.add_argument('--concurrency', type=int, default=32, help='number of clients in the server test')
+    argParser.add_argument('--requests', type=int, default=2000, help='number of requests in the server test')
+    argParser.add_argument('--disambiguate', action='store_true', help='disambiguate in the server test')
+    argParser.add_argument('--rules', action='store_true',
+                           help='time the indexed and the linear checks of bad analyses and lexical rules')
+    args = argParser.parse_args(args)
+    if args.rules:
+        for mode in args.modes:
+            benchmark_rule_index(mode=mode, nWords=args.words)
+        return 0
+    if args.server:
+        for mode in args.modes:
+            benchmark_server(text_sample(), mode=mode, concurrency=args.concurrency, nRequests=args.requests,
+                             disambiguate=args.disambiguate, cg_executable=args.cg_executable)
+        return 0
+    if not args.suite:
+        benchmark_startup()
+        benchmark_lexicons()
+        benchmark_normalization()
+        return 0
+    results = run_suite(modes=args.modes, nWords=args.words, repeats=args.repeats, fnameOut=args.output,
+                        cg_executable=args.cg_executable, prepare=not args.no_prepare)
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as fOut:
+            json.dump(results, fOut, ensure_ascii=False, indent=1, sort_keys=True)
+        print('Baseline written to', args.baseline)
+        return 0
+    if not os.path.exists(args.baseline):
+        print('No baseline in', args.baseline)
+        return 0
+    with open(args.baseline, 'r', encoding='utf-8') as fIn:
+        baseline = json.load(fIn)
+    regressions = compare_results(results, baseline, tolerance=args.tolerance)
+    if len(regressions) > 0:
+        print(len(regressions), 'regressions.')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
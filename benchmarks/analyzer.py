@@ -0,0 +1,288 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from . import MODES, run_isolated, peak_rss
+from .samples import load_sample, load_analyzed_sample, fixed_sample, orthography_sample, rule_sample
+
+
+def benchmark_startup(modes=MODES, repeats=3):
+    """
+    Compare the time it takes to create a ready-to-use UdmurtAnalyzer
+    from the text files and from the precompiled snapshot
+    (run pre_build.build_snapshots() first).
+    """
+    code = ('from uniparser_udmurt import UdmurtAnalyzer\n'
+            'a = UdmurtAnalyzer(mode="{mode}", use_snapshot={snapshot})\n'
+            'assert a.snapshotLoaded == {snapshot}\n'
+            'a.analyze_words("яратӥсько")\n')
+    results = {}
+    for mode in modes:
+        for snapshot in (False, True):
+            times = [run_isolated(code.format(mode=mode, snapshot=snapshot))
+                     for _ in range(repeats)]
+            results[(mode, snapshot)] = min(times)
+            print(mode, 'snapshot' if snapshot else 'text files',
+                  'startup:', round(min(times), 2), 'seconds.')
+    return results
+
+
+def benchmark_lexicons(mode='strict', repeats=3):
+    """
+    Compare the startup time and peak memory of analyzers with all
+    lexicon shards, with the core lexicon only and with lexicons='auto',
+    and the time it takes to analyze the first proper name (which
+    loads the shards with lexicons='auto').
+    """
+    code = ('import time\n'
+            't1 = time.time()\n'
+            'from uniparser_udmurt import UdmurtAnalyzer\n'
+            'from benchmarks import peak_rss\n'
+            'a = UdmurtAnalyzer(mode="{mode}", lexicons={lexicons})\n'
+            't2 = time.time()\n'
+            'rss = peak_rss()\n'
+            'a.analyze_words("Ижкарын")\n'
+            'print(t2 - t1, rss, time.time() - t2)\n')
+    results = {}
+    for lexicons in ('None', '[]', '"auto"'):
+        runs = []
+        for _ in range(repeats):
+            proc = subprocess.run([sys.executable, '-c', code.format(mode=mode, lexicons=lexicons)],
+                                  check=True, stdout=subprocess.PIPE)
+            runs.append([float(x) for x in proc.stdout.decode('utf-8').strip().splitlines()[-1].split()])
+        startup, rss, firstName = min(runs)
+        results[lexicons] = {'startup': startup, 'rss': rss, 'first_name': firstName}
+        print(mode, 'lexicons =', lexicons, ': startup', round(startup, 2), 's, peak RSS',
+              round(rss), 'MB, first proper name', round(firstName, 2), 's.')
+    return results
+
+
+def dump_analyses(mode, normalize, fnameWords, fnameOut, use_snapshot=True):
+    """
+    Analyze the words listed in a file and write their analyses,
+    along with the startup time, analysis time and peak memory,
+    to a JSON file. Called in a separate process by
+    benchmark_normalization().
+    """
+    from uniparser_udmurt import UdmurtAnalyzer
+    with open(fnameWords, 'r', encoding='utf-8') as fIn:
+        words = json.load(fIn)
+    t1 = time.time()
+    a = UdmurtAnalyzer(mode=mode, normalize=normalize, use_snapshot=use_snapshot)
+    t2 = time.time()
+    analyses = [sorted(set(ana.to_xml() for ana in anas if len(ana.lemma) > 0))
+                for anas in a.analyze_words(words)]
+    t3 = time.time()
+    with open(fnameOut, 'w', encoding='utf-8') as fOut:
+        json.dump({
+            'startup': t2 - t1,
+            'analysis': t3 - t2,
+            'rss': peak_rss(),
+            'analyses': analyses
+        }, fOut, ensure_ascii=False)
+
+
+def benchmark_normalization(modes=('nodiacritics', 'oldorth'), nWords=2000, use_snapshot=False):
+    """
+    Compare the analyzers with separate grammars for non-standard
+    orthographies with the ones that normalize the input at lookup
+    time: startup time, speed, peak memory, and the share of words
+    whose analyses coincide (all of them should). By default, the
+    grammars are loaded from the text files, since memory-mapping
+    the snapshot inflates peak RSS.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as tmpDir:
+        for mode in modes:
+            words = orthography_sample(mode, nWords=nWords)
+            fnameWords = os.path.join(tmpDir, 'words.json')
+            with open(fnameWords, 'w', encoding='utf-8') as fOut:
+                json.dump(words, fOut, ensure_ascii=False)
+            runs = {}
+            for normalize in (False, True):
+                fnameOut = os.path.join(tmpDir, mode + str(normalize) + '.json')
+                subprocess.run([sys.executable, '-c',
+                                'from benchmarks.analyzer import dump_analyses\n'
+                                'dump_analyses("{}", {}, "{}", "{}", {})'.format(mode, normalize,
+                                                                                fnameWords, fnameOut,
+                                                                                use_snapshot)],
+                               check=True)
+                with open(fnameOut, 'r', encoding='utf-8') as fIn:
+                    runs[normalize] = json.load(fIn)
+                print(mode, 'normalized' if normalize else 'separate grammar',
+                      'startup:', round(runs[normalize]['startup'], 2), 's,',
+                      'analysis:', round(len(words) / runs[normalize]['analysis']), 'words/s,',
+                      'peak RSS:', round(runs[normalize]['rss']), 'MB.')
+            nSame = sum(1 for anaGrammar, anaNormalized in zip(runs[False]['analyses'],
+                                                              runs[True]['analyses'])
+                        if anaGrammar == anaNormalized)
+            nAnalyzed = [sum(1 for anas in runs[normalize]['analyses'] if len(anas) > 0)
+                         for normalize in (False, True)]
+            print(mode, ': same analyses for', nSame, 'of', len(words), 'words;',
+                  nAnalyzed[0], 'vs.', nAnalyzed[1], 'words analyzed.')
+            results[mode] = runs
+            results[mode]['words'] = words
+    return results
+
+
+def benchmark_wordform_index(mode='strict', words=None, nWords=2000):
+    """
+    Analyze the same words with and without the word form index
+    (run pre_build.build_wordform_indexes() first) in all output
+    formats and report the speed.
+    """
+    from uniparser_udmurt import UdmurtAnalyzer
+    if words is None:
+        words = load_analyzed_sample(nWords=nWords)
+    a = UdmurtAnalyzer(mode=mode, use_index=True, cache_size=0)
+    index = a.wordformIndex
+    if index is None:
+        print('No up-to-date word form index for mode', mode)
+        return None
+    results = {}
+    for format in (None, 'xml', 'json'):
+        for useIndex in (True, False):
+            a.set_wordform_index(index if useIndex else None)
+            t1 = time.time()
+            a.analyze_words(words, format=format)
+            results[(format, useIndex)] = len(words) / (time.time() - t1)
+            print(mode, format, 'with index' if useIndex else 'parser only', ':',
+                  round(results[(format, useIndex)]), 'words/s.')
+    a.set_wordform_index(index)
+    return results
+
+
+def benchmark_stem_index(mode='strict', words=None, nWords=1000000):
+    """
+    Analyze the words with one replacement allowed, with and without
+    the stem index (run pre_build.build_stem_indexes() first), and
+    report the speed. Only the words long enough for the search with
+    replacements are used.
+    """
+    from uniparser_udmurt import UdmurtAnalyzer
+    if words is None:
+        words = load_sample(nWords=nWords)
+    a = UdmurtAnalyzer(mode=mode, cache_size=0)
+    index = a.m.stemIndex
+    if index is None:
+        print('No up-to-date stem index for mode', mode)
+        return None
+    t1 = time.time()
+    index.load()
+    print(mode, 'stem index loaded in', round(time.time() - t1, 2), 'seconds.')
+    words = [w.lower() for w in words
+             if len(w) >= a.m.MIN_REPLACEMENT_WORD_LEN and a.m.rxNoReplacements.search(w) is None]
+    results = {}
+    for useIndex in (True, False):
+        a.m.stemIndex = index if useIndex else None
+        t1 = time.time()
+        for w in words:
+            a.m.parse(w, replacementsAllowed=1)
+        results[useIndex] = len(words) / (time.time() - t1)
+        print(mode, len(words), 'words with replacements,', 'with stem index' if useIndex else 'full FST', ':',
+              round(results[useIndex], 1), 'words/s.')
+    a.m.stemIndex = index
+    return results
+
+
+def benchmark_rule_index(mode='strict', words=None, nWords=2000):
+    """
+    Analyze the words with the bad analyses and the lexical rules
+    checked through the indexes built with the grammar (see
+    uniparser_udmurt.rule_index) and one by one, as uniparser-morph
+    does, and report the speed and the time spent on the rules.
+    The words are a sample of the word list, analyzed with one
+    replacement allowed, and a sample of words the rules apply to.
+    """
+    from uniparser_udmurt import UdmurtAnalyzer
+    if words is None:
+        words = fixed_sample(nWords=nWords) + rule_sample(nWords=nWords)
+    words = [w.lower() for w in words]
+    a = UdmurtAnalyzer(mode=mode, cache_size=0)
+    a.set_metrics(stages=True)
+    indexes = a.m.badAnalysisIndex, a.m.lexRuleIndex
+    print(mode, len(indexes[0].unconditional), 'bad analysis templates,',
+          len(indexes[0].unconditional.residual), 'not indexed;',
+          len(indexes[1].tests), 'distinct lexical rule conditions,',
+          sum(1 for test in indexes[1].tests if test.prefix is None and test.substring is None),
+          'of them regexes.')
+    # The first pass loads the stem index and touches all the parts
+    # of the grammar the words need, which is not what is measured here
+    for w in words:
+        a.m.parse(w, replacementsAllowed=1)
+    results = {}
+    for useIndex in (True, False):
+        a.m.badAnalysisIndex, a.m.lexRuleIndex = indexes if useIndex else (None, None)
+        a.m.dictParses = {}
+        a.reset_metrics()
+        t1 = time.time()
+        for w in words:
+            a.m.parse(w, replacementsAllowed=1)
+        results[useIndex] = len(words) / (time.time() - t1)
+        timers = a.metrics_snapshot()['timers']
+        print(mode, 'indexed rules' if useIndex else 'linear rules', ':',
+              round(results[useIndex]), 'words/s;',
+              'bad analyses', round(timers['bad_analyses']['seconds'] * 1e6
+                                    / max(1, timers['bad_analyses']['calls']), 1), 'us,',
+              'lexical rules', round(timers['lex_rules']['seconds'] * 1e6
+                                    / max(1, timers['lex_rules']['calls']), 1), 'us per analysis.')
+    a.m.badAnalysisIndex, a.m.lexRuleIndex = indexes
+    return results
+
+
+def benchmark_cache(words, mode='strict', cache_size=10000):
+    """
+    Analyze a text (a list of tokens) with and without the analysis
+    cache and report the speed and the cache statistics.
+    """
+    from uniparser_udmurt import UdmurtAnalyzer
+    a = UdmurtAnalyzer(mode=mode, cache_size=cache_size)
+    for maxSize in (cache_size, 0):
+        a.cache.maxSize = maxSize
+        a.cache.clear()
+        t1 = time.time()
+        a.analyze_words(words)
+        print(mode, 'cache size', maxSize, ':', round(len(words) / (time.time() - t1)), 'words/s.')
+        if maxSize > 0:
+            print(a.cache_stats())
+    a.cache.maxSize = cache_size
+
+
+def benchmark_parallel(words, mode='strict', workers=(1, 2, 4)):
+    """
+    Analyze a list of words with different numbers of worker
+    processes and report the speed and the throughput of each worker.
+    """
+    from uniparser_udmurt import UdmurtAnalyzer
+    a = UdmurtAnalyzer(mode=mode, cache_size=0)
+    a.initialize_parser()
+    print(os.cpu_count(), 'CPU cores available.')
+    for nWorkers in workers:
+        t1 = time.time()
+        a.analyze_words(words, format='json', workers=nWorkers)
+        print(mode, nWorkers, 'workers:', round(len(words) / (time.time() - t1)), 'words/s.')
+        if nWorkers > 1:
+            for pid, stats in a.workerStats.items():
+                print('    worker', pid, ':', stats['tokens'], 'words,',
+                      round(stats['words_per_second']), 'words/s')
+
+
+def benchmark_disambiguation(sentences, mode='strict', cg_executable=None):
+    """
+    Disambiguate a list of sentences (lists of tokens) one by one
+    and report the number of sentences per second, with and without
+    disambiguation. Pass the path to tests/cg3_stub.py as cg_executable
+    if CG3 is not installed.
+    """
+    from uniparser_udmurt import UdmurtAnalyzer
+    a = UdmurtAnalyzer(mode=mode, cg_executable=cg_executable)
+    for disambiguate in (False, True):
+        a.cache.clear()
+        t1 = time.time()
+        for sentence in sentences:
+            a.analyze_words([sentence], format='json', disambiguate=disambiguate)
+        print(mode, 'disambiguate =', disambiguate, ':',
+              round(len(sentences) / (time.time() - t1)), 'sentences/s.')
+    a.close()
@@ -0,0 +1,28 @@
+import time
+
+
+def benchmark_build_transforms(fnames=('udm_lexemes_N.txt', 'paradigms.txt'), repeats=3):
+    """
+    Report the time pre_build.russify() and pre_build.oldorth() take
+    on the given source files, with an empty memo of spelling variants
+    (as in a fresh build) and with the memo filled by the previous run.
+    """
+    import pre_build
+    from uniparser_udmurt.orthography import variantGenerators
+    transforms = {'nodiacritics': pre_build.russify, 'oldorth': pre_build.oldorth}
+    results = {}
+    for fname in fnames:
+        with open(fname, 'r', encoding='utf-8-sig') as fIn:
+            text = fIn.read()
+        for orthography, transform in transforms.items():
+            times = {'empty memo': [], 'filled memo': []}
+            for i in range(repeats):
+                variantGenerators[orthography].clear()
+                for memo in ('empty memo', 'filled memo'):
+                    t1 = time.time()
+                    transform(text)
+                    times[memo].append(time.time() - t1)
+            results[(fname, orthography)] = {memo: min(times[memo]) for memo in times}
+            print(fname, orthography, ':', ', '.join(memo + ' ' + str(round(min(times[memo]), 3)) + ' s'
+                                                     for memo in times))
+    return results
@@ -0,0 +1,104 @@
+import json
+import os
+import re
+
+SUITE_DIR = 'benchmarks'
+TEXT_SAMPLE = os.path.join(SUITE_DIR, 'sample_text.txt')
+WORD_SAMPLE = 'wordlists/wordlist_unanalyzed.txt'
+
+
+def load_sample(fname=WORD_SAMPLE, nWords=2000):
+    """
+    Return the first nWords words of a word list.
+    """
+    words = []
+    with open(fname, 'r', encoding='utf-8-sig') as fIn:
+        for line in fIn:
+            line = line.strip()
+            if len(line) > 0:
+                words.append(line)
+            if len(words) >= nWords:
+                break
+    return words
+
+
+def load_analyzed_sample(fname='wordlists/wordlist_analyzed.txt', nWords=2000):
+    """
+    Return the first nWords words of the analyzed frequency list.
+    """
+    rxWf = re.compile('>([^<>\r\n]+)</w>')
+    words = []
+    with open(fname, 'r', encoding='utf-8-sig') as fIn:
+        for line in fIn:
+            m = rxWf.search(line)
+            if m is not None:
+                words.append(m.group(1))
+            if len(words) >= nWords:
+                break
+    return words
+
+
+def fixed_sample(fname=WORD_SAMPLE, nWords=2000):
+    """
+    Return nWords words spread evenly over the whole word list,
+    so that the sample is the same in every run as long as
+    the list does not change.
+    """
+    with open(fname, 'r', encoding='utf-8-sig') as fIn:
+        words = [line.strip() for line in fIn if len(line.strip()) > 0]
+    step = max(1, len(words) // nWords)
+    return words[::step][:nWords]
+
+
+def text_sample(fname=TEXT_SAMPLE):
+    """
+    Return the bundled text sample as a list of sentences
+    (lists of tokens), tokenized the same way as by the
+    command-line analyzer.
+    """
+    from uniparser_udmurt.__main__ import read_sentences
+    with open(fname, 'r', encoding='utf-8-sig') as fIn:
+        return list(read_sentences(fIn))
+
+
+def orthography_sample(orthography, nWords=2000):
+    """
+    Return a sample of words in a non-standard orthography: lemmata
+    from the dictionary that are spelled differently in it, rewritten
+    according to its rules, every other one with an inflection.
+    """
+    from uniparser_udmurt.orthography import variantFunctions
+    words = []
+    for fname in ('udm_lexemes_N.txt', 'udm_lexemes_V.txt', 'udm_lexemes_ADJ.txt'):
+        with open(fname, 'r', encoding='utf-8-sig') as fIn:
+            for lemma in re.findall('^ lex: *([^\r\n]+?) *$', fIn.read(), flags=re.M):
+                variants = sorted(variantFunctions[orthography](lemma) - {lemma})
+                if len(variants) <= 0:
+                    continue
+                word = variants[0]
+                if len(words) % 2 == 1 and not word.endswith('ны'):
+                    word += 'ез'
+                words.append(word)
+    step = max(1, len(words) // nWords)
+    return words[::step][:nWords]
+
+
+def rule_sample(nWords=2000):
+    """
+    Return a sample of words the lexical rules and the bad analysis
+    templates apply to: the derived words added by the lexical rules,
+    the lemmata of the dictionary and the word forms of the templates.
+    """
+    words = []
+    for fname in ('udm_lexrules_V.txt', 'udm_lexrules_N.txt'):
+        with open(fname, 'r', encoding='utf-8-sig') as fIn:
+            words += re.findall('^ +lex2: *([^\r\n]+?) *$', fIn.read(), flags=re.M)
+    for fname in ('udm_lexemes_V.txt', 'udm_lexemes_N.txt', 'udm_lexemes_ADJ.txt', 'udm_lexemes_PRO.txt'):
+        with open(fname, 'r', encoding='utf-8-sig') as fIn:
+            words += re.findall('^ lex: *([^\r\n]+?) *$', fIn.read(), flags=re.M)
+    step = max(1, len(words) // nWords)
+    words = words[::step][:nWords]
+    with open('bad_analyses.txt', 'r', encoding='utf-8-sig') as fIn:
+        words += [template['wf'] for template in json.load(fIn)
+                  if re.search('^[^\\\\.^$*+?{}\\[\\]()|]+$', template.get('wf', '')) is not None]
+    return words
@@ -0,0 +1,85 @@
+import json
+import subprocess
+import sys
+import time
+
+
+async def post_requests(port, bodies, latencies):
+    """
+    Send POST /analyze requests with the given bodies one after another
+    over one keep-alive connection and add their latencies to the list.
+    """
+    import asyncio
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        for body in bodies:
+            t1 = time.perf_counter()
+            writer.write(('POST /analyze HTTP/1.1\r\nHost: 127.0.0.1\r\n'
+                          'Content-Type: application/json\r\n'
+                          'Content-Length: ' + str(len(body)) + '\r\n\r\n').encode('latin-1') + body)
+            await writer.drain()
+            status = (await reader.readline()).decode('latin-1').split()[1]
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b''):
+                    break
+                key, _, value = line.decode('latin-1').partition(':')
+                if key.strip().lower() == 'content-length':
+                    length = int(value)
+            await reader.readexactly(length)
+            if status != '200':
+                raise RuntimeError('The server returned ' + status)
+            latencies.append(time.perf_counter() - t1)
+    finally:
+        writer.close()
+
+
+def benchmark_server(sentences, mode='strict', concurrency=32, nRequests=2000, disambiguate=False,
+                     cg_executable=None, max_wait=2.0):
+    """
+    Start the analysis server (uniparser_udmurt.server) in a separate
+    process and send it nRequests sentences (one per request) from
+    concurrency clients at once. Report the throughput, the latency
+    percentiles seen by the clients and the average batch size.
+    """
+    import asyncio
+    import urllib.request
+    cmd = [sys.executable, '-m', 'uniparser_udmurt.server', '--port', '0', '--mode', mode,
+           '--max-wait', str(max_wait)]
+    if cg_executable is not None:
+        cmd += ['--cg-executable', cg_executable]
+    proc = subprocess.Popen(cmd, stderr=subprocess.PIPE)
+    try:
+        line = proc.stderr.readline().decode('utf-8')
+        if not line.startswith('Listening on '):
+            raise RuntimeError('The server did not start: ' + line)
+        port = int(line.strip().rsplit(':', 1)[1])
+        bodies = [json.dumps({'words': [sentences[i % len(sentences)]], 'format': 'json',
+                              'disambiguate': disambiguate}, ensure_ascii=False).encode('utf-8')
+                  for i in range(nRequests)]
+        latencies = []
+
+        async def run_clients():
+            await asyncio.gather(*[post_requests(port, bodies[i::concurrency], latencies)
+                                   for i in range(concurrency)])
+
+        t1 = time.perf_counter()
+        asyncio.run(run_clients())
+        timeTotal = time.perf_counter() - t1
+        with urllib.request.urlopen('http://127.0.0.1:' + str(port) + '/stats') as response:
+            stats = json.loads(response.read().decode('utf-8'))
+    finally:
+        proc.terminate()
+        proc.wait()
+    latencies.sort()
+    nTokens = sum(len(sentences[i % len(sentences)]) for i in range(nRequests))
+    print(mode, 'server, concurrency =', concurrency, ', disambiguate =', disambiguate, ':',
+          round(nRequests / timeTotal), 'requests/s,', round(nTokens / timeTotal), 'words/s.')
+    print('    latency (ms): p50', round(latencies[len(latencies) // 2] * 1000, 2),
+          ', p95', round(latencies[int(len(latencies) * 0.95)] * 1000, 2),
+          ', p99', round(latencies[int(len(latencies) * 0.99)] * 1000, 2),
+          ', max', round(latencies[-1] * 1000, 2))
+    print('    batches:', stats['batching']['batches'], ', requests per batch:',
+          round(stats['batching']['requests_per_batch'], 1))
+    return stats
@@ -0,0 +1,172 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from uniparser_udmurt.lexicon import file_digest
+from . import MODES, run_isolated, best_time, peak_rss
+from .samples import SUITE_DIR, TEXT_SAMPLE, WORD_SAMPLE, fixed_sample, text_sample
+
+BASELINE_FILE = os.path.join(SUITE_DIR, 'baseline.json')
+RESULTS_FILE = os.path.join(SUITE_DIR, 'results.json')
+SUITE_FORMATS = (None, 'xml', 'json', 'conll', 'compact')
+
+
+def suite_mode(mode, fnameOut, nWords=2000, repeats=3, cg_executable=None):
+    """
+    Measure the startup time, the speed of analyze_words() with
+    different options, and the peak memory for one mode. Called
+    in a separate process by run_suite(), so that the startup is
+    cold and the memory of different modes is not mixed up. The
+    results are written to a JSON file.
+    """
+    import gc
+    t1 = time.time()
+    from uniparser_udmurt import UdmurtAnalyzer
+    a = UdmurtAnalyzer(mode=mode, cache_size=0, cg_executable=cg_executable)
+    a.analyze_words('яратӥсько')
+    results = {'startup_cold_seconds': time.time() - t1, 'snapshot': a.snapshotLoaded}
+    sentences = text_sample()
+    nTokens = sum(len(sentence) for sentence in sentences)
+    # The first pass touches all the parts of the grammar
+    # the text needs, which is not what is measured here
+    a.analyze_words(sentences)
+    for format in SUITE_FORMATS:
+        seconds = best_time(lambda: a.analyze_words(sentences, format=format), repeats)
+        results['tokens_per_second_' + str(format).lower()] = nTokens / seconds
+    words = fixed_sample(nWords=nWords)
+    for replacementsAllowed in (0, 1):
+        seconds = best_time(lambda: a.analyze_words(words, replacementsAllowed=replacementsAllowed), 1)
+        results['words_per_second_replacements_' + str(replacementsAllowed)] = len(words) / seconds
+
+    def disambiguate():
+        for sentence in sentences:
+            a.analyze_words([sentence], format='json', disambiguate=True)
+
+    a.disambiguator.grammar_file()
+    seconds = best_time(disambiguate, repeats)
+    results['tokens_per_second_disambiguation'] = nTokens / seconds
+    results['cg3'] = os.path.basename(a.disambiguator.executable or '')
+    results['peak_rss_mb'] = peak_rss()
+    a.close()
+    del a
+    gc.collect()
+    t1 = time.time()
+    a = UdmurtAnalyzer(mode=mode, cache_size=0, cg_executable=cg_executable)
+    a.analyze_words('яратӥсько')
+    results['startup_warm_seconds'] = time.time() - t1
+    with open(fnameOut, 'w', encoding='utf-8') as fOut:
+        json.dump(results, fOut, ensure_ascii=False, indent=1, sort_keys=True)
+
+
+def suite_meta(nWords):
+    """
+    Return the description of the environment and the samples
+    the suite was run with.
+    """
+    import platform
+    from uniparser_udmurt.snapshot import morph_version
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL).stdout.decode('utf-8').strip()
+    except OSError:
+        commit = ''
+    return {
+        'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'uniparser_morph': morph_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'word_sample': {'file': WORD_SAMPLE, 'md5': file_digest(WORD_SAMPLE), 'words': nWords},
+        'text_sample': {'file': TEXT_SAMPLE, 'md5': file_digest(TEXT_SAMPLE),
+                        'tokens': sum(len(sentence) for sentence in text_sample())}
+    }
+
+
+def run_suite(modes=MODES, nWords=2000, repeats=3, fnameOut=RESULTS_FILE,
+              cg_executable=None, prepare=True):
+    """
+    Run the whole benchmark suite: for each mode, cold and warm startup,
+    tokens per second on the bundled text sample in each output format
+    and with disambiguation, words per second on a fixed sample of
+    unanalyzed words with and without replacements, and peak memory;
+    plus the time of pre_build.prepare_files(). If CG3 is not installed,
+    tests/cg3_stub.py is used for disambiguation. The results are written to
+    a JSON file and returned.
+    """
+    from uniparser_udmurt.cg_session import find_cg3
+    if cg_executable is None:
+        cg_executable = find_cg3()
+    if cg_executable is None:
+        cg_executable = os.path.abspath('tests/cg3_stub.py')
+    results = {'meta': suite_meta(nWords), 'modes': {}}
+    with tempfile.TemporaryDirectory() as tmpDir:
+        for mode in modes:
+            fnameMode = os.path.join(tmpDir, mode + '.json')
+            subprocess.run([sys.executable, '-c',
+                            'from benchmarks.suite import suite_mode\n'
+                            'suite_mode({!r}, {!r}, {}, {}, {!r})'.format(mode, fnameMode, nWords,
+                                                                         repeats, cg_executable)],
+                           check=True)
+            with open(fnameMode, 'r', encoding='utf-8') as fIn:
+                results['modes'][mode] = json.load(fIn)
+            print(mode, json.dumps(results['modes'][mode], sort_keys=True))
+    if prepare:
+        code = 'import pre_build\npre_build.prepare_files(force={})\n'
+        results['prepare_files'] = {
+            'prepare_files_seconds': min(run_isolated(code.format(True)) for i in range(repeats)),
+            'prepare_files_noop_seconds': min(run_isolated(code.format(False)) for i in range(repeats))
+        }
+        print('prepare_files', json.dumps(results['prepare_files'], sort_keys=True))
+    if fnameOut is not None:
+        with open(fnameOut, 'w', encoding='utf-8') as fOut:
+            json.dump(results, fOut, ensure_ascii=False, indent=1, sort_keys=True)
+    return results
+
+
+def suite_metrics(results):
+    """
+    Return a flat dictionary {name: value} of the numeric results
+    of run_suite(), e.g. 'strict.tokens_per_second_xml'.
+    """
+    metrics = {}
+    for mode, modeResults in results.get('modes', {}).items():
+        for k, v in modeResults.items():
+            if type(v) in (int, float):
+                metrics[mode + '.' + k] = v
+    for k, v in results.get('prepare_files', {}).items():
+        metrics[k] = v
+    return metrics
+
+
+def compare_results(results, baseline, tolerance=0.25):
+    """
+    Compare the results of run_suite() with a baseline. Speeds
+    (*_per_second_*) that are lower than in the baseline and times and
+    memory that are higher, by more than tolerance (a share of the
+    baseline value), are reported as regressions. Return the list of
+    regressions: (metric, baseline value, new value).
+    """
+    for sample in ('word_sample', 'text_sample'):
+        if results['meta'].get(sample) != baseline['meta'].get(sample):
+            print('Warning: the', sample.replace('_', ' '), 'differs from the baseline.')
+    metrics = suite_metrics(results)
+    baselineMetrics = suite_metrics(baseline)
+    regressions = []
+    for metric in sorted(metrics):
+        if metric not in baselineMetrics or baselineMetrics[metric] <= 0:
+            continue
+        old, new = baselineMetrics[metric], metrics[metric]
+        change = (new - old) / old
+        if '_per_second' in metric:
+            regression = change < -tolerance
+        else:
+            regression = change > tolerance
+        if regression:
+            regressions.append((metric, old, new))
+        print(metric, ':', round(old, 2), '->', round(new, 2),
+              '(' + ('+' if change >= 0 else '') + str(round(change * 100, 1)) + '%)',
+              'REGRESSION' if regression else '')
+    return regressions
@@ -1,71 +1,107 @@
 import re
 import os
 import shutil
+import heapq
+import json
+import multiprocessing
+import tempfile
+import time
+from uniparser_morph.morph_parser import Parser
+from uniparser_udmurt.orthography import variantGenerators, rxParadigmChange
+from uniparser_udmurt.lexicon import file_digest, LEXICON_SHARDS, lexicon_shard, shard_file
+from uniparser_udmurt.lexicon_store import LexiconStore, LEXICON_STORE_FILE
 
-rxDiacritics = re.compile('[ӥӧӵӟӝё]')
-rxDiaPartsStem = re.compile('( stem:)( *[^\r\n]+)')
-rxDiaPartsFlex = re.compile('(-flex:)( *[^\r\n]+)')
 rxStemVariants = re.compile('[^ |/]+')
 rxFlexVariants = re.compile('[^ /]+')
-rxYer = re.compile('ъ')
-rxYo = re.compile('ё')
-rxIVowel = re.compile('и(?=[аеёиӥоӧуыэюя])')
-rxEYe = re.compile('(?<=[бвгжӟӝйкмпрфхцчӵшщ])е')
-rxYerYerj = re.compile('(?<=[бвгжӟӝйкмпрфхцчӵшщ])ъ(?=[яеёюи])')
-dictDiacritics = {
-    'ӥ': 'и',
-    'ӧ': 'о',
-    'ӝ': 'ж',
-    'ӟ': 'з',
-    'ӵ': 'ч',
-    'ё': 'е'
-}
-rxParadigmChange = re.compile('( stem: *[^\r\n]+ӟ\\.\n(?: [^\r\n]*\n)*)'
-                              '( paradigm: (?:Noun|connect_verbs)[^\r\n]+?[^C])((?:-consonant)?)\n',
-                              flags=re.DOTALL)
+rxAnalyzedLine = re.compile('^(.*>)([^<>\r\n]+)</w>')
+rxProperNameAna = re.compile(',(famn|patrn|persn)')
+rxLemmaA = re.compile('lex="[^"]*а"')
+rxShortenTransRu = re.compile('\\btrans_ru="')
+rxShortenTransRu2 = re.compile('\\btrans_ru2="')
+rxShortenTransEn = re.compile('\\btrans_en="')
+rxShortenLemma = re.compile('\\blex="')
+rxShortenParts = re.compile('\\bparts="')
+rxShortenGloss = re.compile('\\bgloss="')
+rxShortenEmpty = re.compile(' *\\b(?:ru|en)=" *"')
+rxAnaClose = re.compile('></ana>')
 
 
-def collect_lemmata(dirName):
-    lemmata = ''
-    lexrules = ''
-    for fname in os.listdir(dirName):
-        if fname.endswith('.txt') and fname.startswith('udm_lexemes_'):
-            f = open(os.path.join(dirName, fname), 'r', encoding='utf-8-sig')
-            lemmata += f.read() + '\n'
-            f.close()
-        elif fname.endswith('.txt') and fname.startswith('udm_lexrules_'):
-            f = open(os.path.join(dirName, fname), 'r', encoding='utf-8-sig')
-            lexrules += f.read() + '\n'
-            f.close()
-    lemmataSet = set(re.findall('-lexeme\n(?: [^\r\n]*\n)+', lemmata, flags=re.DOTALL))
-    lemmata = '\n'.join(sorted(list(lemmataSet)))
-    return lemmata, lexrules
+def lexeme_files(dirName):
+    return [fname for fname in os.listdir(dirName)
+            if fname.endswith('.txt') and fname.startswith('udm_lexemes_')]
 
 
-def add_diacriticless(morph):
-    """
-    Add a diacriticless variant to a stem or an inflection
-    """
-    morph = morph.group(0)
-    if rxDiacritics.search(morph) is None:
-        return morph
-    return morph + '//' + rxDiacritics.sub(lambda m: dictDiacritics[m.group(0)], morph)
+def lexrule_files(dirName):
+    return [fname for fname in os.listdir(dirName)
+            if fname.endswith('.txt') and fname.startswith('udm_lexrules_')]
 
 
-def russify_diacritics_stem(line):
+def read_lemmata(dirName, sharded=False):
     """
-    Remove diacritics from one line that contains stems.
+    Return the texts of all distinct lexemes from the lexeme files,
+    sorted. Lexemes written more than once are reported.
+    If sharded is True, return a dictionary {output file: text}
+    with the core lexicon in lexemes.txt and each of LEXICON_SHARDS
+    in its own file. The core files are read first, so a lexeme that
+    is also written in a shard file only goes to lexemes.txt.
+    The lexemes are taken from the lexicon store in dirName (see
+    uniparser_udmurt.lexicon_store.LexiconStore), which only parses
+    the files that have changed since it was last updated.
     """
-    morphCorrected = rxStemVariants.sub(add_diacriticless, line.group(2))
-    return line.group(1) + morphCorrected
+    lemmata = {}
+    shards = {}
+    duplicates = []
+    fnames = [os.path.normpath(os.path.join(dirName, fname))
+              for fname in sorted(lexeme_files(dirName), key=lambda fname: (lexicon_shard(fname) is not None, fname))]
+    with LexiconStore(os.path.join(dirName, LEXICON_STORE_FILE)) as store:
+        store.update(fnames)
+        for fname in fnames:
+            shard = lexicon_shard(fname)
+            for line, text in store.entries(fname):
+                where = os.path.basename(fname) + ', line ' + str(line)
+                if text in lemmata:
+                    duplicates.append(where + ' (see ' + lemmata[text] + ')')
+                else:
+                    lemmata[text] = where
+                    shards[text] = shard
+    if len(duplicates) > 0:
+        print(len(duplicates), 'duplicate lexemes skipped:', '; '.join(duplicates))
+    if not sharded:
+        return '\n'.join(sorted(lemmata))
+    texts = {shard_file(shard): [] for shard in [None] + list(LEXICON_SHARDS)}
+    for text in sorted(lemmata):
+        texts[shard_file(shards[text])].append(text)
+    return {output: '\n'.join(lexemes) for output, lexemes in texts.items()}
+
+
+def read_lexrules(dirName):
+    lexrules = ''
+    for fname in lexrule_files(dirName):
+        with open(os.path.join(dirName, fname), 'r', encoding='utf-8-sig') as f:
+            lexrules += f.read() + '\n'
+    return lexrules
+
+
+def collect_lemmata(dirName):
+    return read_lemmata(dirName), read_lexrules(dirName)
 
 
-def russify_diacritics_flex(line):
+def add_variants(text, orthography):
     """
-    Remove diacritics from one line that contains inflextions.
+    Add spelling variants of the given orthography to all stems
+    and inflections in a grammar file (in one pass over the text).
+    Lines without any characters the spelling rules may change
+    are skipped by the regex.
     """
-    morphCorrected = rxFlexVariants.sub(add_diacriticless, line.group(2))
-    return line.group(1) + morphCorrected
+    generator = variantGenerators[orthography]
+    rxLines = re.compile('( stem:|-flex:)( *[^\r\n]*?[' + re.escape(generator.triggers) + '][^\r\n]*)')
+
+    def add_variants_line(line):
+        if line.group(1) == ' stem:':
+            return line.group(1) + rxStemVariants.sub(generator.join_variants, line.group(2))
+        return line.group(1) + rxFlexVariants.sub(generator.join_variants, line.group(2))
+
+    return rxLines.sub(add_variants_line, text)
 
 
 def russify(text):
@@ -73,112 +109,247 @@ def russify(text):
     Add diacriticless variants for stems and inflections.
     """
     text = rxParadigmChange.sub('\\1\\2\\3\n\\2-soft\n', text)
-    text = rxDiaPartsStem.sub(russify_diacritics_stem, text)
-    text = rxDiaPartsFlex.sub(russify_diacritics_flex, text)
-    return text
+    return add_variants(text, 'nodiacritics')
 
 
-def add_oldorth(morph):
+def oldorth(text):
     """
-    Add pre-standardized spelling variants to a stem or an inflection
+    Add pre-standardized spelling variants for stems and inflections.
     """
-    morph = morph.group(0)
-    alternatives = {morph}
-    alternatives.add(rxEYe.sub("э", rxYer.sub("'", rxYerYerj.sub('ь', morph))))
-    alternatives.add(rxEYe.sub("э", rxYer.sub("'", rxYerYerj.sub('ь', morph))))
-    alternatives.add(rxEYe.sub("э", rxYer.sub("’", rxYerYerj.sub('ь', morph))))
-    alternatives.add(rxEYe.sub("э", rxYer.sub("'", morph)))
-    alternatives.add(rxEYe.sub("э", rxYer.sub("'", morph)))
-    alternatives.add(rxEYe.sub("э", rxYer.sub("’", morph)))
-    alternatives.add(rxEYe.sub("э", rxYerYerj.sub('ь', morph)))
-    alternatives.add(rxEYe.sub("э", morph))
-    alternatives.add(rxYer.sub("'", rxYerYerj.sub('ь', morph)))
-    alternatives.add(rxYer.sub("‘", rxYerYerj.sub('ь', morph)))
-    alternatives.add(rxYer.sub("’", rxYerYerj.sub('ь', morph)))
-    alternatives.add(rxYer.sub("'", morph))
-    alternatives.add(rxYer.sub("‘", morph))
-    alternatives.add(rxYer.sub("’", morph))
-    alternatives.add(rxYo.sub('е', rxYer.sub("'", morph)))
-    alternatives.add(rxYo.sub('е', rxYer.sub("‘", morph)))
-    alternatives.add(rxYo.sub('е', rxYer.sub("’", morph)))
-    alternatives.add(rxYo.sub('е', rxYer.sub("'", rxYerYerj.sub('ь', morph))))
-    alternatives.add(rxYo.sub('е', rxYer.sub("‘", rxYerYerj.sub('ь', morph))))
-    alternatives.add(rxYo.sub('е', rxYer.sub("’", rxYerYerj.sub('ь', morph))))
-    alternatives.add(rxIVowel.sub("і", morph))
-    alternatives.add(rxIVowel.sub("i", morph))
-    alternatives.add(rxYo.sub('е', rxIVowel.sub("і", morph)))
-    alternatives.add(rxYo.sub('е', rxIVowel.sub("i", morph)))
-    return '//'.join(m for m in sorted(alternatives))
+    return add_variants(text, 'oldorth')
+
+
+MODES = ('strict', 'nodiacritics', 'oldorth')
+BUILD_STATE_FILE = 'build_state.json'
+WORDLIST_OUTPUTS = ('wordlist_analyzed.txt', 'wordlist_unanalyzed.txt')
+# Modules of the analyzer the results of parse_wordlists() depend on
+WORDLIST_CODE = ('__init__.py', 'parser.py', 'rule_index.py', 'stem_index.py', 'orthography.py',
+                 'snapshot.py', 'lexicon.py', 'wordlist_update.py')
+modeTransforms = {
+    'strict': None,
+    'nodiacritics': russify,
+    'oldorth': oldorth
+}
 
 
-def oldorth_stem(line):
+def output_sources():
     """
-    Add pre-standardized spelling variants in one line that contains stems.
+    Return a dictionary {output file: list of source files it is built from}.
+    The outputs that are generated by the code in this file also depend
+    on the file itself and on the spelling rules.
     """
-    morphCorrected = rxStemVariants.sub(add_oldorth, line.group(2))
-    return line.group(1) + morphCorrected
-
-
-def oldorth_flex(line):
+    builder = [os.path.basename(__file__), 'uniparser_udmurt/orthography.py']
+    sources = {
+        'lexemes.txt': lexeme_files('.') + builder,
+        'paradigms.txt': ['paradigms.txt'] + builder,
+        'lex_rules.txt': lexrule_files('.') + builder,
+        'bad_analyses.txt': ['bad_analyses.txt'],
+        'udmurt_disambiguation.cg3': ['udmurt_disambiguation.cg3']
+    }
+    # Which shard a lexeme goes to depends on all lexeme files
+    for shard in LEXICON_SHARDS:
+        sources[shard_file(shard)] = lexeme_files('.') + builder + ['uniparser_udmurt/lexicon.py']
+    sources['lexemes.txt'].append('uniparser_udmurt/lexicon.py')
+    return sources
+
+
+def load_build_state(dirName):
+    try:
+        with open(os.path.join(dirName, BUILD_STATE_FILE), 'r', encoding='utf-8') as fIn:
+            return json.load(fIn)
+    except (IOError, ValueError):
+        return {}
+
+
+def save_build_state(dirName, state):
+    with open(os.path.join(dirName, BUILD_STATE_FILE), 'w', encoding='utf-8') as fOut:
+        json.dump(state, fOut, ensure_ascii=False, indent=1, sort_keys=True)
+
+
+def is_up_to_date(dirName, output, sourceDigests, state):
     """
-    Add pre-standardized spelling variants in one line that contains inflexions.
+    Check if an output file in dirName was built from the same sources
+    as now and has not been changed since.
     """
-    morphCorrected = rxFlexVariants.sub(add_oldorth, line.group(2))
-    return line.group(1) + morphCorrected
+    fname = os.path.join(dirName, output)
+    return (output in state
+            and state[output]['sources'] == sourceDigests
+            and os.path.exists(fname)
+            and file_digest(fname) == state[output]['output'])
 
 
-def oldorth(text):
+def build_mode(mode, outputs, texts):
     """
-    Add pre-standardized spelling variants for stems and inflections.
+    Write the outputs (a list of file names) for one mode to its data
+    directory. texts is a dictionary {output: text} with the texts of
+    lexemes.txt, the lexicon shards, paradigms.txt and lex_rules.txt
+    in the strict version.
+    Return a dictionary {output: (seconds, hash of the output file)}.
     """
-    text = rxDiaPartsStem.sub(oldorth_stem, text)
-    text = rxDiaPartsFlex.sub(oldorth_flex, text)
-    return text
-
-
-def prepare_files():
+    dirName = 'uniparser_udmurt/data_' + mode
+    transform = modeTransforms[mode]
+    results = {}
+    for output in outputs:
+        t1 = time.time()
+        fname = os.path.join(dirName, output)
+        if output in texts:
+            text = texts[output]
+            if transform is not None and output != 'lex_rules.txt':
+                text = transform(text)
+            with open(fname, 'w', encoding='utf-8') as fOut:
+                fOut.write(text)
+        else:
+            shutil.copy2(output, dirName + '/')
+        results[output] = (time.time() - t1, file_digest(fname))
+    return results
+
+
+def prepare_files(force=False, parallel=True):
     """
-    Put all the lemmata to lexemes.txt. Put all the lexical
+    Put all the lemmata to lexemes.txt, except for the groups
+    listed in LEXICON_SHARDS (proper names, imitatives), which
+    go to separate files (lexemes_names.txt etc.). Put all the lexical
     rules to lexical_rules.txt. Create separate versions of
     relevant files for diacriticless texts.
     Put all grammar files to ../uniparser_udmurt/data_strict/
     (original version), ../uniparser_udmurt/data_nodiacritics/
     (diacriticless version) and ../uniparser_udmurt/data_oldorth/
     (version for pre-standardized orthographies).
+    Only the files whose sources have changed since the last build
+    are regenerated, unless force is True. The modes are processed
+    in parallel if parallel is True.
+    """
+    tStart = time.time()
+    sources = output_sources()
+    digests = {}
+    for fnames in sources.values():
+        for fname in fnames:
+            if fname not in digests:
+                digests[fname] = file_digest(fname)
+    sourceDigests = {output: {fname: digests[fname] for fname in fnames}
+                     for output, fnames in sources.items()}
+    states = {}
+    jobs = []
+    for mode in MODES:
+        dirName = 'uniparser_udmurt/data_' + mode
+        states[mode] = load_build_state(dirName)
+        outputs = [output for output in sources
+                   if force or not is_up_to_date(dirName, output, sourceDigests[output], states[mode])]
+        if len(outputs) > 0:
+            jobs.append((mode, outputs))
+    print('Checking sources:', round(time.time() - tStart, 2), 's')
+    if len(jobs) <= 0:
+        print('All grammar files are up to date.')
+        return
+
+    t1 = time.time()
+    texts = {}
+    neededOutputs = set(output for mode, outputs in jobs for output in outputs)
+    lexemeOutputs = [shard_file(shard) for shard in [None] + list(LEXICON_SHARDS)]
+    if any(output in neededOutputs for output in lexemeOutputs):
+        texts.update(read_lemmata('.', sharded=True))
+    if 'lex_rules.txt' in neededOutputs:
+        texts['lex_rules.txt'] = read_lexrules('.')
+    if 'paradigms.txt' in neededOutputs:
+        with open('paradigms.txt', 'r', encoding='utf-8-sig') as fInParadigms:
+            texts['paradigms.txt'] = fInParadigms.read()
+    print('Reading sources:', round(time.time() - t1, 2), 's')
+
+    t1 = time.time()
+    jobArgs = [(mode, outputs, {output: texts[output] for output in outputs if output in texts})
+               for mode, outputs in jobs]
+    if parallel and len(jobs) > 1:
+        with multiprocessing.Pool(len(jobs)) as pool:
+            results = pool.starmap(build_mode, jobArgs)
+    else:
+        results = [build_mode(*args) for args in jobArgs]
+    for (mode, outputs), modeResults in zip(jobs, results):
+        for output in outputs:
+            seconds, outputDigest = modeResults[output]
+            states[mode][output] = {'sources': sourceDigests[output], 'output': outputDigest}
+            print(mode + '/' + output + ':', round(seconds, 2), 's')
+        save_build_state('uniparser_udmurt/data_' + mode, states[mode])
+    print('Writing files:', round(time.time() - t1, 2), 's')
+    print('Total:', round(time.time() - tStart, 2), 's')
+
+
+def build_snapshots():
+    """
+    Write precompiled snapshots of the fully initialized grammar
+    to each of the data directories: one with the core lexicon only
+    (grammar_core.pickle) and one with all lexicon shards
+    (grammar.pickle). The analyzer loads them instead of the text
+    files as long as they are up to date. The parser in the snapshots
+    has the bad analyses and the lexical rules compiled into indexes
+    (see uniparser_udmurt.rule_index).
     """
-    lemmata, lexrules = collect_lemmata('.')
-    with open('uniparser_udmurt/data_strict/lexemes.txt', 'w', encoding='utf-8') as fOutLemmata:
-        fOutLemmata.write(lemmata)
-    with open('uniparser_udmurt/data_nodiacritics/lexemes.txt', 'w', encoding='utf-8') as fOutLemmataRus:
-        fOutLemmataRus.write(russify(lemmata))
-    with open('uniparser_udmurt/data_oldorth/lexemes.txt', 'w', encoding='utf-8') as fOutLemmataOld:
-        fOutLemmataOld.write(oldorth(lemmata))
-
-    with open('paradigms.txt', 'r', encoding='utf-8-sig') as fInParadigms:
-        paradigms = fInParadigms.read()
-    with open('uniparser_udmurt/data_strict/paradigms.txt', 'w', encoding='utf-8') as fOutParadigms:
-        fOutParadigms.write(paradigms)
-    with open('uniparser_udmurt/data_nodiacritics/paradigms.txt', 'w', encoding='utf-8') as fOutParadigmsRus:
-        fOutParadigmsRus.write(russify(paradigms))
-    with open('uniparser_udmurt/data_oldorth/paradigms.txt', 'w', encoding='utf-8') as fOutParadigmsOld:
-        fOutParadigmsOld.write(oldorth(paradigms))
-
-    with open('uniparser_udmurt/data_strict/lex_rules.txt', 'w', encoding='utf-8') as fOutLexrules:
-        fOutLexrules.write(lexrules)
-    with open('uniparser_udmurt/data_nodiacritics/lex_rules.txt', 'w', encoding='utf-8') as fOutLexrules:
-        fOutLexrules.write(lexrules)
-    with open('uniparser_udmurt/data_oldorth/lex_rules.txt', 'w', encoding='utf-8') as fOutLexrules:
-        fOutLexrules.write(lexrules)
-
-    shutil.copy2('bad_analyses.txt', 'uniparser_udmurt/data_strict/')
-    shutil.copy2('bad_analyses.txt', 'uniparser_udmurt/data_nodiacritics/')
-    shutil.copy2('bad_analyses.txt', 'uniparser_udmurt/data_oldorth/')
-    shutil.copy2('udmurt_disambiguation.cg3', 'uniparser_udmurt/data_strict/')
-    shutil.copy2('udmurt_disambiguation.cg3', 'uniparser_udmurt/data_nodiacritics/')
-    shutil.copy2('udmurt_disambiguation.cg3', 'uniparser_udmurt/data_oldorth/')
-
-
-def process_unanalyzed(a, replacementsAllowed=0):
+    from uniparser_udmurt import UdmurtAnalyzer
+    from uniparser_udmurt.snapshot import save_snapshot
+    for mode in ('strict', 'nodiacritics', 'oldorth'):
+        a = UdmurtAnalyzer(mode=mode, use_snapshot=False, lexicons=[])
+        save_snapshot(a, 'uniparser_udmurt/data_' + mode)
+        for shard in LEXICON_SHARDS:
+            a.load_lexicon(shard)
+        save_snapshot(a, 'uniparser_udmurt/data_' + mode)
+        print('Snapshots for mode', mode, 'written.')
+
+
+def build_stem_indexes():
+    """
+    Write an index of the stems to each of the data directories.
+    The analyzer uses it to find the stems quickly when replacements
+    are allowed.
+    """
+    from uniparser_udmurt import UdmurtAnalyzer
+    from uniparser_udmurt.stem_index import write_stem_index
+    for mode in ('strict', 'nodiacritics', 'oldorth'):
+        a = UdmurtAnalyzer(mode=mode, use_stem_index=False)
+        n = write_stem_index(a)
+        print('Stem index for mode', mode, 'written,', n, 'stems.')
+
+
+def build_wordform_indexes(fnameAnalyzed='wordlists/wordlist_analyzed.txt'):
+    """
+    Write an index of precomputed analyses of the words from the analyzed
+    frequency list to each of the data directories. Analyzers created
+    with use_index=True look words up there first.
+    """
+    from uniparser_udmurt import UdmurtAnalyzer
+    from uniparser_udmurt.wordform_index import write_wordform_index
+    rxWf = re.compile('>([^<>\r\n]+)</w>')
+    words = []
+    with open(fnameAnalyzed, 'r', encoding='utf-8-sig') as fIn:
+        for line in fIn:
+            m = rxWf.search(line)
+            if m is not None:
+                words.append(m.group(1))
+    for mode in ('strict', 'nodiacritics', 'oldorth'):
+        a = UdmurtAnalyzer(mode=mode)
+        n = write_wordform_index(a, words)
+        print('Word form index for mode', mode, 'written,', n, 'words.')
+
+
+def match_analyzed_line(line, replacementsAllowed=0):
+    """
+    Return the match of rxAnalyzedLine (the analyses and the word) for
+    a line of the analyzed word list written by a lax model, or None
+    if its analyses are not accepted.
+    """
+    m = rxAnalyzedLine.search(line)
+    if m is None:
+        return None
+    if replacementsAllowed > 0 and rxProperNameAna.search(m.group(1)) is not None:
+        # Replacements in proper nouns usually lead to wrongly correcting
+        # proper names that are not in the dictionary
+        return None
+    if (replacementsAllowed > 0 and (m.group(2).endswith(('и', 'ы'))
+                                     and rxLemmaA.search(m.group(1)) is not None)):
+        # политики recognized as политика (actually words like this come from code switching)
+        return None
+    return m
+
+
+def process_unanalyzed(a, replacementsAllowed=0, workers=1, dirName='wordlists'):
     """
     Try analyzing the unanalyzed words with another, lax model.
     Add the results to the list of analyzed words.
@@ -187,100 +358,355 @@ def process_unanalyzed(a, replacementsAllowed=0):
     """
     unanalyzedDia = []
     freqDict = {}
-    with open('wordlists/wordlist_unanalyzed.txt', 'r', encoding='utf-8') as fIn:
+    with open(os.path.join(dirName, 'wordlist_unanalyzed.txt'), 'r', encoding='utf-8') as fIn:
         for word in fIn:
             word = word.strip()
             unanalyzedDia.append(word)
-    with open('wordlists/wordlist.csv', 'r', encoding='utf-8') as fIn:
+    with open(os.path.join(dirName, 'wordlist.csv'), 'r', encoding='utf-8') as fIn:
         for line in fIn:
             word, freq = line.strip().split('\t')
             freqDict[word] = freq
-    with open('wordlists/wordlist_nodia.csv', 'w', encoding='utf-8') as fOut:
+    with open(os.path.join(dirName, 'wordlist_nodia.csv'), 'w', encoding='utf-8') as fOut:
         for word in unanalyzedDia:
             fOut.write(word + '\t' + freqDict[word] + '\n')
-    a.analyze_wordlist(freqListFile='wordlists/wordlist_nodia.csv',
-                       parsedFile='wordlists/wordlist_analyzed_nodia.txt',
-                       unparsedFile='wordlists/wordlist_unanalyzed_nodia.txt',
+    a.analyze_wordlist(freqListFile=os.path.join(dirName, 'wordlist_nodia.csv'),
+                       parsedFile=os.path.join(dirName, 'wordlist_analyzed_nodia.txt'),
+                       unparsedFile=os.path.join(dirName, 'wordlist_unanalyzed_nodia.txt'),
                        verbose=True,
-                       replacementsAllowed=replacementsAllowed)
+                       replacementsAllowed=replacementsAllowed,
+                       workers=workers)
     analyzedDia = set()
-    with open('wordlists/wordlist_analyzed_nodia.txt', 'r', encoding='utf-8') as fIn:
+    with open(os.path.join(dirName, 'wordlist_analyzed_nodia.txt'), 'r', encoding='utf-8') as fIn:
         lines = '\n'
         for line in fIn:
-            m = re.search('^(.*>)([^<>\r\n]+)</w>', line)
+            m = match_analyzed_line(line, replacementsAllowed=replacementsAllowed)
             if m is None:
                 continue
-            if replacementsAllowed > 0 and re.search(',(famn|patrn|persn)', m.group(1)) is not None:
-                # Replacements in proper nouns usually lead to wrongly correcting
-                # proper names that are not in the dictionary
-                continue
-            if (replacementsAllowed > 0 and (m.group(2).endswith(('и', 'ы'))
-                                             and re.search('lex="[^"]*а"', m.group(1)) is not None)):
-                # политики recognized as политика (actually words like this come from code switching)
-                continue
             word = m.group(2)
             analyzedDia.add(word)
             lines += m.group(1) + word + '</w>\n'
-    with open('wordlists/wordlist_analyzed.txt', 'a', encoding='utf-8') as fOut:
+    with open(os.path.join(dirName, 'wordlist_analyzed.txt'), 'a', encoding='utf-8') as fOut:
         fOut.write(lines)
     lines = []
-    with open('wordlists/wordlist_unanalyzed.txt', 'r', encoding='utf-8') as fIn:
+    with open(os.path.join(dirName, 'wordlist_unanalyzed.txt'), 'r', encoding='utf-8') as fIn:
         for line in fIn:
             line = line.strip()
             if line not in analyzedDia:
                 lines.append(line)
-    with open('wordlists/wordlist_unanalyzed.txt', 'w', encoding='utf-8') as fOut:
+    with open(os.path.join(dirName, 'wordlist_unanalyzed.txt'), 'w', encoding='utf-8') as fOut:
         fOut.write('\n'.join(lines))
 
 
-def shorten_analyzed():
+def shorten_line(line):
+    """
+    Shorten the attribute names in a line of the analyzed word list.
+    """
+    line = rxShortenLemma.sub('l="', line)
+    line = rxShortenTransRu.sub('ru="', line)
+    line = rxShortenTransRu2.sub('ru2="', line)
+    line = rxShortenTransEn.sub('en="', line)
+    line = rxShortenParts.sub('mb="', line)
+    line = rxShortenGloss.sub('gl="', line)
+    line = rxShortenEmpty.sub('', line)
+    return rxAnaClose.sub('/>', line)
+
+
+def shorten_analyzed(fname='wordlists/wordlist_analyzed.txt'):
     """
     The analyzed word list is too long, so we'll shorten the attribute names.
+    The list is converted line by line into a temporary file, which then
+    replaces it, so it never has to be loaded into memory.
     """
-    rxTransRu = re.compile('\\btrans_ru="')
-    rxTransRu2 = re.compile('\\btrans_ru2="')
-    rxTransEn = re.compile('\\btrans_en="')
-    rxLemma = re.compile('\\blex="')
-    rxParts = re.compile('\\bparts="')
-    rxGloss = re.compile('\\bgloss="')
-    rxEmpty = re.compile(' *\\b(?:ru|en)=" *"')
-    rxAnaClose = re.compile('></ana>')
-    with open('wordlists/wordlist_analyzed.txt', 'r', encoding='utf-8-sig') as fIn:
-        text = fIn.read()
-        text = rxLemma.sub('l="', text)
-        text = rxTransRu.sub('ru="', text)
-        text = rxTransRu2.sub('ru2="', text)
-        text = rxTransEn.sub('en="', text)
-        text = rxParts.sub('mb="', text)
-        text = rxGloss.sub('gl="', text)
-        text = rxEmpty.sub('', text)
-        text = rxAnaClose.sub('/>', text)
-    with open('wordlists/wordlist_analyzed.txt', 'w', encoding='utf-8') as fOut:
-        fOut.write(text)
+    with open(fname, 'r', encoding='utf-8-sig') as fIn, \
+            open(fname + '.tmp', 'w', encoding='utf-8') as fOut:
+        for line in fIn:
+            fOut.write(shorten_line(line))
+    os.replace(fname + '.tmp', fname)
 
 
-def parse_wordlists():
+def wordlist_analyzers():
     """
-    Analyze wordlists/wordlist.csv.
+    Return the strict and the diacritic-insensitive analyzers
+    used for the word lists.
     """
     from uniparser_udmurt import UdmurtAnalyzer
-    a = UdmurtAnalyzer(mode='strict')
-    aNodia = UdmurtAnalyzer(mode='nodiacritics')
-    a.analyze_wordlist(freqListFile='wordlists/wordlist.csv',
-                       parsedFile='wordlists/wordlist_analyzed.txt',
-                       unparsedFile='wordlists/wordlist_unanalyzed.txt',
+    return UdmurtAnalyzer(mode='strict'), UdmurtAnalyzer(mode='nodiacritics')
+
+
+def wordlist_sources():
+    """
+    Return the hashes of the code the word lists are analyzed with.
+    If it changes, incremental updates are not possible.
+    """
+    fnames = [os.path.basename(__file__)] + ['uniparser_udmurt/' + fname for fname in WORDLIST_CODE]
+    return {fname: file_digest(fname) for fname in fnames}
+
+
+def parse_wordlists(workers=None, dirName='wordlists', incremental=False):
+    """
+    Analyze wordlist.csv in dirName (by default, wordlists/wordlist.csv).
+    By default, use as many processes as there are CPU cores.
+    If incremental is True and the word lists have been analyzed
+    before, only analyze the words affected by the changes in
+    the lexicon and the rules since then (see update_wordlists()).
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    from uniparser_udmurt.wordlist_update import grammar_states, save_wordlist_state
+    grammars = grammar_states()
+    if incremental and update_wordlists(dirName=dirName, grammars=grammars):
+        return
+    a, aNodia = wordlist_analyzers()
+    a.analyze_wordlist(freqListFile=os.path.join(dirName, 'wordlist.csv'),
+                       parsedFile=os.path.join(dirName, 'wordlist_analyzed.txt'),
+                       unparsedFile=os.path.join(dirName, 'wordlist_unanalyzed.txt'),
                        verbose=True,
-                       replacementsAllowed=0)
+                       replacementsAllowed=0,
+                       workers=workers)
     print('Processing words that potentially have no diacritics...')
-    process_unanalyzed(aNodia)
+    process_unanalyzed(aNodia, workers=workers, dirName=dirName)
     print('Processing words with one replacement allowed...')
-    process_unanalyzed(a, replacementsAllowed=1)
-    shorten_analyzed()
+    process_unanalyzed(a, replacementsAllowed=1, workers=workers, dirName=dirName)
+    shorten_analyzed(os.path.join(dirName, 'wordlist_analyzed.txt'))
+    save_wordlist_state(dirName, grammars, wordlist_sources(), WORDLIST_OUTPUTS)
+
+
+def analyze_wordlist_word(a, aNodia, token):
+    """
+    Analyze one word of the frequency list in the same way as
+    parse_wordlists() does. Return the stage it gets its analyses at
+    (1: strict model, 2: diacritic-insensitive model, 3: strict model
+    with one replacement) and its (shortened) line in the analyzed
+    word list, or (None, None) if it stays unanalyzed.
+    """
+    for stage, analyzer, replacementsAllowed in ((1, a, 0), (2, aNodia, 0), (3, a, 1)):
+        analyses = analyzer.m.parse(token, replacementsAllowed=replacementsAllowed)
+        if len(analyses) <= 0:
+            continue
+        line = Parser.ana2xml(token, analyses, glossing=analyzer.glossing)
+        if stage > 1:
+            m = match_analyzed_line(line, replacementsAllowed=replacementsAllowed)
+            if m is None:
+                return None, None
+        return stage, shorten_line(line)
+    return None, None
+
+
+def read_frequency_list(fname):
+    """
+    Return the list of (word, frequency) pairs from the frequency list,
+    or None if it has words the incremental update cannot handle:
+    repeated words or words with angle brackets.
+    """
+    wordlist = []
+    with open(fname, 'r', encoding='utf-8-sig') as fIn:
+        for line in fIn:
+            if len(line) <= 2:
+                continue
+            try:
+                word, freq = line.split('\t')
+                wordlist.append((word.strip(), int(freq.strip())))
+            except ValueError:
+                return None
+    words = set(word for word, freq in wordlist)
+    if len(words) < len(wordlist) or any(len(word) <= 0 or '<' in word or '>' in word for word in words):
+        return None
+    return wordlist
+
+
+def read_wordlist_results(dirName):
+    """
+    Return a dictionary {word: (stage, line)} for all words in the
+    analyzed and unanalyzed word lists (see analyze_wordlist_word()),
+    or None if the lists do not have the layout parse_wordlists() writes.
+    """
+    results = {}
+    with open(os.path.join(dirName, 'wordlist_analyzed.txt'), 'r', encoding='utf-8') as fIn:
+        stage = 1
+        for line in fIn:
+            line = line.rstrip('\n')
+            if len(line) <= 0:
+                # Stages are separated by empty lines
+                stage += 1
+                continue
+            m = rxAnalyzedLine.search(line)
+            if stage > 3 or m is None or m.group(2) in results:
+                return None
+            results[m.group(2)] = (stage, line)
+    if stage != 3:
+        return None
+    with open(os.path.join(dirName, 'wordlist_unanalyzed.txt'), 'r', encoding='utf-8') as fIn:
+        text = fIn.read()
+    for word in text.split('\n') if len(text) > 0 else []:
+        if word in results:
+            return None
+        results[word] = (None, None)
+    return results
+
+
+def patch_wordlist_file(fname, freqs, replaced, newLines, separated=False):
+    """
+    Remove the lines of the words in replaced and of the words that are
+    not in the frequency list (freqs) any more from a word list written
+    by parse_wordlists() and add newLines, a list of (word, line) pairs
+    for each stage. The other lines are kept as they are. In the analyzed
+    list (separated is True), stages are separated by empty lines, the
+    unanalyzed list has one stage. The lines of each stage are kept in
+    the order of the frequency list. Return True if the file has changed.
+    """
+    def sort_key(word):
+        return -freqs[word], word
+
+    with open(fname, 'r', encoding='utf-8') as fIn:
+        text = fIn.read()
+    if separated:
+        stages = [[]]
+        for line in text.split('\n')[:-1]:
+            if len(line) <= 0:
+                stages.append([])
+            else:
+                stages[-1].append(line)
+    else:
+        stages = [text.split('\n') if len(text) > 0 else []]
+    changed = False
+    for iStage, lines in enumerate(stages):
+        words = [rxAnalyzedLine.search(line).group(2) for line in lines] if separated else lines
+        kept = [(sort_key(word), line) for word, line in zip(words, lines)
+                if word in freqs and word not in replaced]
+        if (len(kept) == len(lines) and len(newLines[iStage]) <= 0
+                and all(kept[i][0] < kept[i + 1][0] for i in range(len(kept) - 1))):
+            continue
+        changed = True
+        # The frequencies of the words kept may have changed too
+        kept.sort(key=lambda x: x[0])
+        added = sorted((sort_key(word), line) for word, line in newLines[iStage])
+        stages[iStage] = [line for key, line in heapq.merge(kept, added, key=lambda x: x[0])]
+    if not changed:
+        return False
+    with open(fname + '.tmp', 'w', encoding='utf-8') as fOut:
+        if separated:
+            fOut.write('\n'.join(''.join(line + '\n' for line in lines) for lines in stages))
+        else:
+            fOut.write('\n'.join(stages[0]))
+    os.replace(fname + '.tmp', fname)
+    return True
+
+
+def patch_wordlist_results(dirName, freqs, results):
+    """
+    Replace the lines of the words in results ({word: (stage, line)},
+    see analyze_wordlist_word()) in the analyzed and unanalyzed word
+    lists and remove the words that are not in the frequency list
+    (freqs) any more. Return the names of the files that have changed.
+    """
+    analyzed = [[], [], []]
+    unanalyzed = [[]]
+    for word, (stage, line) in results.items():
+        if stage is None:
+            unanalyzed[0].append((word, word))
+        else:
+            analyzed[stage - 1].append((word, line))
+    changed = []
+    for fname, newLines, separated in (('wordlist_analyzed.txt', analyzed, True),
+                                       ('wordlist_unanalyzed.txt', unanalyzed, False)):
+        if patch_wordlist_file(os.path.join(dirName, fname), freqs, results, newLines, separated=separated):
+            changed.append(fname)
+    return changed
+
+
+def update_wordlists(dirName='wordlists', analyzers=None, grammars=None):
+    """
+    Update the analyzed word lists in dirName after the lexicon, the
+    lexical rules or the bad analysis templates have changed: compare
+    the grammars with their state saved by the last run, analyze
+    again the words the differences may affect, and the words that
+    have been added to the frequency list, and replace their lines
+    in the lists if their analyses have changed.
+    The intermediate files of the diacritic-insensitive stage are
+    not updated. Return False if the lists have to be rebuilt from
+    scratch instead: there is no saved state, other grammar files
+    or the code have changed, or the lists were edited since.
+    """
+    from uniparser_udmurt.wordlist_update import (WordlistChanges, load_wordlist_state,
+                                                  save_wordlist_state, grammar_states)
+    t1 = time.time()
+    state = load_wordlist_state(dirName)
+    if state is None or state['sources'] != wordlist_sources():
+        print('The word lists have to be analyzed from scratch.')
+        return False
+    for fname in WORDLIST_OUTPUTS:
+        fname = os.path.join(dirName, fname)
+        if not os.path.exists(fname) or file_digest(fname) != state['outputs'][os.path.basename(fname)]:
+            print(fname, 'has changed since it was written, the word lists have to be analyzed from scratch.')
+            return False
+    wordlist = read_frequency_list(os.path.join(dirName, 'wordlist.csv'))
+    results = read_wordlist_results(dirName)
+    if wordlist is None or results is None:
+        print('The word lists cannot be updated incrementally.')
+        return False
+    if grammars is None:
+        grammars = grammar_states()
+    changes = WordlistChanges(state['grammars'], grammars)
+    if changes.rebuild:
+        print('Grammar files other than the lexicon and the rules have changed, '
+              'the word lists have to be analyzed from scratch.')
+        return False
+    freqs = dict(wordlist)
+    affected = changes.affected_words(results) if changes else set()
+    affected = (affected & set(freqs)) | (set(freqs) - set(results))
+    print('Changes since the last run:', changes.nLexemes, 'lexemes,', changes.nLexRules, 'lexical rules,',
+          changes.nBadAnalyses, 'bad analysis templates;', len(affected), 'words to analyze.')
+    newResults = {}
+    if len(affected) > 0:
+        if analyzers is None:
+            analyzers = wordlist_analyzers()
+        a, aNodia = analyzers
+        for word in affected:
+            result = analyze_wordlist_word(a, aNodia, word)
+            if result != results.get(word):
+                newResults[word] = result
+    changed = patch_wordlist_results(dirName, freqs, newResults)
+    save_wordlist_state(dirName, grammars, wordlist_sources(), WORDLIST_OUTPUTS)
+    print('Word lists updated (' + str(len(newResults)) + ' words changed, files rewritten: '
+          + (', '.join(changed) or 'none') + '):', round(time.time() - t1, 2), 's')
+    return True
+
+
+def check_wordlists(dirName='wordlists', workers=None):
+    """
+    Analyze the frequency list from scratch in a temporary directory
+    and compare the results with the word lists in dirName, e.g.
+    after update_wordlists(). Return True if they are identical.
+    """
+    tmpDir = tempfile.mkdtemp(prefix='wordlists_')
+    try:
+        shutil.copy2(os.path.join(dirName, 'wordlist.csv'), tmpDir)
+        parse_wordlists(workers=workers, dirName=tmpDir)
+        identical = True
+        for fname in WORDLIST_OUTPUTS:
+            with open(os.path.join(dirName, fname), 'r', encoding='utf-8') as fIn:
+                text = fIn.read()
+            with open(os.path.join(tmpDir, fname), 'r', encoding='utf-8') as fIn:
+                textRebuilt = fIn.read()
+            if text != textRebuilt:
+                identical = False
+                lines, linesRebuilt = text.split('\n'), textRebuilt.split('\n')
+                nDiff = sum(1 for line, lineRebuilt in zip(lines, linesRebuilt) if line != lineRebuilt)
+                print(fname, 'differs from the rebuilt version:', nDiff, 'lines differ,',
+                      len(lines), 'lines instead of', len(linesRebuilt))
+    finally:
+        shutil.rmtree(tmpDir)
+    if identical:
+        print('The word lists are identical to a full rebuild.')
+    return identical
 
 
 if __name__ == '__main__':
     prepare_files()
+    build_snapshots()
+    build_stem_indexes()
     parse_wordlists()
+    build_wordform_indexes()
     # from uniparser_udmurt import UdmurtAnalyzer
     # a = UdmurtAnalyzer(mode='strict')
     # for wf in a.analyze_words(['йӧнатскыны', 'лудтӥ', 'тӥялтоно', 'кизьыкуз', 'иськавынлэсь'], format='xml'):
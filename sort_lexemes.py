@@ -1,95 +1,62 @@
 import re
 import os
+from uniparser_udmurt.lexicon import Lexeme, iter_lexemes
+from uniparser_udmurt.lexicon_store import LexiconStore
 
-rxLexeme = re.compile('(-lexeme\n lex: ([^\r\n]+)\n(?: [^\r\n]*\n)*?'
-                      ' gramm: ([^\r\n,]+)[^\r\n]*\n(?: [^\r\n]*\n)*)', flags=re.DOTALL)
+rxUncertainPos = re.compile('(gramm: *[A-Z]+)\\?')
 
 
 def split_fields(lex):
-    lemma = ''
-    pos = ''
-    grdic = ''
-    stem = ''
-    paradigm = ''
-    trans_ru = ''
-    trans_en = ''
-    lemma = ' / '.join(re.findall(' lex: *([^\r\n]*?) *\n', lex, flags=re.DOTALL))
-    m = re.search(' gramm: *([^\r\n, ]*)', lex, flags=re.DOTALL)
-    if m is not None:
-        pos = m.group(1)
-    m = re.search(' gramm: *[^\r\n, ]*,([^\r\n]*?) *\n', lex, flags=re.DOTALL)
-    if m is not None:
-        grdic = m.group(1)
-    m = re.search(' stem: *([^\r\n]*)', lex, flags=re.DOTALL)
-    if m is not None:
-        stem = m.group(1).strip()
-    paradigm = ' / '.join(re.findall(' paradigm: *([^\r\n]*?) *\n', lex, flags=re.DOTALL))
-    trans_ru = ' / '.join(re.findall(' trans_ru: *([^\r\n]*?) *\n', lex, flags=re.DOTALL))
-    trans_en = ' / '.join(re.findall(' trans_en: *([^\r\n]*?) *\n', lex, flags=re.DOTALL))
-    return lemma, pos, grdic, stem, paradigm, trans_ru, trans_en
+    return tuple(Lexeme('', 0, lex).table_row())
 
 
-def load_tabulate_lexemes(fnameDict):
+def load_tabulate_lexemes(fnameDict, store=None):
+    """
+    Read the lexemes from a lexeme file (or from the lexicon store,
+    if one is given) and return the set of their texts and a table
+    with their fields.
+    """
+    if store is None:
+        lexemes = iter_lexemes(fnameDict)
+    else:
+        store.update([fnameDict])
+        lexemes = store.lexemes(fnames=[fnameDict])
     curDict = {}
+    nFound = 0
+    for lexeme in lexemes:
+        if not lexeme.text.startswith('-lexeme\n lex:') or ' gramm:' not in lexeme.text:
+            continue
+        nFound += 1
+        text = rxUncertainPos.sub('\\1', lexeme.text)
+        if text != lexeme.text:
+            lexeme = Lexeme(lexeme.fname, lexeme.line, text)
+        row = lexeme.table_row()
+        key = (row[0], row[1])
+        if key not in curDict:
+            curDict[key] = []
+        curDict[key].append(lexeme)
+    print(nFound, 'lexemes found.')
     table = []
-    usedLexemes = set()
-    with open(fnameDict, 'r', encoding='utf-8') as fIn:
-        text = fIn.read()
-        lexemesFound = rxLexeme.findall(text)
-        print(len(lexemesFound), 'lexemes found.')
-        for lexeme, lemma, pos in lexemesFound:
-            lexeme = re.sub('(gramm: *[A-Z]+)\\?', '\\1', lexeme)
-            if lexeme in usedLexemes:
-                print('Duplicate', lexeme)
-                continue    # remove complete duplicates
-            if (lemma, pos) not in curDict:
-                curDict[(lemma, pos)] = []
-            curDict[(lemma, pos)].append(lexeme)
     lexNew = set()
-    for lemma, pos in curDict:
-        for lexeme in curDict[(lemma, pos)]:
-            lemma, pos, grdic, stem, paradigm, trans_ru, trans_en = split_fields(lexeme)
-            if lexeme in lexNew:
-                print('Duplicate', lexeme)
+    for key in curDict:
+        for lexeme in curDict[key]:
+            if lexeme.text in lexNew:
+                print('Duplicate in line', lexeme.line, lexeme.text)
             else:
-                table.append([lemma, pos, grdic, stem, paradigm, trans_ru, trans_en, ''])
-                lexNew.add(lexeme)
+                table.append(lexeme.table_row() + [''])
+                lexNew.add(lexeme.text)
     return lexNew, table
 
 
 def yaml2csv(fnameYaml, fnameCsv):
-    lex, table = load_tabulate_lexemes(fnameYaml)
-    wfFreqs = {}
-    lemmaFreqs = {}
-    rxLemma = re.compile('\\bl(?:ex)?="([^\r\n"<>]+)"')
-    rxWf = re.compile('>([^\r\n<>]+)</w>')
-    with open('wordlists/wordlist.csv', 'r', encoding='utf-8-sig') as fWordlist:
-        for line in fWordlist:
-            if '\t' not in line:
-                continue
-            wf, freq = line.strip('\r\n').split('\t')
-            wfFreqs[wf] = int(freq)
-    with open('wordlists/wordlist_analyzed.txt', 'r', encoding='utf-8-sig') as fAnalyzed:
-        for line in fAnalyzed:
-            mWf = rxWf.search(line)
-            if mWf is None:
-                continue
-            wf = mWf.group(1)
-            if wf not in wfFreqs:
-                print(wf, 'not in frequency list')
-                continue
-            freq = wfFreqs[wf]
-            for lemma in rxLemma.findall(line):
-                if lemma not in lemmaFreqs:
-                    lemmaFreqs[lemma] = freq
-                else:
-                    lemmaFreqs[lemma] += freq
+    with LexiconStore() as store:
+        lex, table = load_tabulate_lexemes(fnameYaml, store)
+        nMissing = store.update_frequencies()
+        if nMissing is not None and nMissing > 0:
+            print(nMissing, 'analyzed words not in frequency list')
+        lemmaFreqs = store.lemma_freqs()
     for i in range(len(table)):
-        lemma = table[i][0]
-        if lemma not in lemmaFreqs:
-            table[i].append(0)
-        else:
-            table[i].append(lemmaFreqs[lemma])
+        table[i].append(lemmaFreqs.get(table[i][0], 0))
     with open('add_lex/cur-lexemes.txt', 'w', encoding='utf-8') as fOut:
         fOut.write('\n'.join(l for l in sorted(lex)))
     # Sort by POS, then by frequency, then by lemma
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+A stand-in for the vislcg3 executable for machines where CG3 is not
+installed. It understands the options used by uniparser_udmurt.CGSession
+and the <STREAMCMD:FLUSH> command, but applies no rules: each cohort
+is output with all its readings.
+Usage: UNIPARSER_UDMURT_CG3=/path/to/cg3_stub.py python your_script.py
+A cohort "<CG3_STUB_CRASH>" makes the stub exit, which can be used
+to check that the session is restarted. --version prints the value
+of the CG3_STUB_VERSION environment variable.
+"""
+import os
+import shutil
+import sys
+
+
+def main(args):
+    grammar = None
+    binGrammar = None
+    grammarOnly = False
+    i = 0
+    while i < len(args):
+        if args[i] in ('-g', '--grammar'):
+            grammar = args[i + 1]
+            i += 1
+        elif args[i] == '--grammar-bin':
+            binGrammar = args[i + 1]
+            i += 1
+        elif args[i] == '--grammar-only':
+            grammarOnly = True
+        elif args[i] == '--version':
+            print('VISL CG-3 Disambiguator version ' + os.environ.get('CG3_STUB_VERSION', 'stub'))
+            return 0
+        i += 1
+    if grammar is None:
+        sys.stderr.write('No grammar specified.\n')
+        return 1
+    if grammarOnly:
+        if binGrammar is not None:
+            shutil.copyfile(grammar, binGrammar)
+        return 0
+    stdin = open(sys.stdin.fileno(), 'r', encoding='utf-8', newline='\n')
+    stdout = open(sys.stdout.fileno(), 'w', encoding='utf-8', newline='\n')
+    for line in stdin:
+        if line.startswith('"<CG3_STUB_CRASH>"'):
+            return 1
+        stdout.write(line)
+        if line.rstrip('\r\n') == '<STREAMCMD:FLUSH>':
+            stdout.flush()
+    stdout.flush()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
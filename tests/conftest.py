@@ -0,0 +1,66 @@
+import json
+import os
+import re
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The frequency list, or the list of its unanalyzed words if only
+# that one is available
+WORDLISTS = (os.path.join(ROOT, 'wordlists', 'wordlist.csv'),
+             os.path.join(ROOT, 'wordlists', 'wordlist_unanalyzed.txt'))
+MODES = ('strict', 'nodiacritics', 'oldorth')
+# pre_build.py is not part of the package
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def analyses_key(analyses):
+    """
+    Return a representation of the analyses of one word (Wordform
+    objects) that does not depend on their order.
+    """
+    return sorted(ana.to_xml() for ana in analyses)
+
+
+@pytest.fixture(scope='session')
+def wordlist_sample():
+    """
+    Return a function that returns nWords words spread evenly over
+    the word list, so that the sample is the same in every run.
+    """
+    fnames = [fname for fname in WORDLISTS if os.path.exists(fname)]
+    if len(fnames) <= 0:
+        pytest.skip('No word list in wordlists/')
+    with open(fnames[0], 'r', encoding='utf-8-sig') as fIn:
+        words = [line.strip('\r\n').split('\t')[0] for line in fIn if len(line.strip()) > 0]
+
+    def sample(nWords=2000):
+        step = max(1, len(words) // nWords)
+        return words[::step][:nWords]
+    return sample
+
+
+@pytest.fixture(scope='session')
+def rule_sample():
+    """
+    Return a function that returns words the lexical rules and the bad
+    analysis templates apply to: the derived words added by the lexical
+    rules, a sample of nWords lemmata of the dictionary and the word
+    forms of the templates.
+    """
+    def sample(nWords=2000):
+        words = []
+        for fname in ('udm_lexrules_V.txt', 'udm_lexrules_N.txt'):
+            with open(os.path.join(ROOT, fname), 'r', encoding='utf-8-sig') as fIn:
+                words += re.findall('^ +lex2: *([^\r\n]+?) *$', fIn.read(), flags=re.M)
+        lemmata = []
+        for fname in ('udm_lexemes_V.txt', 'udm_lexemes_N.txt', 'udm_lexemes_ADJ.txt', 'udm_lexemes_PRO.txt'):
+            with open(os.path.join(ROOT, fname), 'r', encoding='utf-8-sig') as fIn:
+                lemmata += re.findall('^ lex: *([^\r\n]+?) *$', fIn.read(), flags=re.M)
+        words += lemmata[::max(1, len(lemmata) // nWords)][:nWords]
+        with open(os.path.join(ROOT, 'bad_analyses.txt'), 'r', encoding='utf-8-sig') as fIn:
+            words += [template['wf'] for template in json.load(fIn)
+                      if re.search('^[^\\\\.^$*+?{}\\[\\]()|]+$', template.get('wf', '')) is not None]
+        return words
+    return sample
@@ -0,0 +1,72 @@
+import json
+import pytest
+from uniparser_udmurt import UdmurtAnalyzer
+
+WORDS = ['Мон', 'тонэ', 'яратӥсько', 'Иван', 'Пиналъёс', 'гуртын', 'шудо', 'пуксьыны', 'тяп-тяп', 'Ольгаен']
+
+
+@pytest.fixture(scope='module')
+def analyzer():
+    a = UdmurtAnalyzer(cache_size=0)
+    yield a
+    a.close()
+
+
+def json_key(analyses):
+    return [sorted(json.dumps(ana, ensure_ascii=False, sort_keys=True) for ana in wordAnalyses)
+            for wordAnalyses in analyses]
+
+
+def test_parser_only(analyzer):
+    assert analyzer.analyze_token == analyzer.parse_token
+    assert analyzer.word_records == analyzer.lowercase_records
+
+
+def test_cache(analyzer):
+    expected = json_key(analyzer.analyze_words(WORDS, format='json'))
+    a = UdmurtAnalyzer()
+    try:
+        assert a.analyze_token == a.lookup_token
+        for i in range(2):
+            assert json_key(a.analyze_words(WORDS, format='json')) == expected
+        assert a.cache_stats()['hits'] == len(WORDS)
+    finally:
+        a.close()
+
+
+def test_auto_lexicons(analyzer):
+    expected = json_key(analyzer.analyze_words(WORDS, format='json'))
+    a = UdmurtAnalyzer(lexicons='auto', cache_size=0)
+    try:
+        assert a.lexicons == set()
+        assert a.word_records == a.shards.word_records
+        # A word analyzed with the core lexicon is looked up once
+        lookups = []
+        lookup = a.lookup_records
+        a.lookup_records = lambda word, replacementsAllowed=0: lookups.append(word) or lookup(word, replacementsAllowed)
+        a.analyze_words(['пиналъёсын'])
+        assert lookups == ['пиналъёсын']
+        a.build_pipeline()
+        assert json_key(a.analyze_words(WORDS, format='json')) == expected
+        assert a.lexicons == {'names', 'imit'}
+        # Nothing is left to load, so the words are not checked any more
+        assert a.word_records == a.lowercase_records
+        assert a.analyze_token == a.parse_token
+    finally:
+        a.close()
+
+
+def test_stage_metrics(analyzer):
+    expected = json_key(analyzer.analyze_words(WORDS, format='json'))
+    assert analyzer.m.metrics is None
+    analyzer.reset_metrics()
+    analyzer.set_metrics(stages=True, locked=True)
+    try:
+        assert json_key(analyzer.analyze_words(WORDS, format='json')) == expected
+        snapshot = analyzer.metrics_snapshot()
+        assert snapshot['counters']['tokens'] == len(WORDS)
+        assert snapshot['timers']['lex_rules']['calls'] > 0
+    finally:
+        analyzer.set_metrics()
+    assert analyzer.m.metrics is None
+    assert analyzer.metrics_snapshot()['counters']['tokens'] == len(WORDS)
@@ -0,0 +1,84 @@
+import os
+import re
+import pytest
+import pre_build
+from uniparser_udmurt.orthography import variantGenerators
+from conftest import ROOT
+
+SOURCE_FILES = ('udm_lexemes_N.txt', 'udm_lexemes_V.txt', 'udm_lexemes_IMIT.txt', 'paradigms.txt')
+
+
+def legacy_transforms():
+    """
+    Return the functions that generated the nodiacritics and oldorth
+    versions of the grammar files before the variant generator
+    (uniparser_udmurt.orthography.VariantGenerator) was introduced,
+    one regex substitution at a time. pre_build.russify() and
+    pre_build.oldorth() must give the same output.
+    """
+    rxDiacritics = re.compile('[ӥӧӵӟӝё]')
+    rxDiaPartsStem = re.compile('( stem:)( *[^\r\n]+)')
+    rxDiaPartsFlex = re.compile('(-flex:)( *[^\r\n]+)')
+    rxStemVariants = re.compile('[^ |/]+')
+    rxFlexVariants = re.compile('[^ /]+')
+    rxYer = re.compile('ъ')
+    rxYo = re.compile('ё')
+    rxIVowel = re.compile('и(?=[аеёиӥоӧуыэюя])')
+    rxEYe = re.compile('(?<=[бвгжӟӝйкмпрфхцчӵшщ])е')
+    rxYerYerj = re.compile('(?<=[бвгжӟӝйкмпрфхцчӵшщ])ъ(?=[яеёюи])')
+    dictDiacritics = {'ӥ': 'и', 'ӧ': 'о', 'ӝ': 'ж', 'ӟ': 'з', 'ӵ': 'ч', 'ё': 'е'}
+    rxParadigmChange = re.compile('( stem: *[^\r\n]+ӟ\\.\n(?: [^\r\n]*\n)*)'
+                                  '( paradigm: (?:Noun|connect_verbs)[^\r\n]+?[^C])((?:-consonant)?)\n',
+                                  flags=re.DOTALL)
+
+    def add_diacriticless(morph):
+        morph = morph.group(0)
+        if rxDiacritics.search(morph) is None:
+            return morph
+        return morph + '//' + rxDiacritics.sub(lambda m: dictDiacritics[m.group(0)], morph)
+
+    def add_oldorth(morph):
+        morph = morph.group(0)
+        alternatives = {morph}
+        for yer in ("'", "’"):
+            alternatives.add(rxEYe.sub("э", rxYer.sub(yer, rxYerYerj.sub('ь', morph))))
+            alternatives.add(rxEYe.sub("э", rxYer.sub(yer, morph)))
+        alternatives.add(rxEYe.sub("э", rxYerYerj.sub('ь', morph)))
+        alternatives.add(rxEYe.sub("э", morph))
+        for yer in ("'", "‘", "’"):
+            alternatives.add(rxYer.sub(yer, rxYerYerj.sub('ь', morph)))
+            alternatives.add(rxYer.sub(yer, morph))
+            alternatives.add(rxYo.sub('е', rxYer.sub(yer, morph)))
+            alternatives.add(rxYo.sub('е', rxYer.sub(yer, rxYerYerj.sub('ь', morph))))
+        alternatives.add(rxIVowel.sub("і", morph))
+        alternatives.add(rxIVowel.sub("i", morph))
+        alternatives.add(rxYo.sub('е', rxIVowel.sub("і", morph)))
+        alternatives.add(rxYo.sub('е', rxIVowel.sub("i", morph)))
+        return '//'.join(m for m in sorted(alternatives))
+
+    def transform(text, add_variants):
+        text = rxDiaPartsStem.sub(lambda line: line.group(1) + rxStemVariants.sub(add_variants, line.group(2)), text)
+        text = rxDiaPartsFlex.sub(lambda line: line.group(1) + rxFlexVariants.sub(add_variants, line.group(2)), text)
+        return text
+
+    def russify(text):
+        text = rxParadigmChange.sub('\\1\\2\\3\n\\2-soft\n', text)
+        return transform(text, add_diacriticless)
+
+    def oldorth(text):
+        return transform(text, add_oldorth)
+
+    return {'nodiacritics': russify, 'oldorth': oldorth}
+
+
+@pytest.mark.parametrize('orthography', ('nodiacritics', 'oldorth'))
+@pytest.mark.parametrize('fname', SOURCE_FILES)
+def test_same_output(fname, orthography):
+    with open(os.path.join(ROOT, fname), 'r', encoding='utf-8-sig') as fIn:
+        text = fIn.read()
+    expected = legacy_transforms()[orthography](text)
+    transform = {'nodiacritics': pre_build.russify, 'oldorth': pre_build.oldorth}[orthography]
+    variantGenerators[orthography].clear()
+    assert transform(text) == expected
+    # The second run takes the variants from the memo
+    assert transform(text) == expected
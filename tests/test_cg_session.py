@@ -0,0 +1,97 @@
+import os
+import pytest
+from uniparser_udmurt import UdmurtAnalyzer
+from uniparser_udmurt.cg_session import CGSession, default_cache_dir
+
+CG3_STUB = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cg3_stub.py')
+DATA_PACKAGE = 'uniparser_udmurt.data_strict'
+
+
+def cohorts(words):
+    return ''.join('"<' + word + '>"\n\t"' + word + '" <ana_0> N\n' for word in words)
+
+
+@pytest.fixture
+def session(tmp_path):
+    with CGSession(None, DATA_PACKAGE, executable=CG3_STUB, cacheDir=str(tmp_path / 'cache')) as session:
+        yield session
+
+
+def test_default_cache_dir(monkeypatch, tmp_path):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+    if os.name != 'nt':
+        assert default_cache_dir() == str(tmp_path / 'uniparser_udmurt')
+
+
+def test_grammar_cache(monkeypatch, tmp_path, session):
+    fname = session.grammar_file()
+    assert os.path.dirname(fname) == str(tmp_path / 'cache')
+    assert fname.endswith('.cg3b')
+    if os.name != 'nt':
+        assert os.stat(session.cacheDir).st_mode & 0o777 == 0o700
+    sameVersion = CGSession(None, DATA_PACKAGE, executable=CG3_STUB, cacheDir=session.cacheDir)
+    assert sameVersion.grammar_file() == fname
+    monkeypatch.setenv('CG3_STUB_VERSION', 'other')
+    otherVersion = CGSession(None, DATA_PACKAGE, executable=CG3_STUB, cacheDir=session.cacheDir)
+    assert otherVersion.grammar_file().endswith('.cg3b')
+    assert otherVersion.grammar_file() != fname
+
+
+def test_flush_framing(session):
+    texts = [cohorts(['мон']), cohorts(['тон', 'со']), cohorts(['ми', 'тӥ', 'соос'])]
+    for text in texts * 2:
+        assert session.disambiguate_cg(text) == text
+    pid = session.proc.pid
+    # Larger than the pipe buffers in both directions
+    text = cohorts('гурт' + str(i) for i in range(50000))
+    assert session.disambiguate_cg(text) == text
+    assert session.disambiguate_cg(texts[0]) == texts[0]
+    assert session.proc.pid == pid
+    assert session.restarts == 0
+
+
+def test_restart_after_kill(session):
+    text = cohorts(['мон', 'тон'])
+    assert session.disambiguate_cg(text) == text
+    pid = session.proc.pid
+    session.proc.kill()
+    session.proc.wait()
+    assert session.disambiguate_cg(text) == text
+    assert session.proc.pid != pid
+    assert session.restarts == 1
+
+
+def test_restart_after_crash(session):
+    text = cohorts(['мон', 'тон'])
+    crash = cohorts(['мон', 'CG3_STUB_CRASH', 'тон'])
+    # The process is restarted once within the call; when it crashes
+    # again, the analyses are returned as they are
+    assert session.disambiguate_cg(crash) == crash
+    assert session.restarts == 2
+    assert session.disambiguate_cg(text) == text
+    assert session.restarts == 2
+
+
+def test_no_executable(tmp_path, monkeypatch):
+    monkeypatch.delenv('UNIPARSER_UDMURT_CG3', raising=False)
+    monkeypatch.setenv('PATH', '')
+    session = CGSession(None, DATA_PACKAGE, executable=None, cacheDir=str(tmp_path))
+    assert session.executable is None
+    text = cohorts(['мон'])
+    assert session.disambiguate_cg(text) == text
+    assert session.grammar_file() == ''
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_disambiguate_analyses(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+    sentences = [['Мон', 'гуртэ', 'мынӥсько', '.'], ['Пиналъёс', 'шудо']]
+    a = UdmurtAnalyzer(cg_executable=CG3_STUB)
+    try:
+        expected = a.analyze_words(sentences, format='json')
+        for i in range(2):
+            assert a.analyze_words(sentences, format='json', disambiguate=True) == expected
+        assert a.disambiguator.proc is not None
+        assert a.disambiguator.restarts == 0
+    finally:
+        a.close()
@@ -0,0 +1,83 @@
+import json
+import pytest
+from uniparser_udmurt import UdmurtAnalyzer
+from uniparser_morph.morph_fst import MorphFST, MorphFSTState
+from uniparser_udmurt.stem_index import StemIndex, deletions, fst_states
+from uniparser_udmurt.wordform_index import WordformIndex, write_wordform_index
+from conftest import analyses_key
+
+
+@pytest.fixture(scope='module')
+def analyzer():
+    a = UdmurtAnalyzer(cache_size=0)
+    yield a
+    a.close()
+
+
+def format_key(analyses, format):
+    if format is None:
+        return analyses_key(analyses)
+    if format == 'json':
+        return sorted(json.dumps(ana, ensure_ascii=False, sort_keys=True) for ana in analyses)
+    return analyses
+
+
+def test_wordform_index(analyzer, wordlist_sample, tmp_path):
+    words = wordlist_sample(nWords=500)
+    fname = str(tmp_path / 'wordforms.idx')
+    assert write_wordform_index(analyzer, words, fname=fname) == len(set(w.lower() for w in words))
+    index = WordformIndex(fname)
+    try:
+        for format in (None, 'xml', 'json'):
+            analyzer.set_wordform_index(None)
+            expected = [format_key(analyses, format) for analyses in analyzer.analyze_words(words, format=format)]
+            analyzer.set_wordform_index(index)
+            # Words not in the index are analyzed by the parser
+            analyses = analyzer.analyze_words(words + ['пиналъёсын'], format=format)
+            assert [format_key(wordAnalyses, format) for wordAnalyses in analyses[:-1]] == expected
+            assert len(analyses[-1]) > 0
+    finally:
+        analyzer.set_wordform_index(None)
+        index.close()
+
+
+def test_stem_index(analyzer, wordlist_sample):
+    index = analyzer.m.stemIndex
+    if index is None:
+        pytest.skip('No up-to-date stem index, run pre_build.build_stem_indexes()')
+    words = [w.lower() for w in wordlist_sample(nWords=2000)
+             if len(w) >= analyzer.m.MIN_REPLACEMENT_WORD_LEN
+             and analyzer.m.rxNoReplacements.search(w) is None][:200]
+    results = {}
+    try:
+        for useIndex in (True, False):
+            analyzer.m.stemIndex = index if useIndex else None
+            results[useIndex] = [analyses_key(analyzer.m.parse(w, replacementsAllowed=1)) for w in words]
+    finally:
+        analyzer.m.stemIndex = index
+    assert sum(1 for analyses in results[False] if len(analyses) > 0) > 0
+    different = [w for w, anaIndex, anaFst in zip(words, results[True], results[False]) if anaIndex != anaFst]
+    assert different == []
+
+
+def test_nondeterministic_stem_fst(analyzer):
+    # Two branches for the same first letter, the stem sits
+    # in the one added last
+    stemFst = MorphFST(analyzer.g)
+    stemFst.add_string('ax', 'stem1')
+    state = MorphFSTState()
+    stemFst.add_transition(stemFst.startState, 'a', state)
+    stemFst.add_transition(state, 'b', MorphFSTState(obj='stem2'))
+    assert len(stemFst.transitions[(stemFst.startState, 'a')]) == 2
+    assert [s.obj for s in fst_states(stemFst, 'ab')] == [['stem2']]
+    assert fst_states(stemFst, 'ac') == []
+    index = StemIndex.__new__(StemIndex)
+    index.maxDistance = 1
+    index.maxKeyLen = 2
+    index.charTable = {}
+    index.paths = ['ab']
+    index.anchored = {key: (0,) for key in deletions('ab')}
+    index.unanchored = {}
+    index.alwaysPaths = []
+    fst = index.candidate_fst(stemFst, 'abc')
+    assert [s.obj for s in fst_states(fst, 'ab')] == [['stem2']]
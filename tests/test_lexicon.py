@@ -0,0 +1,90 @@
+import sqlite3
+import pytest
+import pre_build
+from uniparser_udmurt.lexicon import iter_lexemes
+from uniparser_udmurt.lexicon_store import LexiconStore, LEXICON_STORE_VERSION
+
+LEXEMES = """-lexeme
+ lex: пинал
+ stem: пинал.
+ gramm: N
+ paradigm: Noun-num
+ trans_ru: ребёнок
+
+-lexeme
+ lex: гурт
+ stem: гурт.
+ gramm: N
+ paradigm: Noun-num
+ trans_ru: деревня
+
+-lexeme
+ lex: пинал
+ stem: пинал.
+ gramm: N
+ paradigm: Noun-num
+ trans_ru: ребёнок
+"""
+
+
+@pytest.fixture
+def lexeme_file(tmp_path):
+    fname = tmp_path / 'udm_lexemes_N.txt'
+    fname.write_text(LEXEMES, encoding='utf-8')
+    return str(fname)
+
+
+def test_iter_lexemes(lexeme_file):
+    lexemes = list(iter_lexemes(lexeme_file))
+    assert [lexeme.line for lexeme in lexemes] == [1, 8, 15]
+    assert lexemes[0].text == lexemes[2].text
+
+
+def test_store(tmp_path, lexeme_file):
+    fnameStore = str(tmp_path / 'lexicon.sqlite')
+    with LexiconStore(fnameStore) as store:
+        assert store.update([lexeme_file]) == [lexeme_file]
+        assert [lexeme.line for lexeme in store.lexemes(lemma='пинал')] == [1, 15]
+        assert store.duplicates() == [[(lexeme_file, 1), (lexeme_file, 15)]]
+    with LexiconStore(fnameStore) as store:
+        assert store.update([lexeme_file]) == []
+        assert len(store.lexemes()) == 3
+
+
+def test_outdated_store_is_recreated(tmp_path, lexeme_file):
+    fnameStore = str(tmp_path / 'lexicon.sqlite')
+    with LexiconStore(fnameStore) as store:
+        store.update([lexeme_file])
+        with store.db:
+            store.db.execute("UPDATE meta SET value = ? WHERE key = 'version'", (str(LEXICON_STORE_VERSION + 1),))
+            store.db.execute('PRAGMA user_version = ' + str(LEXICON_STORE_VERSION + 1))
+    with LexiconStore(fnameStore) as store:
+        assert len(store.lexemes()) == 0
+
+
+def test_foreign_files_are_kept(tmp_path):
+    fnameDb = str(tmp_path / 'other.sqlite')
+    db = sqlite3.connect(fnameDb)
+    with db:
+        db.execute('CREATE TABLE notes (text TEXT)')
+        db.execute("INSERT INTO notes VALUES ('keep me')")
+    db.close()
+    fnameText = tmp_path / 'other.txt'
+    fnameText.write_text('not a database\n' * 100, encoding='utf-8')
+    for fname in (fnameDb, str(fnameText)):
+        with pytest.raises(ValueError):
+            LexiconStore(fname)
+    db = sqlite3.connect(fnameDb)
+    assert db.execute('SELECT text FROM notes').fetchall() == [('keep me',)]
+    db.close()
+    assert fnameText.read_text(encoding='utf-8') == 'not a database\n' * 100
+
+
+def test_read_lemmata(tmp_path, lexeme_file, capsys):
+    (tmp_path / 'udm_lexemes_N_persn.txt').write_text(LEXEMES.replace('пинал', 'Иван'), encoding='utf-8')
+    texts = pre_build.read_lemmata(str(tmp_path), sharded=True)
+    assert [text.count('-lexeme') for text in (texts['lexemes.txt'], texts['lexemes_names.txt'])] == [2, 1]
+    assert '3 duplicate lexemes skipped' in capsys.readouterr().out
+    with LexiconStore(str(tmp_path / 'lexicon.sqlite')) as store:
+        assert store.update([str(tmp_path / 'udm_lexemes_N.txt')]) == []
+    assert pre_build.read_lemmata(str(tmp_path), sharded=True) == texts
@@ -0,0 +1,46 @@
+import pytest
+from uniparser_udmurt import UdmurtAnalyzer
+from uniparser_udmurt.orthography import variantGenerators
+from conftest import analyses_key
+
+
+@pytest.fixture(scope='module', params=('nodiacritics', 'oldorth'))
+def analyzers(request):
+    """
+    The analyzer with the grammar of the orthography and the one
+    that normalizes the spelling with the strict grammar.
+    """
+    a = UdmurtAnalyzer(mode=request.param, cache_size=0)
+    aNormalized = UdmurtAnalyzer(mode=request.param, normalize=True, cache_size=0)
+    yield a, aNormalized
+    a.close()
+    aNormalized.close()
+
+
+def different_words(analyzers, words, replacementsAllowed=0):
+    a, aNormalized = analyzers
+    return [word for word in words
+            if analyses_key(a.m.parse(word, replacementsAllowed=replacementsAllowed))
+            != analyses_key(aNormalized.m.parse(word, replacementsAllowed=replacementsAllowed))]
+
+
+def test_same_analyses(analyzers, wordlist_sample):
+    words = [word.lower() for word in wordlist_sample(nWords=2000)]
+    assert different_words(analyzers, words) == []
+
+
+def test_same_analyses_respelled(analyzers, wordlist_sample):
+    # Each word as a whole in up to two other spellings, most
+    # of which are not possible in the orthography
+    generator = variantGenerators[analyzers[0].mode]
+    words = [variant for word in wordlist_sample(nWords=2000)
+             for variant in generator.variants(word.lower())[1:3]]
+    assert len(words) > 100
+    assert different_words(analyzers, words) == []
+
+
+def test_same_analyses_replacements(analyzers, wordlist_sample):
+    m = analyzers[0].m
+    words = [word.lower() for word in wordlist_sample(nWords=5000)
+             if len(word) >= m.MIN_REPLACEMENT_WORD_LEN and m.rxNoReplacements.search(word) is None][:100]
+    assert different_words(analyzers, words, replacementsAllowed=1) == []
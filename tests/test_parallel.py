@@ -0,0 +1,66 @@
+import gc
+import json
+import pytest
+from uniparser_udmurt import UdmurtAnalyzer
+from uniparser_udmurt import parallel
+
+
+@pytest.fixture(scope='module')
+def analyzer():
+    if not parallel.fork_available():
+        pytest.skip('Processes cannot be forked')
+    a = UdmurtAnalyzer(cache_size=0)
+    yield a
+    a.close()
+
+
+def json_key(analyses):
+    return [sorted(json.dumps(ana, ensure_ascii=False, sort_keys=True) for ana in wordAnalyses)
+            for wordAnalyses in analyses]
+
+
+def test_same_output(analyzer, wordlist_sample):
+    words = wordlist_sample(nWords=500)
+    expected = json_key(analyzer.analyze_words(words, format='json'))
+    for workers in (2, 3):
+        assert json_key(analyzer.analyze_words(words, format='json', workers=workers)) == expected
+        assert sum(stats['tokens'] for stats in analyzer.workerStats.values()) == len(words)
+
+
+def test_worker_pool(analyzer, wordlist_sample):
+    words = wordlist_sample(nWords=300)
+    expected = analyzer.analyze_words(words, format='compact')
+    analyzer.start_workers(2)
+    try:
+        for i in range(2):
+            assert analyzer.analyze_words(words, format='compact', workers=2) == expected
+    finally:
+        analyzer.stop_workers()
+    assert analyzer.workerPool is None
+
+
+def test_state_per_pool(analyzer):
+    pool = parallel.WorkerPool(analyzer, 2)
+    pool.start()
+    try:
+        assert parallel._analyzer is None
+        assert gc.get_freeze_count() > 0
+    finally:
+        pool.close()
+    assert gc.get_freeze_count() == 0
+
+
+def test_no_fork_while_threads_run(analyzer, wordlist_sample):
+    words = wordlist_sample(nWords=100)
+    expected = analyzer.analyze_words(words, format='compact')
+    analyzer.start_profiler()
+    try:
+        assert not parallel.fork_safe()
+        analyzer.workerStats = {}
+        assert analyzer.analyze_words(words, format='compact', workers=2) == expected
+        assert analyzer.workerStats == {}
+        with pytest.raises(RuntimeError):
+            parallel.WorkerPool(analyzer, 2).start()
+    finally:
+        analyzer.stop_profiler()
+    assert parallel.fork_safe()
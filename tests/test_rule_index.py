@@ -0,0 +1,49 @@
+import pytest
+from uniparser_udmurt import UdmurtAnalyzer
+from conftest import MODES, analyses_key
+
+
+@pytest.fixture(scope='module', params=MODES)
+def analyzer(request):
+    a = UdmurtAnalyzer(mode=request.param, cache_size=0)
+    yield a
+    a.close()
+
+
+def parse_words(a, words, replacementsAllowed, useIndex):
+    """
+    Parse the words with the bad analyses and the lexical rules checked
+    through the indexes or one by one, as uniparser-morph does.
+    """
+    indexes = a.m.badAnalysisIndex, a.m.lexRuleIndex
+    if not useIndex:
+        a.m.badAnalysisIndex, a.m.lexRuleIndex = None, None
+    a.m.dictParses = {}
+    try:
+        return [analyses_key(a.m.parse(word.lower(), replacementsAllowed=replacementsAllowed))
+                for word in words]
+    finally:
+        a.m.badAnalysisIndex, a.m.lexRuleIndex = indexes
+        a.m.dictParses = {}
+
+
+def assert_same_analyses(a, words, replacementsAllowed):
+    indexed = parse_words(a, words, replacementsAllowed, True)
+    linear = parse_words(a, words, replacementsAllowed, False)
+    assert sum(1 for analyses in linear if len(analyses) > 0) > 0
+    different = [word for word, anaIndexed, anaLinear in zip(words, indexed, linear)
+                 if anaIndexed != anaLinear]
+    assert different == []
+
+
+def test_indexes_built(analyzer):
+    assert analyzer.m.badAnalysisIndex is not None
+    assert analyzer.m.lexRuleIndex is not None
+
+
+def test_rule_words(analyzer, rule_sample):
+    assert_same_analyses(analyzer, rule_sample(nWords=1000), 0)
+
+
+def test_wordlist(analyzer, wordlist_sample):
+    assert_same_analyses(analyzer, wordlist_sample(nWords=1000), 1)
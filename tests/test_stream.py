@@ -0,0 +1,69 @@
+import io
+import json
+import pytest
+from uniparser_udmurt import UdmurtAnalyzer
+from uniparser_udmurt.__main__ import analyze_stream
+from uniparser_udmurt.compact import CompactWriter, CompactReader, InternTable
+from uniparser_udmurt import parallel
+
+TEXT = ('Мон тонэ яратӥсько. Пиналъёс гуртын шудо!\n'
+        'Ижкарын туннэ зор вае. Анай но апай бакчае мынӥзы.\n') * 20
+
+
+@pytest.fixture(scope='module')
+def analyzer():
+    a = UdmurtAnalyzer()
+    yield a
+    a.close()
+
+
+def test_compact_blocks(analyzer):
+    sentences = [['Мон', 'тонэ', 'яратӥсько', '.'], ['Пиналъёс', 'гуртын', 'шудо', '!'], ['Ижкарын', 'зор']] * 10
+    fOut = io.BytesIO()
+    writer = CompactWriter(fOut, maxBlockEntries=20)
+    interned = InternTable()
+    for sentence in sentences:
+        if writer.block_full():
+            interned.clear()
+        records = [analyzer.lookup_records(wf.lower()) for wf in sentence]
+        writer.write_sentence(sentence, [tuple(interned.analysis(r) for r in wordRecords)
+                                         for wordRecords in records])
+    writer.close()
+    assert writer.nBlocks > 1
+    assert len(writer.stringIds) + len(writer.analysisIds) < 20 + 100
+    fOut.seek(0)
+    readSentences = list(CompactReader(fOut, blockSize=64).sentences())
+    assert [[wf for wf, analyses in sentence] for sentence in readSentences] == sentences
+    for sentence, readSentence in zip(sentences, readSentences):
+        for wf, (readWf, analyses) in zip(sentence, readSentence):
+            assert tuple(ana.record() for ana in analyses) == analyzer.lookup_records(wf.lower())
+
+
+def stream_output(a, outputFormat, workers):
+    fOut = io.BytesIO() if outputFormat == 'compact' else io.StringIO()
+    stats = analyze_stream(a, io.StringIO(TEXT), fOut, outputFormat=outputFormat,
+                           batchSize=30, workers=workers)
+    return fOut.getvalue(), stats
+
+
+def test_stream_workers(analyzer, monkeypatch):
+    if not parallel.fork_available():
+        pytest.skip('Processes cannot be forked')
+    starts = []
+    start = parallel.WorkerPool.start
+    monkeypatch.setattr(parallel.WorkerPool, 'start', lambda pool: starts.append(1) or start(pool))
+    expected, expectedStats = stream_output(analyzer, 'jsonl', 1)
+    output, stats = stream_output(analyzer, 'jsonl', 2)
+    assert output == expected
+    assert stats['analyzed'] == expectedStats['analyzed']
+    assert stats['sentences'] > 10
+    assert len(starts) == 1
+    assert analyzer.workerPool is None
+    for line in output.splitlines():
+        json.loads(line)
+
+
+def test_stream_compact(analyzer):
+    output, stats = stream_output(analyzer, 'compact', 1)
+    tokens = [wf for sentence in CompactReader(io.BytesIO(output)).sentences() for wf, analyses in sentence]
+    assert len(tokens) == stats['tokens']
@@ -0,0 +1,93 @@
+import json
+import os
+import re
+import pytest
+import pre_build
+from uniparser_udmurt.wordlist_update import WORDLIST_STATE_FILE, load_wordlist_state
+from uniparser_udmurt.lexicon import file_digest
+
+
+@pytest.fixture(scope='module')
+def analyzers():
+    a, aNodia = pre_build.wordlist_analyzers()
+    yield a, aNodia
+    a.close()
+    aNodia.close()
+
+
+def write_frequency_list(dirName, words):
+    # Groups of three words with the same frequency
+    with open(os.path.join(dirName, 'wordlist.csv'), 'w', encoding='utf-8') as fOut:
+        for i, word in enumerate(words):
+            fOut.write(word + '\t' + str(len(words) - i // 3) + '\n')
+
+
+def read_text(dirName, fname):
+    with open(os.path.join(dirName, fname), 'r', encoding='utf-8') as fIn:
+        return fIn.read()
+
+
+def edit_state(dirName, lemma=None, outputs=False):
+    """
+    Remove the lexemes with the lemma from the saved state of the strict
+    grammar, so that they look like new lexemes, and make the state
+    accept the lists as they are now.
+    """
+    state = load_wordlist_state(dirName)
+    lexemes = state['grammars']['strict']['lexemes']
+    for lexemeId in [lexemeId for lexemeId, entry in lexemes.items() if lemma in entry[0]]:
+        del lexemes[lexemeId]
+    if outputs:
+        for fname in pre_build.WORDLIST_OUTPUTS:
+            state['outputs'][fname] = file_digest(os.path.join(dirName, fname))
+    with open(os.path.join(dirName, WORDLIST_STATE_FILE), 'w', encoding='utf-8') as fOut:
+        json.dump(state, fOut, ensure_ascii=False)
+
+
+def test_update_wordlists(analyzers, wordlist_sample, rule_sample, tmp_path):
+    sample = wordlist_sample(nWords=200)
+    words = list(dict.fromkeys([w for w in rule_sample(nWords=100) if re.search('^[^\\s<>]+$', w)][:150]
+                               + sample[:150]))
+    dirName, dirRebuilt = str(tmp_path / 'wordlists'), str(tmp_path / 'rebuilt')
+    os.makedirs(dirName)
+    os.makedirs(dirRebuilt)
+    write_frequency_list(dirName, words)
+    pre_build.parse_wordlists(workers=1, dirName=dirName)
+    analyzed = read_text(dirName, 'wordlist_analyzed.txt')
+    lines = analyzed.split('\n\n')[0].split('\n')
+    assert len(lines) > 10
+
+    # Nothing has changed
+    assert pre_build.update_wordlists(dirName=dirName, analyzers=analyzers)
+    assert read_text(dirName, 'wordlist_analyzed.txt') == analyzed
+
+    # A "new" lexeme, words removed from and added to the frequency
+    # list, a frequency changed
+    lemma = re.search('\\bl="([^"]+)"', lines[len(lines) // 2]).group(1)
+    edit_state(dirName, lemma)
+    words = words[5:] + sample[150:]
+    words[20], words[40] = words[40], words[20]
+    write_frequency_list(dirName, words)
+    write_frequency_list(dirRebuilt, words)
+    assert pre_build.update_wordlists(dirName=dirName, analyzers=analyzers)
+    pre_build.parse_wordlists(workers=1, dirName=dirRebuilt)
+    for fname in pre_build.WORDLIST_OUTPUTS:
+        assert read_text(dirName, fname) == read_text(dirRebuilt, fname)
+
+    # Only the lines of the affected words are replaced: a line
+    # edited by hand stays as it is unless its word is affected
+    analyzed = read_text(dirName, 'wordlist_analyzed.txt')
+    lines = analyzed.split('\n')
+    iAffected = [i for i, line in enumerate(lines) if 'l="' + lemma + '"' in line][0]
+    bigrams = set(lemma[i:i + 2].lower() for i in range(len(lemma) - 1))
+    iOther = [i for i, line in enumerate(lines) if len(line) > 0
+              and not any(bigram in pre_build.rxAnalyzedLine.search(line).group(2).lower() for bigram in bigrams)][0]
+    edited = lines[:]
+    for i in (iAffected, iOther):
+        edited[i] = re.sub('^.*>([^<>]+</w>)$', '<w><ana l="x" gr="X"/>\\1', lines[i])
+    with open(os.path.join(dirName, 'wordlist_analyzed.txt'), 'w', encoding='utf-8') as fOut:
+        fOut.write('\n'.join(edited))
+    edit_state(dirName, lemma, outputs=True)
+    assert pre_build.update_wordlists(dirName=dirName, analyzers=analyzers)
+    lines[iOther] = edited[iOther]
+    assert read_text(dirName, 'wordlist_analyzed.txt') == '\n'.join(lines)
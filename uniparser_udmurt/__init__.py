@@ -3,21 +3,132 @@ try:
 except ImportError:
     from importlib_resources import files, as_file
 from uniparser_morph import Analyzer
-import re
+import os
+import time
+from uniparser_morph.wordform import Wordform
+from .snapshot import load_grammar_snapshot
+from .lexicon import LEXICON_SHARDS, LexiconShards
+from .parser import UdmurtParser
+from .wordform_index import load_wordform_index, wordform2record, record2wordform, IndexedLookup
+from .cache import AnalysisCache, CachedLookup
+from .parallel import fork_safe, analyze_words_parallel, parse_freq_list_parallel, WorkerPool
+from .cg_session import CGSession
+from .cascade import Cascade, CascadeStats
+from .stem_index import load_stem_index
+from .metrics import Metrics, LockedMetrics, prometheus_text
+from .profiler import SamplingProfiler
+from .compact import InternTable
+from .batching import MicroBatcher, batch_stats
 
 
 class UdmurtAnalyzer(Analyzer):
-    def __init__(self, mode='strict', verbose_grammar=False):
+    def __init__(self, mode='strict', verbose_grammar=False, use_snapshot=True, normalize=False,
+                 use_index=False, cache_size=10000, cg_executable=None, use_stem_index=True,
+                 lexicons=None):
         """
         Initialize the analyzer by reading the grammar files.
         If mode=='strict' (default), load the data as is.
         If mode=='nodiacritics', load the data for (possibly) diacriticless texts.
+        If mode=='oldorth', load the data for pre-standardized orthographies.
+        If mode=='cascade', analyze each word with the strict data; if that
+        fails, with the nodiacritics data; if that fails too, with the strict
+        data allowing for one replacement (see cascade.Cascade).
+        If normalize is True and mode is 'nodiacritics' or 'oldorth', load
+        the strict data and map the non-standard spellings to the standard
+        ones at lookup time, which takes less memory. The stems are respelled
+        and the -soft paradigms are added as in the data of the mode, so
+        the analyses are the same (see UdmurtParser.set_orthography() and
+        benchmarks.analyzer.benchmark_normalization()).
+        If use_snapshot is True and there is an up-to-date precompiled
+        snapshot of the grammar (see pre_build.build_snapshots()), load
+        it instead of the text files.
+        If use_index is True and there is an up-to-date index of precomputed
+        analyses for the frequency list (see pre_build.build_wordform_indexes()),
+        look up words there before calling the parser.
+        Keep the analyses of up to cache_size most recently analyzed words
+        in memory (set it to 0 to switch the cache off).
+        cg_executable is the path to the CG3 executable used for
+        disambiguation; by default, it is looked up in PATH.
+        If use_stem_index is True and there is an up-to-date stem index
+        (see pre_build.build_stem_indexes()), use it to find the stems
+        when replacements are allowed instead of searching the whole
+        stem FST.
+        Proper names and imitatives are kept in separate lexicon shards
+        (see lexicon.LEXICON_SHARDS). If lexicons is None, all of them
+        are loaded. Otherwise, only the core lexicon and the shards listed
+        in lexicons (e.g. ['names']) are loaded; others can be added later
+        with load_lexicon(). If lexicons == 'auto', each shard is loaded
+        when the first word that needs it is not analyzed: 'names' for
+        capitalized words, 'imit' for words that start with one of its
+        stems.
         """
         super().__init__(verbose_grammar=verbose_grammar)
         self.mode = mode
-        if mode not in ('strict', 'nodiacritics', 'oldorth'):
+        self.cache = AnalysisCache(maxSize=cache_size)
+        self.metrics = Metrics()
+        self.cascade = None     # Cascade object in the cascade mode
+        self.cascadeStats = CascadeStats()
+        self.wordformIndex = None
+        self.shards = LexiconShards(self, lexicons)
+        self.workerStats = {}   # pid -> throughput of the worker in the last parallel call
+        self.workerPool = None  # workers kept between calls (see start_workers())
+        self.profiler = None
+        self.interned = InternTable()  # strings and analyses returned with format='compact'
+        self.batcher = None     # created by the first analyze_async() call
+        self.batchSettings = {'maxBatchSize': 256, 'maxWait': 0.002}
+        if mode not in ('strict', 'nodiacritics', 'oldorth', 'cascade'):
             return
-        self.dirName = 'uniparser_udmurt.data_' + mode
+        # Mode of the data in the grammar directory and the word form index
+        self.dataMode = 'strict' if mode == 'cascade' else mode
+        self.normalize = normalize and self.dataMode != 'strict'
+        self.dirName = 'uniparser_udmurt.data_' + ('strict' if self.normalize else self.dataMode)
+        self.load_data(use_snapshot=use_snapshot)
+        self.disambiguator = CGSession(self.g, self.dirName, executable=cg_executable)
+        if self.normalize:
+            self.m.set_orthography(mode)
+        self.m.stemIndex = load_stem_index(self) if use_stem_index else None
+        if use_index:
+            self.wordformIndex = load_wordform_index(self)
+        if mode == 'cascade':
+            self.cascade = Cascade(self, self.cascadeStats, verbose_grammar=verbose_grammar,
+                                   use_snapshot=use_snapshot, normalize=normalize, use_index=use_index,
+                                   use_stem_index=use_stem_index)
+        self.build_pipeline()
+
+    @property
+    def lexicons(self):
+        """
+        The set of the lexicon shards loaded.
+        """
+        return self.shards.loaded
+
+    def load_data(self, use_snapshot=True):
+        """
+        Load the grammar and the parser with the lexicon shards requested
+        when the analyzer was created, from the snapshot if there is an
+        up-to-date one (see snapshot.load_grammar_snapshot()), otherwise
+        from the text files.
+        """
+        t1 = time.perf_counter()
+        snapshot = None
+        if use_snapshot:
+            with as_file(files(self.dirName)) as dataDir:
+                snapshot = load_grammar_snapshot(str(dataDir), self.g.errorHandler,
+                                                 lexicons=self.shards.requested)
+        self.snapshotLoaded = snapshot is not None
+        if self.snapshotLoaded:
+            self.g, self.m, self.shards.loaded = snapshot
+        else:
+            self.load_text_grammar()
+        self.metrics.add_time('load', time.perf_counter() - t1)
+        for shard in self.shards.requested:
+            self.load_lexicon(shard)
+
+    def load_text_grammar(self):
+        """
+        Load the grammar with the core lexicon from the text files
+        in the data directory and initialize the parser.
+        """
         with as_file(files(self.dirName) / 'paradigms.txt') as self.paradigmFile,\
              as_file(files(self.dirName) / 'lexemes.txt') as self.lexFile,\
              as_file(files(self.dirName) / 'lex_rules.txt') as self.lexRulesFile,\
@@ -27,14 +138,283 @@ class UdmurtAnalyzer(Analyzer):
              as_file(files(self.dirName) / 'bad_analyses.txt') as self.delAnaFile:
             self.load_grammar()
         self.initialize_parser()
-        self.m.MIN_REPLACEMENT_WORD_LEN = 8
-        self.m.MIN_REPLACEMENT_STEM_LEN = 6
-        self.m.rxNoReplacements = re.compile('-|ая$|ого$|кое$|р[яы]м?$|рт(ы|ов)$|ами$|ств[оае]м?$|[нцгх]и[яию]$|ией$|'
-                                             'публик[ие]$|[бвгжкмрфхцчшщ]ь[ея][мй]?$|[рн]т[ыае]$|шие$|ч[её]та$|[ое]ва$|шь$|[ией]те$|'
-                                             '[ео]вка$|цы$|няя$|нее$|[иаоеу]ты$|[бвгджзйклмнпрстфхцчшщ]но$|кин[оае]$|'
-                                             '[ео]в[оа][мй]?$|дане$', flags=re.I)
 
-    def analyze_words(self, words, format=None, disambiguate=False, replacementsAllowed=0):
+    def load_lexicon(self, shard):
+        """
+        Add a lexicon shard ('names' or 'imit', see lexicon.LEXICON_SHARDS)
+        to the loaded grammar and parser. The analyses are then the same
+        as if it had been loaded from the start. Return True if the shard
+        has been loaded now, False if it had been loaded before.
+        """
+        if not self.shards.load(shard):
+            return False
+        # Analyses made without the shard are no longer valid
+        self.cache.clear()
+        if self.cascade is not None:
+            self.cascade.fallback.load_lexicon(shard)
+        self.build_pipeline()
+        return True
+
+    def initialize_parser(self, verbose=False):
+        """
+        If the parser has not been initialized yet, initialize it.
+        """
+        if self.m is None:
+            self.m = UdmurtParser(g=self.g,
+                                  verbose=self.parserVerbosity,
+                                  parsingMethod=self.parsingMethod)
+            self.m.fill_stems()
+            if self.parsingMethod == 'fst':
+                self.m.fill_affixes()
+        super().initialize_parser(verbose=verbose)
+
+    def build_pipeline(self):
+        """
+        Choose the stages a token goes through, depending on the options
+        and on the lexicon shards loaded, so that they are not checked
+        for every token. Called again whenever any of these change.
+        parse_records(word, replacementsAllowed) returns the analyses of
+        a lowercase word as a list of records, from the word form index
+        (see wordform_index.IndexedLookup) or the parser.
+        lookup_records() returns them as a tuple of frozen records, through
+        the cascade (see cascade.Cascade) and the cache (see cache.CachedLookup).
+        word_records() does the same for a word in its original case and,
+        with lexicons='auto', loads the shards it may need first (see
+        lexicon.LexiconShards.word_records()).
+        """
+        direct = self.cascade is None and len(self.shards.lazy) <= 0
+        self.parse_records = self.parser_records
+        # The index is built with all lexicon shards
+        if self.wordformIndex is not None and len(self.lexicons) == len(LEXICON_SHARDS):
+            self.parse_records = IndexedLookup(self.wordformIndex, self.parser_records).records
+            direct = False
+        lookup = self.parse_records if self.cascade is None else self.cascade.records
+        self.lookup_records = CachedLookup(self.cache, self.mode, lookup).records
+        if len(self.shards.lazy) > 0:
+            self.word_records = self.shards.word_records
+        else:
+            self.word_records = self.lowercase_records
+        if direct and self.cache.maxSize <= 0:
+            self.analyze_token = self.parse_token
+        else:
+            self.analyze_token = self.lookup_token
+
+    def set_wordform_index(self, index):
+        """
+        Look words up in another WordformIndex from now on, or in none
+        if index is None.
+        """
+        self.wordformIndex = index
+        self.build_pipeline()
+
+    def parser_records(self, word, replacementsAllowed=0):
+        return [wordform2record(ana) for ana in self.m.parse(word, replacementsAllowed=replacementsAllowed)]
+
+    def lowercase_records(self, word, replacementsAllowed=0):
+        return self.lookup_records(word.lower(), replacementsAllowed=replacementsAllowed)
+
+    def parse_token(self, word, replacementsAllowed=0):
+        """
+        Analyze a word with the parser only. Return the list of
+        Wordform objects and the number of analyses.
+        """
+        analyses = super().__analyze_word__(word, replacementsAllowed=replacementsAllowed)
+        return analyses, len(analyses) if len(analyses[0].lemma) > 0 else 0
+
+    def lookup_token(self, word, replacementsAllowed=0):
+        """
+        Analyze a word through word_records(). Return the list of
+        Wordform objects and the number of analyses.
+        """
+        self.g.COMPLEX_WF_AS_BAGS = self.flattenSubwords
+        records = self.word_records(word, replacementsAllowed=replacementsAllowed)
+        return self.records2analyses(word, records), len(records)
+
+    def __analyze_word__(self, word, replacementsAllowed=0):
+        """
+        Analyze a single word. Return either a list of its analyses
+        or a list with a single Wordform object that has only the wf
+        property filled. Assume the parser has already been initialized.
+        Use cached or precomputed analyses if possible.
+        """
+        t1 = time.perf_counter()
+        analyses, nAnalyses = self.analyze_token(word, replacementsAllowed=replacementsAllowed)
+        self.metrics.add_token(nAnalyses, time.perf_counter() - t1)
+        return analyses
+
+    def cache_stats(self):
+        """
+        Return a dictionary with the size of the analysis cache
+        and its hit, miss and eviction counters.
+        """
+        return self.cache.stats()
+
+    def cascade_stats(self):
+        """
+        Return a dictionary with the number of words that reached each
+        stage of the cascade (mode=='cascade'), the number of words
+        analyzed there and the time spent on them.
+        """
+        return self.cascadeStats.stats()
+
+    def metrics_snapshot(self):
+        """
+        Return a dictionary with the counters (tokens, analyses, unanalyzed
+        tokens, replacement attempts and successes) and the time spent on
+        each stage of the analysis (see metrics.STAGES) since the analyzer
+        was created or reset_metrics() was called, plus the cache statistics.
+        The replacement counters and the parser stages stay at zero
+        unless they have been switched on with set_metrics(stages=True).
+        """
+        snapshot = self.metrics.snapshot()
+        snapshot['mode'] = self.mode
+        snapshot['lexicons'] = sorted(self.lexicons)
+        snapshot['cache'] = self.cache.stats()
+        return snapshot
+
+    def metrics_prometheus(self):
+        """
+        Return the same metrics in the Prometheus text exposition format.
+        """
+        return prometheus_text(self.metrics.snapshot(), labels={'mode': self.mode},
+                               cacheStats=self.cache.stats())
+
+    def reset_metrics(self):
+        self.metrics.clear()
+
+    def set_metrics(self, stages=False, locked=False):
+        """
+        Choose what the metrics cover, keeping the counts made so far.
+        By default, only the tokens and the stages of the analyzer itself
+        (loading, analysis, disambiguation, formatting) are counted.
+        If stages is True, the parser also counts the searches with
+        replacements and times them, the checks from bad_analyses.txt
+        and the lexical rules, which makes the analysis slightly slower.
+        If locked is True, each update takes a lock, so that the counts
+        stay exact when several threads analyze with this analyzer.
+        """
+        metrics = LockedMetrics() if locked else Metrics()
+        metrics.merge(self.metrics.state())
+        analyzers = [self] if self.cascade is None else [self, self.cascade.fallback]
+        for a in analyzers:
+            a.metrics = metrics
+            a.m.metrics = metrics if stages else None
+
+    def start_profiler(self, interval=0.005):
+        """
+        Start sampling the stack of the calling thread every interval
+        seconds. Return the SamplingProfiler object.
+        """
+        if self.profiler is None:
+            self.profiler = SamplingProfiler(interval=interval)
+        self.profiler.start()
+        return self.profiler
+
+    def stop_profiler(self):
+        """
+        Stop the profiler. Return the SamplingProfiler object with the
+        samples collected so far (see its collapsed() and top()
+        methods) or None if it was never started.
+        """
+        if self.profiler is not None:
+            self.profiler.stop()
+        return self.profiler
+
+    def records2analyses(self, words, records):
+        """
+        Turn frozen analysis records, arranged in the same (possibly nested)
+        structure as words, into lists of Wordform objects.
+        """
+        if type(words) == str:
+            if len(records) <= 0:
+                return [Wordform(self.g, wf=words)]
+            return [record2wordform(self.g, record, words) for record in records]
+        elif type(words) == list:
+            return [self.records2analyses(w, r) for w, r in zip(words, records)]
+        return []
+
+    def records2compact(self, records):
+        """
+        Turn frozen analysis records, arranged in a (possibly nested)
+        structure of lists, into tuples of CompactAnalysis objects.
+        """
+        if type(records) == tuple:
+            return tuple(self.interned.analysis(record) for record in records)
+        return [self.records2compact(r) for r in records]
+
+    def analyses2compact(self, analyses):
+        """
+        Turn lists of Wordform objects in a (possibly nested) list
+        into tuples of CompactAnalysis objects.
+        """
+        if len(analyses) > 0 and type(analyses[0]) == Wordform:
+            return self.interned.from_wordforms(analyses)
+        return [self.analyses2compact(a) for a in analyses]
+
+    def lookup_words(self, words, replacementsAllowed=0):
+        """
+        Same as Analyzer.analyze_words_nodisamb(), but return tuples
+        of frozen records instead of lists of Wordform objects.
+        """
+        if type(words) == str:
+            t1 = time.perf_counter()
+            records = self.word_records(words, replacementsAllowed=replacementsAllowed)
+            self.metrics.add_token(len(records), time.perf_counter() - t1)
+            return records
+        elif type(words) == list:
+            return [self.lookup_words(w, replacementsAllowed=replacementsAllowed) for w in words]
+        return []
+
+    def analyze_words_compact(self, words, replacementsAllowed=0, workers=1):
+        """
+        Analyze the words without disambiguation and return the analyses
+        as tuples of CompactAnalysis objects, without creating Wordform
+        objects.
+        """
+        self.initialize_parser()
+        self.g.COMPLEX_WF_AS_BAGS = self.flattenSubwords
+        if workers > 1 and fork_safe():
+            records, self.workerStats = analyze_words_parallel(self, words, workers,
+                                                               replacementsAllowed=replacementsAllowed,
+                                                               pool=self.workerPool)
+        else:
+            records = self.lookup_words(words, replacementsAllowed=replacementsAllowed)
+        t1 = time.perf_counter()
+        analyses = self.records2compact(records)
+        self.metrics.add_time('formatting', time.perf_counter() - t1)
+        return analyses
+
+    def analyze_words_workers(self, words, replacementsAllowed=0, workers=2):
+        """
+        Same as Analyzer.analyze_words_nodisamb(), but the words are analyzed
+        in several forked processes that share the grammar.
+        """
+        self.initialize_parser()
+        self.g.COMPLEX_WF_AS_BAGS = self.flattenSubwords
+        records, self.workerStats = analyze_words_parallel(self, words, workers,
+                                                           replacementsAllowed=replacementsAllowed,
+                                                           pool=self.workerPool)
+        return self.records2analyses(words, records)
+
+    def start_workers(self, workers):
+        """
+        Fork the given number of worker processes and keep them for
+        the subsequent calls of analyze_words() with workers > 1, instead
+        of forking new ones in each call (only where processes can be
+        forked, i.e. not on Windows, and while no thread of the analyzer
+        is running, see parallel.fork_safe()). Stop them with stop_workers().
+        """
+        self.stop_workers()
+        if workers > 1 and fork_safe():
+            self.workerPool = WorkerPool(self, workers)
+            self.workerPool.start()
+
+    def stop_workers(self):
+        if self.workerPool is not None:
+            self.workerPool.close()
+            self.workerPool = None
+
+    def analyze_words(self, words, format=None, disambiguate=False, replacementsAllowed=0, workers=1):
         """
         Analyze a single word or a (possibly nested) list of words. Return either a list of
         analyses (all possible analyses of the word) or a nested list of lists
@@ -42,14 +422,171 @@ class UdmurtAnalyzer(Analyzer):
         If format is None, the analyses are Wordform objects.
         If format == 'xml', the analyses for each word are united into an XML string.
         If format == 'json', the analyses are JSON objects (dictionaries).
+        If format == 'compact', the analyses for each word are a tuple of
+        CompactAnalysis objects (empty if the word was not analyzed).
+        Their strings are interned, and identical analyses are the same
+        object, so they take much less memory than Wordform objects.
         Perform CG3 disambiguation if disambiguate == True and CG3 is installed.
+        If workers > 1, analyze the words in that many processes (only
+        where processes can be forked, i.e. not on Windows). While the
+        profiler, the asyncio batching thread or the CG3 input thread is
+        running, nothing is forked and the words are analyzed in this
+        process (see parallel.fork_safe()). Disambiguation
+        and formatting are done in the main process. The workers started
+        with start_workers() are used if there are any.
         """
+        if format == 'compact' and not disambiguate:
+            return self.analyze_words_compact(words, replacementsAllowed=replacementsAllowed,
+                                              workers=workers)
+        if workers > 1 and fork_safe():
+            analyses = self.analyze_words_workers(words, replacementsAllowed=replacementsAllowed,
+                                                  workers=workers)
+        else:
+            analyses = self.analyze_words_nodisamb(words, replacementsAllowed=replacementsAllowed)
         if disambiguate:
-            with as_file(files(self.dirName) / 'udmurt_disambiguation.cg3') as cgFile:
-                cgFilePath = str(cgFile)
-                return super().analyze_words(words, format=format, disambiguate=True,
-                                             cgFile=cgFilePath, replacementsAllowed=replacementsAllowed)
-        return super().analyze_words(words, format=format, disambiguate=False, replacementsAllowed=replacementsAllowed)
+            t1 = time.perf_counter()
+            cgFile = self.disambiguator.grammar_file()
+            if len(cgFile) > 0 and os.path.exists(cgFile):
+                self.disambiguator.disambiguate_analyses(analyses, cgFile)
+            self.metrics.add_time('disambiguation', time.perf_counter() - t1)
+        return self.format_analyses(analyses, format)
+
+    def format_analyses(self, analyses, format=None):
+        """
+        Transform the analyses returned by analyze_words() with format=None
+        into the given format (see analyze_words()) and return them.
+        """
+        if format is None:
+            return analyses
+        t1 = time.perf_counter()
+        if format == 'xml':
+            self.analyses_to_xml(analyses)
+        elif format == 'json':
+            self.analyses_to_json(analyses)
+        elif format == 'conll':
+            analyses = self.analyses_to_conll(analyses)
+        elif format == 'compact':
+            analyses = self.analyses2compact(analyses)
+        self.metrics.add_time('formatting', time.perf_counter() - t1)
+        return analyses
+
+    def analyze_batch(self, key, requests):
+        """
+        Analyze the words of several requests to analyze_async() made with
+        the same key (format, disambiguate, replacementsAllowed) in one call.
+        Return the list of results, each the same as analyze_words() would
+        return for that request. Each request is a separate sentence for
+        the disambiguation.
+        """
+        format, disambiguate, replacementsAllowed = key
+        if format == 'compact' and not disambiguate:
+            return self.analyze_words(requests, format='compact', replacementsAllowed=replacementsAllowed)
+        analyses = self.analyze_words(requests, disambiguate=disambiguate,
+                                      replacementsAllowed=replacementsAllowed)
+        return [self.format_analyses(requestAnalyses, format) for requestAnalyses in analyses]
+
+    def set_batching(self, max_batch_size=256, max_wait=0.002):
+        """
+        Set the maximal number of tokens analyzed at once by analyze_async()
+        and the time (in seconds) a request can wait for other requests
+        to be analyzed together with it.
+        """
+        self.batchSettings = {'maxBatchSize': max_batch_size, 'maxWait': max_wait}
+        if self.batcher is not None:
+            self.batcher.maxBatchSize = max_batch_size
+            self.batcher.maxWait = max_wait
+
+    async def analyze_async(self, words, format=None, disambiguate=False, replacementsAllowed=0):
+        """
+        Same as analyze_words(), but for use in asyncio code: the words
+        are analyzed in a separate thread, and requests made concurrently
+        are analyzed together in batches (see set_batching()), which is
+        faster, especially with disambiguation. Do not call other methods
+        of the analyzer from other threads while these requests are running.
+        """
+        if type(words) == str:
+            # analyze_words() does not disambiguate single words either
+            disambiguate = False
+        if self.batcher is None:
+            self.batcher = MicroBatcher(self.analyze_batch, **self.batchSettings)
+        return await self.batcher.submit((format, disambiguate, replacementsAllowed), words)
+
+    def batching_stats(self):
+        """
+        Return the number of batches, requests and tokens processed
+        by analyze_async() and the average batch size.
+        """
+        if self.batcher is None:
+            return batch_stats()
+        return self.batcher.stats()
+
+    def analyze_wordlist(self, freqListFile=None, parsedFile=None, unparsedFile=None,
+                         freqListSeparator=None, verbose=False, replacementsAllowed=0, workers=1):
+        """
+        Analyze a frequency list in a file. Write output to files with lists
+        of analyzed and unanalyzed words. Use default filenames if none are
+        specified as arguments. Return some statistics.
+        If workers > 1, analyze the words in that many processes (only
+        where processes can be forked, i.e. not on Windows, and while no
+        thread of the analyzer is running, see parallel.fork_safe()).
+        """
+        if workers <= 1 or not fork_safe():
+            return super().analyze_wordlist(freqListFile=freqListFile, parsedFile=parsedFile,
+                                            unparsedFile=unparsedFile, freqListSeparator=freqListSeparator,
+                                            verbose=verbose, replacementsAllowed=replacementsAllowed)
+        self.g.COMPLEX_WF_AS_BAGS = self.flattenSubwords
+        if freqListFile is None:
+            freqListFile = self.freqListFile
+        if parsedFile is None:
+            parsedFile = self.parsedFile
+        if unparsedFile is None:
+            unparsedFile = self.unparsedFile
+        if freqListSeparator is None:
+            freqListSeparator = self.freqListSeparator
+
+        t1 = time.time()
+        self.initialize_parser(verbose=verbose)
+        initTime = time.time() - t1
+        if verbose:
+            print('Parser initialized in', initTime, 'seconds.')
+
+        t1 = time.time()
+        nTypes, parsedRate, self.workerStats = parse_freq_list_parallel(self, freqListFile,
+                                                                        sep=freqListSeparator,
+                                                                        fnameParsed=parsedFile,
+                                                                        fnameUnparsed=unparsedFile,
+                                                                        glossing=self.glossing,
+                                                                        workers=workers,
+                                                                        replacementsAllowed=replacementsAllowed)
+        anaTime = time.time() - t1
+        if verbose:
+            print('Frequency list processed,', parsedRate * 100, '% tokens parsed.')
+            print('Average speed:', nTypes / anaTime, 'tokens per second.')
+            for pid, stats in self.workerStats.items():
+                print('Worker', pid, ':', stats['tokens'], 'tokens,',
+                      stats['words_per_second'], 'tokens per second.')
+        stats = {
+            'init_time': initTime,
+            'analysis_time': anaTime,
+            'types_processed': nTypes,
+            'words_per_second': nTypes / anaTime,
+            'percent_parsed_tokens': parsedRate * 100,
+            'workers': self.workerStats
+        }
+        return stats
+
+    def close(self):
+        """
+        Stop the CG3 process, if it is running, the thread used by
+        analyze_async() and the workers, and close the word form index.
+        """
+        self.stop_workers()
+        if self.batcher is not None:
+            self.batcher.close()
+        self.disambiguator.close()
+        if self.wordformIndex is not None:
+            self.wordformIndex.close()
+            self.wordformIndex = None
 
 
 if __name__ == '__main__':
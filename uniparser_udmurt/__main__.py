@@ -0,0 +1,284 @@
+"""
+Command-line analyzer. Reads raw or tokenized Udmurt text from
+stdin or files and writes the analyses to stdout sentence by sentence,
+so that input of any size can be piped through it.
+
+    python -m uniparser_udmurt --format jsonl < text.txt > analyses.jsonl
+    python -m uniparser_udmurt --mode nodiacritics --disambiguate --format conllu text.txt
+
+Run with --help for all options.
+"""
+import argparse
+import io
+import json
+import os
+import re
+import sys
+import time
+from .cli import add_analyzer_arguments, analyzer_from_args
+from .compact import CompactWriter
+
+rxToken = re.compile("\\w+(?:[-'’‘]\\w+)*|([^\\w\\s])\\1*")
+rxSentenceEnd = re.compile('^[.!?…]+$')
+rxWord = re.compile('[^\\W\\d_]')
+
+
+def tokenize(text):
+    return [m.group(0) for m in rxToken.finditer(text)]
+
+
+def read_sentences(lines, inputFormat='text', maxLength=1000):
+    """
+    Iterate over sentences (lists of tokens) in the lines.
+    If inputFormat is 'text', tokenize the lines and split them into
+    sentences after sentence-final punctuation and at empty lines.
+    If inputFormat is 'tokens', each line contains one token and
+    sentences are separated by empty lines.
+    Sentences longer than maxLength tokens are split.
+    """
+    sentence = []
+    for line in lines:
+        line = line.strip('\r\n')
+        if len(line.strip()) <= 0:
+            if len(sentence) > 0:
+                yield sentence
+                sentence = []
+            continue
+        if inputFormat == 'tokens':
+            tokens = [line.strip()]
+        else:
+            tokens = tokenize(line)
+        for token in tokens:
+            sentence.append(token)
+            if (inputFormat == 'text' and rxSentenceEnd.search(token) is not None) or len(sentence) >= maxLength:
+                yield sentence
+                sentence = []
+    if len(sentence) > 0:
+        yield sentence
+
+
+def read_batches(sentences, batchSize=1000):
+    """
+    Group the sentences into batches of about batchSize tokens.
+    """
+    batch = []
+    nTokens = 0
+    for sentence in sentences:
+        batch.append(sentence)
+        nTokens += len(sentence)
+        if nTokens >= batchSize:
+            yield batch
+            batch = []
+            nTokens = 0
+    if len(batch) > 0:
+        yield batch
+
+
+def is_analyzed(analyses):
+    return any(ana.lemma is not None and len(ana.lemma) > 0 for ana in analyses)
+
+
+def sentence2jsonl(a, tokens, analyses):
+    return json.dumps([{'wf': token, 'ana': [ana.to_json(glossing=a.glossing) for ana in wordAnalyses
+                                             if ana.lemma is not None and len(ana.lemma) > 0]}
+                       for token, wordAnalyses in zip(tokens, analyses)],
+                      ensure_ascii=False) + '\n'
+
+
+def sentence2xml(a, tokens, analyses):
+    a.analyses_to_xml(analyses)
+    return '<se>' + ' '.join(analyses) + '</se>\n'
+
+
+def conllu_field(values):
+    value = '|'.join(sorted(v for v in values if len(v) > 0))
+    value = value.replace('\t', '\\t').replace('\n', '\\n').replace(' ', '_')
+    if len(value) <= 0:
+        return '_'
+    return value
+
+
+def sentence2conllu(a, tokens, analyses, sentId=None):
+    """
+    Return a sentence in the CoNLL-U format. Ambiguous lemmata and tags
+    are joined with |. The tags of each analysis go to the XPOS column
+    and the glosses (if any) to MISC.
+    """
+    lines = []
+    if sentId is not None:
+        lines.append('# sent_id = ' + str(sentId))
+    lines.append('# text = ' + ' '.join(tokens))
+    for iToken, (token, wordAnalyses) in enumerate(zip(tokens, analyses)):
+        lemmata = set()
+        tags = set()
+        glosses = set()
+        for ana in wordAnalyses:
+            if ana.lemma is None or len(ana.lemma) <= 0:
+                continue
+            objAna = ana.to_json(glossing=a.glossing)
+            lemmata.add(objAna['lemma'])
+            pos, gramm = a.gramm_to_conll(objAna)
+            tags.add(gramm)
+            if a.glossing and 'gloss' in objAna:
+                glosses.add(objAna['wfGlossed'] + '=' + objAna['gloss'])
+        misc = '_'
+        if len(glosses) > 0:
+            misc = 'Gloss=' + conllu_field(glosses).replace('|', ';')
+        lines.append('\t'.join([str(iToken + 1), token.replace('\t', '\\t'), conllu_field(lemmata), '_',
+                                conllu_field(tags), '_', '_', '_', '_', misc]))
+    return '\n'.join(lines) + '\n\n'
+
+
+def analyze_stream(a, lines, fOut, inputFormat='text', outputFormat='jsonl', disambiguate=False,
+                   batchSize=1000, replacementsAllowed=0, workers=1, fLog=None, reportEvery=0):
+    """
+    Analyze the sentences in the lines batch by batch and write the
+    results to fOut after each batch. Return a dictionary with the
+    number of tokens and sentences, recall and speed.
+    If outputFormat is 'compact', fOut has to be a binary file.
+    If workers > 1, the same worker processes are used for all batches.
+    """
+    writer = None
+    if outputFormat == 'compact':
+        writer = CompactWriter(fOut, header={'mode': a.mode})
+    nTokens = 0
+    nWords = 0
+    nAnalyzed = 0
+    nSentences = 0
+    t1 = time.time()
+    lastReport = t1
+    if workers > 1:
+        a.start_workers(workers)
+    try:
+        for batch in read_batches(read_sentences(lines, inputFormat=inputFormat, maxLength=batchSize),
+                                  batchSize=batchSize):
+            if writer is not None and writer.block_full():
+                # Neither the numbering of the strings and analyses in the
+                # output nor the interned analyses grow with the input
+                writer.start_block()
+                a.interned.clear()
+            analyses = a.analyze_words(batch, format='compact' if writer is not None else None,
+                                       disambiguate=disambiguate,
+                                       replacementsAllowed=replacementsAllowed, workers=workers)
+            output = ''
+            for tokens, sentenceAnalyses in zip(batch, analyses):
+                nSentences += 1
+                for token, wordAnalyses in zip(tokens, sentenceAnalyses):
+                    nTokens += 1
+                    if rxWord.search(token) is not None:
+                        nWords += 1
+                        if is_analyzed(wordAnalyses):
+                            nAnalyzed += 1
+                if writer is not None:
+                    writer.write_sentence(tokens, sentenceAnalyses)
+                elif outputFormat == 'xml':
+                    output += sentence2xml(a, tokens, sentenceAnalyses)
+                elif outputFormat == 'conllu':
+                    output += sentence2conllu(a, tokens, sentenceAnalyses, sentId=nSentences)
+                else:
+                    output += sentence2jsonl(a, tokens, sentenceAnalyses)
+            if writer is not None:
+                writer.flush()
+            else:
+                fOut.write(output)
+            fOut.flush()
+            if fLog is not None and reportEvery > 0 and time.time() - lastReport >= reportEvery:
+                lastReport = time.time()
+                fLog.write(format_stats(stream_stats(nTokens, nWords, nAnalyzed, nSentences,
+                                                     lastReport - t1)) + '\n')
+                fLog.flush()
+    finally:
+        a.stop_workers()
+    return stream_stats(nTokens, nWords, nAnalyzed, nSentences, time.time() - t1)
+
+
+def stream_stats(nTokens, nWords, nAnalyzed, nSentences, seconds):
+    return {
+        'tokens': nTokens,
+        'words': nWords,
+        'analyzed': nAnalyzed,
+        'sentences': nSentences,
+        'seconds': seconds,
+        'tokens_per_second': nTokens / seconds if seconds > 0 else 0.0,
+        'recall': nAnalyzed / nWords if nWords > 0 else 0.0
+    }
+
+
+def format_stats(stats):
+    return (str(stats['tokens']) + ' tokens, ' + str(stats['sentences']) + ' sentences in '
+            + str(round(stats['seconds'], 1)) + ' s (' + str(round(stats['tokens_per_second'])) + ' tokens/s), recall '
+            + str(round(stats['recall'] * 100, 2)) + '% (' + str(stats['analyzed']) + ' of ' + str(stats['words'])
+            + ' words).')
+
+
+def read_lines(fnames):
+    if len(fnames) <= 0:
+        fnames = ['-']
+    for fname in fnames:
+        if fname == '-':
+            yield from io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig', errors='replace')
+        else:
+            with open(fname, 'r', encoding='utf-8-sig', errors='replace') as fIn:
+                yield from fIn
+
+
+def main(args=None):
+    argParser = argparse.ArgumentParser(prog='python -m uniparser_udmurt',
+                                        description='Morphological analysis of Udmurt texts.')
+    argParser.add_argument('files', nargs='*', help='input files (default: stdin)')
+    add_analyzer_arguments(argParser)
+    argParser.add_argument('--input', default='text', choices=['text', 'tokens'],
+                           help='raw text or one token per line with empty lines between sentences')
+    argParser.add_argument('--format', default='jsonl', choices=['jsonl', 'xml', 'conllu', 'compact'],
+                           help='output format (compact is binary, see uniparser_udmurt.compact.CompactReader)')
+    argParser.add_argument('--disambiguate', action='store_true', help='disambiguate with CG3')
+    argParser.add_argument('--batch-size', type=int, default=1000, help='number of tokens analyzed at once')
+    argParser.add_argument('--replacements', type=int, default=0, help='number of replacements allowed')
+    argParser.add_argument('--workers', type=int, default=1, help='number of processes')
+    argParser.add_argument('--report-every', type=float, default=0,
+                           help='report progress to stderr every N seconds')
+    argParser.add_argument('--quiet', action='store_true', help='do not report statistics to stderr')
+    argParser.add_argument('--metrics', action='store_true',
+                           help='write the stage timers and counters to stderr in the Prometheus format')
+    argParser.add_argument('--profile', default=None,
+                           help='sample the stack while analyzing and write it to this file as collapsed stacks')
+    args = argParser.parse_args(args)
+
+    a = analyzer_from_args(args)
+    if args.metrics:
+        a.set_metrics(stages=True)
+    if args.format == 'compact':
+        fOut = sys.stdout.buffer
+    else:
+        fOut = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', newline='\n')
+    fLog = None if args.quiet else sys.stderr
+    if args.profile is not None:
+        a.start_profiler()
+    try:
+        stats = analyze_stream(a, read_lines(args.files), fOut,
+                               inputFormat=args.input, outputFormat=args.format,
+                               disambiguate=args.disambiguate, batchSize=max(1, args.batch_size),
+                               replacementsAllowed=args.replacements, workers=args.workers,
+                               fLog=fLog, reportEvery=args.report_every)
+    except BrokenPipeError:
+        # The output was closed (e.g. piped to head): make sure
+        # that flushing stdout at exit does not fail again
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 0
+    finally:
+        a.close()
+        if args.profile is not None:
+            with open(args.profile, 'w', encoding='utf-8') as fProfile:
+                fProfile.write(a.stop_profiler().collapsed())
+    if fLog is not None:
+        fLog.write(format_stats(stats) + '\n')
+        if args.mode == 'cascade':
+            for stage, stageStats in a.cascade_stats().items():
+                fLog.write(stage + ': ' + json.dumps(stageStats) + '\n')
+    if args.metrics:
+        sys.stderr.write(a.metrics_prometheus())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,171 @@
+import asyncio
+import collections
+import concurrent.futures
+import threading
+
+
+def count_tokens(words):
+    """
+    Return the number of strings in a (possibly nested) list of words.
+    """
+    if type(words) == str:
+        return 1
+    elif type(words) == list:
+        return sum(count_tokens(w) for w in words)
+    return 0
+
+
+def batch_stats(nBatches=0, nRequests=0, nTokens=0):
+    """
+    Return a dictionary with the number of batches, requests and
+    tokens processed and the average batch size.
+    """
+    return {
+        'batches': nBatches,
+        'requests': nRequests,
+        'tokens': nTokens,
+        'requests_per_batch': nRequests / nBatches if nBatches > 0 else 0.0,
+        'tokens_per_batch': nTokens / nBatches if nBatches > 0 else 0.0
+    }
+
+
+class MicroBatcher:
+    """
+    Collect requests made concurrently in an asyncio event loop into
+    batches and process each batch with one call of a blocking function
+    in a separate thread, so that the event loop is never blocked.
+    func(key, items) gets a list of request items with the same key and
+    has to return a list of results in the same order. A batch is started
+    when it has maxBatchSize tokens (see count_tokens()) or when its first
+    request has waited for maxWait seconds. Batches are processed one at
+    a time, and the requests that come in meanwhile go to the next batch,
+    so the batches get larger as the load grows.
+    """
+    def __init__(self, func, maxBatchSize=256, maxWait=0.002):
+        self.func = func
+        self.maxBatchSize = maxBatchSize
+        self.maxWait = maxWait
+        self.executor = None
+        self.lock = threading.Lock()
+        self.loop = None
+        self.queue = collections.deque()    # (key, item, number of tokens, future, time added)
+        self.nQueued = 0                    # tokens in the queue
+        self.wakeup = None
+        self.full = None
+        self.task = None
+        self.nBatches = 0
+        self.nRequests = 0
+        self.nTokens = 0
+
+    def start(self, loop):
+        if self.executor is None:
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1,
+                                                                  thread_name_prefix='uniparser-udmurt-batch')
+        self.loop = loop
+        self.queue.clear()
+        self.nQueued = 0
+        self.wakeup = asyncio.Event()
+        self.full = asyncio.Event()
+        self.task = loop.create_task(self.run())
+
+    async def submit(self, key, item):
+        """
+        Add an item to the queue and wait for its result.
+        """
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop or self.task is None or self.task.done():
+            self.start(loop)
+        future = loop.create_future()
+        nTokens = max(1, count_tokens(item))
+        self.queue.append((key, item, nTokens, future, loop.time()))
+        self.nQueued += nTokens
+        self.wakeup.set()
+        if self.nQueued >= self.maxBatchSize:
+            self.full.set()
+        return await future
+
+    def next_batch(self):
+        """
+        Take the first request from the queue and the following
+        requests with the same key, up to maxBatchSize tokens.
+        """
+        key = self.queue[0][0]
+        batch = []
+        rest = collections.deque()
+        nTokens = 0
+        while len(self.queue) > 0:
+            request = self.queue.popleft()
+            if request[3].done():
+                # Cancelled while waiting
+                self.nQueued -= request[2]
+                continue
+            if request[0] != key or (len(batch) > 0 and nTokens + request[2] > self.maxBatchSize):
+                rest.append(request)
+                continue
+            batch.append(request)
+            nTokens += request[2]
+            self.nQueued -= request[2]
+        self.queue = rest
+        return key, batch, nTokens
+
+    async def run(self):
+        while True:
+            await self.wakeup.wait()
+            if len(self.queue) > 0 and self.nQueued < self.maxBatchSize:
+                # Requests that came in while the previous batch was
+                # processed may have waited long enough already
+                delay = self.queue[0][4] + self.maxWait - self.loop.time()
+                if delay > 0:
+                    try:
+                        await asyncio.wait_for(self.full.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+            self.full.clear()
+            if len(self.queue) <= 0:
+                self.wakeup.clear()
+                continue
+            key, batch, nTokens = self.next_batch()
+            if len(self.queue) <= 0:
+                self.wakeup.clear()
+            if len(batch) <= 0:
+                continue
+            try:
+                results = await self.loop.run_in_executor(self.executor, self.func, key,
+                                                          [request[1] for request in batch])
+            except Exception as err:
+                for request in batch:
+                    if not request[3].done():
+                        request[3].set_exception(err)
+                continue
+            with self.lock:
+                self.nBatches += 1
+                self.nRequests += len(batch)
+                self.nTokens += nTokens
+            for request, result in zip(batch, results):
+                if not request[3].done():
+                    request[3].set_result(result)
+
+    def stats(self):
+        """
+        Return a dictionary with the number of batches, requests and
+        tokens processed so far and the average batch size.
+        """
+        with self.lock:
+            return batch_stats(self.nBatches, self.nRequests, self.nTokens)
+
+    def close(self):
+        """
+        Stop the batching task and the thread. Requests that are
+        still waiting are cancelled.
+        """
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        for request in self.queue:
+            if not request[3].done():
+                request[3].cancel()
+        self.queue.clear()
+        self.nQueued = 0
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
@@ -0,0 +1,96 @@
+import threading
+from collections import OrderedDict
+
+
+def freeze_record(record):
+    """
+    Turn a record returned by wordform2record() into nested tuples,
+    so that cached analyses cannot be modified by the callers.
+    """
+    lemma, gramm, stem, gloss, wfGlossed, wfGlossedStd, glossByLang, otherData, subwords = record
+    return (lemma, gramm, stem, gloss, wfGlossed, wfGlossedStd,
+            tuple(glossByLang.items()),
+            tuple(tuple(kv) for kv in otherData),
+            tuple(freeze_record(sw) for sw in subwords))
+
+
+class AnalysisCache:
+    """
+    Bounded cache of analyses with least-recently-used eviction.
+    Values are stored as tuples of frozen records, and new Wordform
+    objects are built from them on every hit.
+    """
+    def __init__(self, maxSize=10000):
+        self.maxSize = maxSize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """
+        Return the cached value for the key or None.
+        """
+        with self.lock:
+            try:
+                value = self.entries[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if self.maxSize <= 0:
+            return
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxSize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        """
+        Return a dictionary with the cache size and hit statistics.
+        """
+        with self.lock:
+            nRequests = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'max_size': self.maxSize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / nRequests if nRequests > 0 else 0.0
+            }
+
+
+class CachedLookup:
+    """
+    Lookup stage that freezes the records returned by another stage,
+    lookup(word, replacementsAllowed), and keeps them in an AnalysisCache
+    under (word, mode, replacementsAllowed).
+    """
+    def __init__(self, cache, mode, lookup):
+        self.cache = cache
+        self.mode = mode
+        self.lookup = lookup
+
+    def records(self, word, replacementsAllowed=0):
+        key = (word, self.mode, replacementsAllowed)
+        records = self.cache.get(key)
+        if records is None:
+            records = tuple(freeze_record(record)
+                            for record in self.lookup(word, replacementsAllowed=replacementsAllowed))
+            self.cache.put(key, records)
+        return records
@@ -0,0 +1,128 @@
+import re
+import threading
+import time
+
+# Stages of the cascade, in the order they are tried
+CASCADE_STAGES = ('strict', 'nodiacritics', 'replacements')
+rxProperNameTags = re.compile(',(famn|patrn|persn)')
+
+
+def is_bad_correction(word, records):
+    """
+    Check if the analyses (records, see wordform2record()) found for
+    a word with replacements allowed are likely to be wrong corrections,
+    the same way as pre_build.process_unanalyzed() does.
+    """
+    for record in records:
+        lemma, gramm = record[0], record[1]
+        if rxProperNameTags.search(gramm) is not None:
+            # Replacements in proper nouns usually lead to wrongly correcting
+            # proper names that are not in the dictionary
+            return True
+        if word.endswith(('и', 'ы')) and lemma.endswith('а'):
+            # политики recognized as политика (actually words like this come from code switching)
+            return True
+    return False
+
+
+class CascadeStats:
+    """
+    Counts the words that reached each stage of the cascade,
+    the words analyzed there and the time spent on each stage.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.stages = {stage: {'tokens': 0, 'analyzed': 0, 'rejected': 0, 'time': 0.0}
+                           for stage in CASCADE_STAGES}
+
+    def add(self, stage, startTime, analyzed, rejected=False):
+        with self.lock:
+            stageStats = self.stages[stage]
+            stageStats['tokens'] += 1
+            stageStats['time'] += time.perf_counter() - startTime
+            if analyzed:
+                stageStats['analyzed'] += 1
+            if rejected:
+                stageStats['rejected'] += 1
+
+    def merge(self, stages):
+        """
+        Add the counts from another CascadeStats object (its stages
+        attribute), e.g. one from a worker process.
+        """
+        with self.lock:
+            for stage in CASCADE_STAGES:
+                for k in self.stages[stage]:
+                    self.stages[stage][k] += stages[stage][k]
+
+    def stats(self):
+        """
+        Return a dictionary {stage: statistics}. Besides the counts,
+        each stage has the average time per word in milliseconds and
+        the share of the words analyzed at that stage.
+        """
+        with self.lock:
+            stats = {}
+            for stage in CASCADE_STAGES:
+                stageStats = dict(self.stages[stage])
+                nTokens = stageStats['tokens']
+                stageStats['ms_per_token'] = stageStats['time'] * 1000 / nTokens if nTokens > 0 else 0.0
+                stageStats['analyzed_rate'] = stageStats['analyzed'] / nTokens if nTokens > 0 else 0.0
+                stats[stage] = stageStats
+            nTokens = self.stages[CASCADE_STAGES[0]]['tokens']
+            nAnalyzed = sum(self.stages[stage]['analyzed'] for stage in CASCADE_STAGES)
+            stats['total'] = {
+                'tokens': nTokens,
+                'analyzed': nAnalyzed,
+                'time': sum(self.stages[stage]['time'] for stage in CASCADE_STAGES),
+                'recall': nAnalyzed / nTokens if nTokens > 0 else 0.0
+            }
+            return stats
+
+
+class Cascade:
+    """
+    The cascade mode of an analyzer: each word is analyzed with
+    the strict data; if that fails, with the nodiacritics data (a
+    separate analyzer, created with the same options); if that fails
+    too, with the strict data allowing for one replacement.
+    """
+    def __init__(self, analyzer, stats, **options):
+        self.analyzer = analyzer
+        self.stats = stats
+        self.fallback = type(analyzer)(mode='nodiacritics', cache_size=0,
+                                       lexicons=sorted(analyzer.lexicons), **options)
+        # The nodiacritics stage reports to the metrics of the analyzer
+        analyzer.metrics.merge(self.fallback.metrics.state())
+        self.fallback.metrics = analyzer.metrics
+        self.fallback.m.metrics = analyzer.m.metrics
+
+    def records(self, word, replacementsAllowed=0):
+        """
+        Analyze a lowercase word. Each stage is only tried if the
+        previous ones have failed. Analyses with replacements that
+        look like wrong corrections are discarded. Return a list
+        of records.
+        """
+        t1 = time.perf_counter()
+        records = self.analyzer.parse_records(word)
+        self.stats.add('strict', t1, len(records) > 0)
+        if len(records) > 0:
+            return records
+        t1 = time.perf_counter()
+        records = self.fallback.parse_records(word)
+        self.stats.add('nodiacritics', t1, len(records) > 0)
+        if len(records) > 0:
+            return records
+        t1 = time.perf_counter()
+        records = self.analyzer.parse_records(word, replacementsAllowed=max(1, replacementsAllowed))
+        rejected = len(records) > 0 and is_bad_correction(word, records)
+        if rejected:
+            records = []
+        self.stats.add('replacements', t1, len(records) > 0, rejected=rejected)
+        return records
@@ -0,0 +1,232 @@
+try:
+    from importlib.resources import files
+except ImportError:
+    from importlib_resources import files
+import hashlib
+import os
+import shutil
+import subprocess
+import threading
+from uniparser_morph.cg_disambiguate import CGDisambiguator
+
+CG_GRAMMAR_FILE = 'udmurt_disambiguation.cg3'
+FLUSH_COMMAND = b'<STREAMCMD:FLUSH>'
+
+
+def default_cache_dir():
+    """
+    Return the directory for the compiled grammars: uniparser_udmurt
+    in the cache directory of the current user ($XDG_CACHE_HOME or
+    ~/.cache, %LOCALAPPDATA% on Windows).
+    """
+    if os.name == 'nt' and 'LOCALAPPDATA' in os.environ:
+        cacheHome = os.environ['LOCALAPPDATA']
+    elif len(os.environ.get('XDG_CACHE_HOME', '')) > 0:
+        cacheHome = os.environ['XDG_CACHE_HOME']
+    else:
+        cacheHome = os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cacheHome, 'uniparser_udmurt')
+
+
+def find_cg3():
+    """
+    Return the command that runs CG3, or None if it is not installed.
+    The UNIPARSER_UDMURT_CG3 environment variable, if set, takes
+    precedence (e.g. to point to a stub executable).
+    """
+    if 'UNIPARSER_UDMURT_CG3' in os.environ:
+        return os.environ['UNIPARSER_UDMURT_CG3']
+    for name in ('vislcg3', 'cg3'):
+        path = shutil.which(name)
+        if path is not None:
+            return path
+    return None
+
+
+class CGSession(CGDisambiguator):
+    """
+    Constraint Grammar disambiguator that compiles the grammar
+    into the binary CG3 format once and keeps one vislcg3 process
+    running for all subsequent calls. Sentences are streamed to the
+    process through its stdin, and <STREAMCMD:FLUSH> is used to get
+    the output for each call without closing the pipe.
+    If the process dies, it is restarted on the next call. If CG3
+    is not installed, the analyses are left as they are.
+    """
+    def __init__(self, g, dataPackage, executable=None, cacheDir=None):
+        super().__init__(g)
+        if executable is None:
+            executable = find_cg3()
+        if cacheDir is None:
+            cacheDir = default_cache_dir()
+        self.executable = executable
+        self.cacheDir = cacheDir
+        self.dataPackage = dataPackage
+        self.grammarFile = None     # binary grammar (or the source grammar if compilation failed)
+        self.proc = None
+        self.lock = threading.Lock()
+        self.restarts = 0
+
+    def command(self, *args):
+        return [self.executable] + list(args)
+
+    def version(self):
+        """
+        Return the output of vislcg3 --version (empty if it cannot
+        be run), so that grammars compiled by another version of CG3
+        are not reused.
+        """
+        if self.executable is None:
+            return b''
+        try:
+            proc = subprocess.run(self.command('--version'), stdin=subprocess.DEVNULL,
+                                  stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=30)
+        except (OSError, subprocess.TimeoutExpired):
+            return b''
+        return proc.stdout.strip()
+
+    def compile_grammar(self):
+        """
+        Copy the grammar to the cache directory and compile it into
+        the binary format, unless this has been done before.
+        Compiled grammars are named after the hash of the source
+        and the version of CG3, so they are recompiled whenever
+        either changes. The cache directory is only accessible
+        to its owner. Without a CG3 executable, nothing is written
+        and the grammar file is ''.
+        """
+        if self.executable is None:
+            self.grammarFile = ''
+            return
+        grammar = (files(self.dataPackage) / CG_GRAMMAR_FILE).read_bytes()
+        key = hashlib.md5(grammar + b'\n' + self.version()).hexdigest()
+        fnameBase = os.path.join(self.cacheDir, 'udmurt_disambiguation.' + key)
+        fnameSrc = fnameBase + '.cg3'
+        fnameBin = fnameBase + '.cg3b'
+        if os.path.exists(fnameBin):
+            self.grammarFile = fnameBin
+            return
+        os.makedirs(self.cacheDir, mode=0o700, exist_ok=True)
+        if not os.path.exists(fnameSrc):
+            with open(fnameSrc + '.tmp', 'wb') as fOut:
+                fOut.write(grammar)
+            os.replace(fnameSrc + '.tmp', fnameSrc)
+        self.grammarFile = fnameSrc
+        try:
+            proc = subprocess.run(self.command('--grammar', fnameSrc, '--grammar-only',
+                                               '--grammar-bin', fnameBin + '.tmp'),
+                                  stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                  stderr=subprocess.DEVNULL)
+        except OSError:
+            return
+        if proc.returncode == 0 and os.path.exists(fnameBin + '.tmp'):
+            os.replace(fnameBin + '.tmp', fnameBin)
+            self.grammarFile = fnameBin
+
+    def grammar_file(self):
+        """
+        Return the path to the grammar used by the session.
+        """
+        if self.grammarFile is None:
+            self.compile_grammar()
+        return self.grammarFile
+
+    def start(self):
+        """
+        Start the CG3 process. Return True on success.
+        """
+        if self.executable is None:
+            return False
+        try:
+            self.proc = subprocess.Popen(self.command('--grammar', self.grammar_file()),
+                                         stdin=subprocess.PIPE,
+                                         stdout=subprocess.PIPE,
+                                         stderr=subprocess.DEVNULL)
+        except OSError:
+            self.proc = None
+            return False
+        return True
+
+    def close(self):
+        """
+        Stop the CG3 process. The session can still be used after
+        that: a new process is started on the next call.
+        """
+        with self.lock:
+            self.stop()
+
+    def stop(self):
+        if self.proc is None:
+            return
+        try:
+            self.proc.stdin.close()
+            self.proc.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            self.proc.kill()
+            self.proc.wait()
+        self.proc.stdout.close()
+        self.proc = None
+
+    def communicate(self, cgAnalyses):
+        """
+        Send the analyses to the running process and read its output
+        up to the flush command. Return None if the process has died.
+        The input is written in another thread so that large inputs
+        cannot fill up both pipes and block the process.
+        """
+        def write_input():
+            try:
+                self.proc.stdin.write(cgAnalyses.encode('utf-8') + b'\n' + FLUSH_COMMAND + b'\n')
+                self.proc.stdin.flush()
+            except (OSError, ValueError):
+                pass
+
+        writer = threading.Thread(target=write_input, name='uniparser-udmurt-cg3-input', daemon=True)
+        writer.start()
+        lines = []
+        for line in self.proc.stdout:
+            if line.rstrip(b'\r\n') == FLUSH_COMMAND:
+                writer.join()
+                return b''.join(lines).decode('utf-8')
+            lines.append(line)
+        writer.join()
+        return None
+
+    def disambiguate_cg(self, cgAnalyses, cgFile=None):
+        """
+        Disambiguate a string with analyses translated into the CG
+        format. The cgFile argument is ignored: the session always
+        uses its own compiled grammar. Restart the process once if
+        it has crashed. Return a disambiguated string.
+        """
+        if len(cgAnalyses) <= 0:
+            return cgAnalyses
+        with self.lock:
+            for attempt in range(2):
+                if self.proc is None or self.proc.poll() is not None:
+                    if self.proc is not None:
+                        self.stop()
+                        self.restarts += 1
+                    if not self.start():
+                        return cgAnalyses
+                text = self.communicate(cgAnalyses)
+                if text is not None:
+                    return text.replace('\r', '\n').replace('\n\n', '\n')
+                self.stop()
+                self.restarts += 1
+        return cgAnalyses
+
+    def disambiguate_analyses(self, analyses, cgFile=None):
+        """
+        Disambiguate a (possibly nested) list of analysis in place.
+        Do nothing if CG3 is not installed.
+        """
+        if self.executable is None:
+            return
+        super().disambiguate_analyses(analyses, cgFile)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
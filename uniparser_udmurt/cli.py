@@ -0,0 +1,41 @@
+"""
+Command-line options shared by the command-line analyzer (__main__.py)
+and the HTTP server (server.py).
+"""
+from . import UdmurtAnalyzer
+
+
+def add_analyzer_arguments(argParser):
+    """
+    Add the options that choose the grammar and set up
+    the analyzer to an argparse.ArgumentParser.
+    """
+    argParser.add_argument('--mode', default='strict', choices=['strict', 'nodiacritics', 'oldorth', 'cascade'])
+    argParser.add_argument('--normalize', action='store_true',
+                           help='with --mode nodiacritics or oldorth, use the strict grammar and '
+                                'normalize the spelling at lookup time (same analyses, less memory)')
+    argParser.add_argument('--cg-executable', default=None, help='path to vislcg3')
+    argParser.add_argument('--cache-size', type=int, default=10000)
+    argParser.add_argument('--use-index', action='store_true', help='use the precomputed word form index')
+    argParser.add_argument('--lexicons', nargs='*', default=None,
+                           help='lexicon shards to load (names, imit; none for the core lexicon only), '
+                                'or auto to load them when needed (default: all)')
+
+
+def lexicons_arg(values):
+    """
+    Turn the values of the --lexicons option into the lexicons
+    parameter of UdmurtAnalyzer.
+    """
+    if values is None or values != ['auto']:
+        return values
+    return 'auto'
+
+
+def analyzer_from_args(args):
+    """
+    Create an analyzer with the options added by add_analyzer_arguments().
+    """
+    return UdmurtAnalyzer(mode=args.mode, normalize=args.normalize, use_index=args.use_index,
+                          cache_size=args.cache_size, cg_executable=args.cg_executable,
+                          lexicons=lexicons_arg(args.lexicons))
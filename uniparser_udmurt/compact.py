@@ -0,0 +1,364 @@
+import json
+from .wordform_index import wordform2record, record2wordform
+from .cache import freeze_record
+
+COMPACT_VERSION = 2
+COMPACT_MAGIC = b'UDMCOMPACT\n'
+# Each item in a compact file starts with one of these tags
+TAG_STRING = 0
+TAG_ANALYSIS = 1
+TAG_TOKEN = 2
+TAG_SENTENCE_END = 3
+TAG_NEW_BLOCK = 4
+
+
+class CompactAnalysis:
+    """
+    Analysis with the same values as a Wordform object, except for
+    the word form, in slots instead of a dictionary. glossByLang and
+    otherData are tuples of (key, value) pairs, subwords is a tuple
+    of CompactAnalysis objects. The objects are shared between all
+    tokens with the same analysis (see InternTable), so they should
+    not be modified.
+    """
+    __slots__ = ('lemma', 'gramm', 'stem', 'gloss', 'wfGlossed', 'wfGlossedStd',
+                 'glossByLang', 'otherData', 'subwords')
+
+    def __init__(self, lemma, gramm, stem, gloss, wfGlossed, wfGlossedStd, glossByLang, otherData, subwords):
+        self.lemma = lemma
+        self.gramm = gramm
+        self.stem = stem
+        self.gloss = gloss
+        self.wfGlossed = wfGlossed
+        self.wfGlossedStd = wfGlossedStd
+        self.glossByLang = glossByLang
+        self.otherData = otherData
+        self.subwords = subwords
+
+    def __repr__(self):
+        return '<CompactAnalysis ' + str(self.lemma) + ' ' + str(self.gramm) + '>'
+
+    def get(self, key, default=''):
+        """
+        Return the value of an additional field, e.g. 'trans_ru'.
+        """
+        for k, v in self.otherData:
+            if k == key:
+                return v
+        return default
+
+    def record(self):
+        """
+        Return the analysis as a frozen record (see cache.freeze_record()).
+        """
+        return (self.lemma, self.gramm, self.stem, self.gloss, self.wfGlossed, self.wfGlossedStd,
+                self.glossByLang, self.otherData, tuple(sw.record() for sw in self.subwords))
+
+    def to_wordform(self, g, wf):
+        """
+        Return a new Wordform object with the same analysis
+        for the word form wf.
+        """
+        return record2wordform(g, self.record(), wf)
+
+
+class InternTable:
+    """
+    Strings and analyses made by one analyzer. Each distinct string
+    (lemma, tags, gloss, translation etc.) and each distinct analysis
+    is stored once, and all compact analyses refer to these copies.
+    The table grows with the number of distinct analyses seen.
+    """
+    def __init__(self):
+        self.strings = {}
+        self.analyses = {}      # frozen record -> CompactAnalysis
+
+    def __len__(self):
+        return len(self.analyses)
+
+    def clear(self):
+        self.strings = {}
+        self.analyses = {}
+
+    def string(self, s):
+        try:
+            return self.strings[s]
+        except KeyError:
+            self.strings[s] = s
+            return s
+
+    def analysis(self, record):
+        """
+        Return the CompactAnalysis for a frozen record.
+        """
+        try:
+            return self.analyses[record]
+        except KeyError:
+            pass
+        lemma, gramm, stem, gloss, wfGlossed, wfGlossedStd, glossByLang, otherData, subwords = record
+        s = self.string
+        ana = CompactAnalysis(s(lemma), s(gramm), s(stem), s(gloss), s(wfGlossed), s(wfGlossedStd),
+                              tuple((s(k), s(v)) for k, v in glossByLang),
+                              tuple((s(k), s(v)) for k, v in otherData),
+                              tuple(self.analysis(sw) for sw in subwords))
+        # The key refers to the interned strings, not to those of the record
+        self.analyses[ana.record()] = ana
+        return ana
+
+    def from_wordforms(self, analyses):
+        """
+        Return a tuple of CompactAnalysis objects for a list of
+        Wordform objects, leaving out empty analyses.
+        """
+        return tuple(self.analysis(freeze_record(wordform2record(ana)))
+                     for ana in analyses if ana.lemma is not None and len(ana.lemma) > 0)
+
+
+def pack_varint(n, buf):
+    while n >= 0x80:
+        buf.append((n & 0x7f) | 0x80)
+        n >>= 7
+    buf.append(n)
+
+
+class CompactWriter:
+    """
+    Write tokens and their compact analyses to a binary file opened
+    for writing. After the magic string and a JSON header line, the
+    file is a sequence of items, each starting with a tag (see TAG_*)
+    and consisting of variable-length unsigned integers. A string or
+    an analysis is written once, as a separate item, before the first
+    item that uses it, and is referred to by its number afterwards,
+    so the file is written and read in one pass. The numbers are only
+    valid within a block: when more than maxBlockEntries strings and
+    analyses have been written, the next sentence starts a new block,
+    where they are numbered anew, so that memory use does not depend
+    on the size of the file.
+    """
+    def __init__(self, fOut, header=None, bufferSize=1 << 16, maxBlockEntries=1 << 16):
+        self.fOut = fOut
+        self.bufferSize = bufferSize
+        self.maxBlockEntries = maxBlockEntries
+        self.nBlocks = 1
+        self.buf = bytearray()
+        self.stringIds = {}
+        self.analysisIds = {}   # CompactAnalysis -> number (by identity)
+        fullHeader = {'version': COMPACT_VERSION}
+        if header is not None:
+            fullHeader.update(header)
+        fOut.write(COMPACT_MAGIC)
+        fOut.write(json.dumps(fullHeader, ensure_ascii=False, sort_keys=True).encode('utf-8') + b'\n')
+
+    def string_id(self, s):
+        try:
+            return self.stringIds[s]
+        except KeyError:
+            pass
+        bString = s.encode('utf-8')
+        self.buf.append(TAG_STRING)
+        pack_varint(len(bString), self.buf)
+        self.buf += bString
+        self.stringIds[s] = len(self.stringIds)
+        return self.stringIds[s]
+
+    def analysis_id(self, ana):
+        try:
+            return self.analysisIds[ana]
+        except KeyError:
+            pass
+        # Everything the analysis refers to has to be written first
+        values = [self.string_id(ana.lemma), self.string_id(ana.gramm), self.string_id(ana.stem),
+                  self.string_id(ana.gloss), self.string_id(ana.wfGlossed), self.string_id(ana.wfGlossedStd)]
+        for pairs in (ana.glossByLang, ana.otherData):
+            values.append(len(pairs))
+            for k, v in pairs:
+                values += [self.string_id(k), self.string_id(v)]
+        values.append(len(ana.subwords))
+        values += [self.analysis_id(sw) for sw in ana.subwords]
+        self.buf.append(TAG_ANALYSIS)
+        for n in values:
+            pack_varint(n, self.buf)
+        self.analysisIds[ana] = len(self.analysisIds)
+        return self.analysisIds[ana]
+
+    def write_token(self, wf, analyses):
+        """
+        Write a token with a sequence of CompactAnalysis objects
+        (empty if the token was not analyzed).
+        """
+        wfId = self.string_id(wf)
+        anaIds = [self.analysis_id(ana) for ana in analyses]
+        self.buf.append(TAG_TOKEN)
+        pack_varint(wfId, self.buf)
+        pack_varint(len(anaIds), self.buf)
+        for anaId in anaIds:
+            pack_varint(anaId, self.buf)
+        if len(self.buf) >= self.bufferSize:
+            self.flush()
+
+    def block_full(self):
+        return len(self.stringIds) + len(self.analysisIds) >= self.maxBlockEntries
+
+    def start_block(self):
+        """
+        Start a new block: the strings and analyses written so far
+        are forgotten by the writer and by the reader.
+        """
+        self.buf.append(TAG_NEW_BLOCK)
+        self.stringIds = {}
+        self.analysisIds = {}
+        self.nBlocks += 1
+
+    def write_sentence(self, tokens, analyses):
+        """
+        Write the tokens of a sentence with their analyses and mark
+        the end of the sentence. Start a new block first if the
+        current one is full.
+        """
+        if self.block_full():
+            self.start_block()
+        for wf, wordAnalyses in zip(tokens, analyses):
+            self.write_token(wf, wordAnalyses)
+        self.buf.append(TAG_SENTENCE_END)
+        if len(self.buf) >= self.bufferSize:
+            self.flush()
+
+    def flush(self):
+        self.fOut.write(self.buf)
+        self.buf = bytearray()
+
+    def close(self):
+        """
+        Write what is left in the buffer. The file itself is not closed.
+        """
+        self.flush()
+
+
+class CompactReader:
+    """
+    Read a file written by CompactWriter (opened in binary mode)
+    in blocks. Iterating over the reader yields (word form, tuple of
+    CompactAnalysis objects) for each token and None at the end of
+    each sentence. Identical analyses are the same object.
+    """
+    def __init__(self, fIn, blockSize=1 << 20):
+        self.fIn = fIn
+        self.blockSize = blockSize
+        if fIn.read(len(COMPACT_MAGIC)) != COMPACT_MAGIC:
+            raise ValueError('Not a compact analysis file')
+        self.header = json.loads(fIn.readline().decode('utf-8'))
+        # Version 1 is the same format without blocks
+        if self.header.get('version') not in (1, COMPACT_VERSION):
+            raise ValueError('Unsupported compact analysis file version: ' + str(self.header.get('version')))
+        self.strings = []
+        self.analyses = []
+
+    def __iter__(self):
+        data = b''
+        pos = 0
+        while True:
+            if pos >= len(data):
+                data = self.fIn.read(self.blockSize)
+                pos = 0
+                if len(data) <= 0:
+                    return
+            try:
+                item, pos = self.read_item(data, pos)
+            except IndexError:
+                # The item continues in the next block
+                block = self.fIn.read(self.blockSize)
+                if len(block) <= 0:
+                    raise ValueError('Unexpected end of a compact analysis file')
+                data = data[pos:] + block
+                pos = 0
+                continue
+            if item is not False:
+                yield item
+
+    def read_item(self, data, pos):
+        """
+        Read one item starting at pos. Return the token (or None for
+        the end of a sentence, or False for strings and analyses) and
+        the position after the item. Raise IndexError if the data ends
+        in the middle of the item, without changing the tables.
+        """
+        tag = data[pos]
+        pos += 1
+        if tag == TAG_SENTENCE_END:
+            return None, pos
+        if tag == TAG_NEW_BLOCK:
+            self.strings = []
+            self.analyses = []
+            return False, pos
+        values = []
+        if tag == TAG_STRING:
+            length, pos = unpack_varint(data, pos)
+            if pos + length > len(data):
+                raise IndexError()
+            self.strings.append(data[pos:pos + length].decode('utf-8'))
+            return False, pos + length
+        strings = self.strings
+        if tag == TAG_TOKEN:
+            wfId, pos = unpack_varint(data, pos)
+            nAnalyses, pos = unpack_varint(data, pos)
+            for i in range(nAnalyses):
+                anaId, pos = unpack_varint(data, pos)
+                values.append(self.analyses[anaId])
+            return (strings[wfId], tuple(values)), pos
+        if tag == TAG_ANALYSIS:
+            for i in range(6):
+                n, pos = unpack_varint(data, pos)
+                values.append(strings[n])
+            for i in range(2):
+                nPairs, pos = unpack_varint(data, pos)
+                pairs = []
+                for j in range(nPairs):
+                    k, pos = unpack_varint(data, pos)
+                    v, pos = unpack_varint(data, pos)
+                    pairs.append((strings[k], strings[v]))
+                values.append(tuple(pairs))
+            nSubwords, pos = unpack_varint(data, pos)
+            subwords = []
+            for i in range(nSubwords):
+                n, pos = unpack_varint(data, pos)
+                subwords.append(self.analyses[n])
+            values.append(tuple(subwords))
+            self.analyses.append(CompactAnalysis(*values))
+            return False, pos
+        raise ValueError('Unknown item in a compact analysis file: ' + str(tag))
+
+    def tokens(self):
+        """
+        Iterate over (word form, analyses) for all tokens.
+        """
+        for item in self:
+            if item is not None:
+                yield item
+
+    def sentences(self):
+        """
+        Iterate over sentences as lists of (word form, analyses).
+        """
+        sentence = []
+        for item in self:
+            if item is None:
+                yield sentence
+                sentence = []
+            else:
+                sentence.append(item)
+        if len(sentence) > 0:
+            yield sentence
+
+
+def unpack_varint(data, pos):
+    b = data[pos]
+    if b < 0x80:
+        return b, pos + 1
+    n = 0
+    shift = 0
+    while b >= 0x80:
+        n |= (b & 0x7f) << shift
+        shift += 7
+        pos += 1
+        b = data[pos]
+    return n | (b << shift), pos + 1
@@ -0,0 +1,350 @@
+try:
+    from importlib.resources import files, as_file
+except ImportError:
+    from importlib_resources import files, as_file
+import gc
+import hashlib
+import os
+import re
+import time
+from .orthography import variantGenerators
+
+rxLexeme = re.compile('^-lexeme\n(?: [^\r\n]*\n)+', flags=re.MULTILINE)
+rxField = re.compile('^ +([^: \r\n]+) *: *([^\r\n]*)', flags=re.MULTILINE)
+rxPos = re.compile('[^, ]*')
+rxFreqLemma = re.compile('\\bl(?:ex)?="([^\r\n"<>]+)"')
+rxStem = re.compile('^ stem: *([^\r\n]*)', flags=re.MULTILINE)
+rxStemVariant = re.compile('[^ |/]+')
+rxStemEnd = re.compile('[.<>\\[\\]~0-9].*')
+# Groups of lexeme files that go to separate files in the data
+# directories instead of lexemes.txt, so that the analyzer can
+# load them only when needed
+LEXICON_SHARDS = {
+    'names': ('udm_lexemes_N_persn.txt',),
+    'imit': ('udm_lexemes_IMIT.txt',)
+}
+# Words that make lexicons='auto' load each shard if they are not
+# analyzed with the lexicons loaded so far: capitalized words for
+# the names, words that start with an imitative stem for the imitatives
+AUTO_LEXICONS = {
+    'names': lambda shards, word: word[:1].isupper(),
+    'imit': lambda shards, word: shards.shard_stems('imit').matches(word)
+}
+
+
+def lexicon_shard(fname):
+    """
+    Return the name of the shard the lexeme file belongs to,
+    or None if it belongs to the core lexicon.
+    """
+    fname = os.path.basename(fname)
+    for shard, fnames in LEXICON_SHARDS.items():
+        if fname in fnames:
+            return shard
+    return None
+
+
+def shard_file(shard):
+    """
+    Return the name of the file in the data directories where
+    the lexemes of a shard are written (lexemes.txt for the core).
+    """
+    if shard is None:
+        return 'lexemes.txt'
+    return 'lexemes_' + shard + '.txt'
+
+
+class StemPrefixes:
+    """
+    The beginnings of the stems of a lexicon shard (everything up
+    to the first dot or other metacharacter), lowercase. Used to check
+    quickly whether a word may be analyzed with one of its lexemes,
+    which is only possible if it starts with a stem. Stems are grouped
+    by their first prefixLength characters.
+    """
+    def __init__(self, stems, prefixLength=4):
+        self.prefixLength = prefixLength
+        self.stems = {}
+        for stem in stems:
+            try:
+                self.stems[stem[:prefixLength]].add(stem)
+            except KeyError:
+                self.stems[stem[:prefixLength]] = {stem}
+        self.lengths = sorted(set(len(prefix) for prefix in self.stems))
+
+    def __len__(self):
+        return sum(len(stems) for stems in self.stems.values())
+
+    def matches(self, word):
+        word = word.lower()
+        for length in self.lengths:
+            for stem in self.stems.get(word[:length], ()):
+                if word.startswith(stem):
+                    return True
+        return False
+
+
+def read_stems(fname):
+    """
+    Return the set of the beginnings of all stem variants of the lexemes
+    in a grammar file (see StemPrefixes), lowercase.
+    """
+    with open(fname, 'r', encoding='utf-8-sig') as fIn:
+        text = fIn.read()
+    stems = set()
+    for stemField in rxStem.findall(text):
+        for stem in rxStemVariant.findall(stemField):
+            stems.add(rxStemEnd.sub('', stem).lower())
+    return stems
+
+
+class LexiconShards:
+    """
+    The lexicon shards (see LEXICON_SHARDS) of an analyzer: the ones
+    loaded into its grammar and parser and, with lexicons='auto', the
+    ones still waiting to be loaded when a word needs them.
+    """
+    def __init__(self, analyzer, lexicons=None):
+        self.analyzer = analyzer
+        self.loaded = set()
+        self.lazy = []          # shards to load when needed
+        self.stems = {}         # shard -> StemPrefixes
+        if lexicons is None:
+            lexicons = sorted(LEXICON_SHARDS)
+        elif lexicons == 'auto':
+            self.lazy = sorted(LEXICON_SHARDS)
+            lexicons = []
+        for shard in lexicons:
+            if shard not in LEXICON_SHARDS:
+                raise ValueError('Unknown lexicon: ' + str(shard))
+        self.requested = list(lexicons)
+
+    def load(self, shard):
+        """
+        Add a shard to the grammar and the parser of the analyzer.
+        The analyses are then the same as if it had been loaded from
+        the start. Return True if the shard has been loaded now, False
+        if it had been loaded before.
+        """
+        if shard not in LEXICON_SHARDS:
+            raise ValueError('Unknown lexicon: ' + str(shard))
+        if shard in self.loaded:
+            return False
+        a = self.analyzer
+        t1 = time.perf_counter()
+        a.initialize_parser()
+        nLexemes = len(a.g.lexemes)
+        paradigms = set(a.g.paradigms)
+        gcEnabled = gc.isenabled()
+        # Nothing created here is garbage, and each full collection
+        # has to go through the millions of objects of the grammar
+        gc.disable()
+        try:
+            with as_file(files(a.dirName) / shard_file(shard)) as fname:
+                a.g.load_lexemes([str(fname)])
+            lexemes = a.g.lexemes[nLexemes:]
+            # Same as what Grammar.load_derivations() and Grammar.compile_all()
+            # do for the lexemes loaded with the rest of the grammar
+            for lex in lexemes:
+                if len(a.g.derivations) > 0:
+                    lex.add_derivations()
+                lex.generate_redupl_paradigm()
+                lex.generate_regex_paradigm()
+                for sl in lex.subLexemes:
+                    try:
+                        a.g.lexByParadigm[sl.paradigm].append((lex, sl))
+                    except KeyError:
+                        a.g.lexByParadigm[sl.paradigm] = [(lex, sl)]
+            a.m.add_lexemes(lexemes, [p for p in a.g.paradigms if p not in paradigms])
+        finally:
+            if gcEnabled:
+                gc.enable()
+        self.loaded.add(shard)
+        if shard in self.lazy:
+            self.lazy.remove(shard)
+        a.m.dictParses = {}
+        a.metrics.add_time('load', time.perf_counter() - t1)
+        return True
+
+    def load_for(self, word):
+        """
+        Load the shards waiting to be loaded that may contain the
+        analyses of a word not analyzed so far (see AUTO_LEXICONS).
+        Return True if anything has been loaded.
+        """
+        shards = [shard for shard in self.lazy if AUTO_LEXICONS[shard](self, word)]
+        for shard in shards:
+            self.analyzer.load_lexicon(shard)
+        return len(shards) > 0
+
+    def word_records(self, word, replacementsAllowed=0):
+        """
+        Same as UdmurtAnalyzer.word_records(), but if the word is not
+        analyzed without replacements, first load the shards it may need.
+        """
+        a = self.analyzer
+        lowercase = word.lower()
+        records = a.lookup_records(lowercase)
+        if len(records) <= 0 and self.load_for(word):
+            records = a.lookup_records(lowercase)
+        # A host without analyses is searched with replacements even
+        # if another host of the word has some (see Parser.parse()),
+        # so these analyses cannot be reused
+        if replacementsAllowed > 0:
+            records = a.lookup_records(lowercase, replacementsAllowed=replacementsAllowed)
+        return records
+
+    def shard_stems(self, shard):
+        """
+        Return the stems of a shard as a StemPrefixes object. With
+        normalize=True, the non-standard spellings of the stems are added.
+        """
+        try:
+            return self.stems[shard]
+        except KeyError:
+            pass
+        a = self.analyzer
+        with as_file(files(a.dirName) / shard_file(shard)) as fname:
+            stems = read_stems(str(fname))
+        if a.normalize:
+            stems = set(variant for stem in stems for variant in variantGenerators[a.mode].variants(stem))
+        self.stems[shard] = StemPrefixes(stems)
+        return self.stems[shard]
+
+
+class Lexeme:
+    """
+    One -lexeme entry of a lexeme file. text is the entry as it
+    is written in the file, from the -lexeme line up to the first
+    line that does not start with a space. line is the number of
+    the -lexeme line in the file (starting from 1). The fields are
+    only split when they are first needed.
+    """
+    __slots__ = ('fname', 'line', 'text', '_fields', '_values', '_row')
+
+    def __init__(self, fname, line, text, row=None):
+        self.fname = fname
+        self.line = line
+        self.text = text
+        self._fields = None
+        self._values = None
+        self._row = row
+
+    def __repr__(self):
+        return '<Lexeme ' + self.fname + ':' + str(self.line) + ' ' + self.value('lex') + '>'
+
+    @property
+    def fields(self):
+        """
+        List of (key, value) pairs in the order they are written in.
+        Values are stripped of the surrounding spaces.
+        """
+        if self._fields is None:
+            fields = []
+            values = {}
+            for key, value in rxField.findall(self.text):
+                value = value.rstrip(' ')
+                fields.append((key, value))
+                try:
+                    values[key].append(value)
+                except KeyError:
+                    values[key] = [value]
+            self._fields = fields
+            self._values = values
+        return self._fields
+
+    def values(self, key):
+        if self._values is None:
+            self.fields
+        return self._values.get(key, [])
+
+    def value(self, key, default=''):
+        values = self.values(key)
+        if len(values) <= 0:
+            return default
+        return values[0]
+
+    @property
+    def lemma(self):
+        return ' / '.join(self.values('lex'))
+
+    @property
+    def pos(self):
+        """
+        The first tag of the first gramm field.
+        """
+        return rxPos.match(self.value('gramm')).group(0)
+
+    @property
+    def grdic(self):
+        """
+        Everything after the part of speech in the first gramm
+        field that has other tags.
+        """
+        for gramm in self.values('gramm'):
+            pos = rxPos.match(gramm).group(0)
+            if gramm[len(pos):].startswith(','):
+                return gramm[len(pos) + 1:]
+        return ''
+
+    @property
+    def stem(self):
+        return self.value('stem').strip()
+
+    @property
+    def paradigms(self):
+        return self.values('paradigm')
+
+    @property
+    def trans_ru(self):
+        return ' / '.join(self.values('trans_ru'))
+
+    @property
+    def trans_en(self):
+        return ' / '.join(self.values('trans_en'))
+
+    def table_row(self):
+        """
+        Return the fields used in the CSV tables: lemma, part of speech,
+        other dictionary tags, stem, paradigms, Russian and English
+        translations.
+        """
+        if self._row is None:
+            self._row = (self.lemma, self.pos, self.grdic, self.stem,
+                         ' / '.join(self.paradigms), self.trans_ru, self.trans_en)
+        return list(self._row)
+
+
+def iter_lexemes(fname, blockSize=1 << 20):
+    """
+    Read a lexeme file block by block and yield a Lexeme object
+    for each -lexeme entry that has at least one field.
+    """
+    with open(fname, 'r', encoding='utf-8-sig') as fIn:
+        rest = ''
+        lineNo = 1      # number of the first line of rest
+        while True:
+            block = fIn.read(blockSize)
+            if len(block) > 0:
+                text = rest + block + fIn.readline()
+                # The last entry in the block may continue in the next one
+                end = text.rfind('\n-lexeme\n') + 1
+            else:
+                text = rest
+                if len(text) > 0 and not text.endswith('\n'):
+                    text += '\n'
+                end = len(text)
+            pos = 0
+            for m in rxLexeme.finditer(text, 0, end):
+                lineNo += text.count('\n', pos, m.start())
+                pos = m.start()
+                yield Lexeme(fname, lineNo, m.group(0))
+            if len(block) <= 0:
+                return
+            lineNo += text.count('\n', pos, end)
+            rest = text[end:]
+
+
+def file_digest(fname):
+    with open(fname, 'rb') as fIn:
+        return hashlib.md5(fIn.read()).hexdigest()
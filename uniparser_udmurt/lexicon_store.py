@@ -0,0 +1,225 @@
+import os
+import re
+import sqlite3
+from .lexicon import Lexeme, iter_lexemes, file_digest, rxFreqLemma
+
+LEXICON_STORE_VERSION = 1
+LEXICON_STORE_FILE = 'lexicon.sqlite'
+rxFreqWf = re.compile('>([^\r\n<>]+)</w>')
+
+
+def read_lemma_freqs(fnameWordlist, fnameAnalyzed):
+    """
+    Return a dictionary {lemma: frequency} with the total frequencies
+    of all word forms from the frequency list (tab-delimited word
+    and frequency) that have an analysis with that lemma in the
+    analyzed word list, and the number of analyzed words that are
+    not in the frequency list.
+    """
+    wfFreqs = {}
+    lemmaFreqs = {}
+    nMissing = 0
+    with open(fnameWordlist, 'r', encoding='utf-8-sig') as fWordlist:
+        for line in fWordlist:
+            if '\t' not in line:
+                continue
+            wf, freq = line.strip('\r\n').split('\t')
+            wfFreqs[wf] = int(freq)
+    with open(fnameAnalyzed, 'r', encoding='utf-8-sig') as fAnalyzed:
+        for line in fAnalyzed:
+            mWf = rxFreqWf.search(line)
+            if mWf is None:
+                continue
+            try:
+                freq = wfFreqs[mWf.group(1)]
+            except KeyError:
+                nMissing += 1
+                continue
+            for lemma in rxFreqLemma.findall(line):
+                lemmaFreqs[lemma] = lemmaFreqs.get(lemma, 0) + freq
+    return lemmaFreqs, nMissing
+
+
+class LexiconStore:
+    """
+    SQLite database with the lexemes from the lexeme files, indexed
+    by lemma, part of speech, stem, paradigm and full text, and with
+    the lemma frequencies counted in the analyzed word list.
+    update() only reads the files that have changed since they were
+    last stored, so that looking up lexemes or duplicates in large
+    files does not require parsing them every time.
+    """
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        CREATE TABLE IF NOT EXISTS sources (fname TEXT PRIMARY KEY, digest TEXT);
+        CREATE TABLE IF NOT EXISTS lexemes (
+            id INTEGER PRIMARY KEY, fname TEXT, line INTEGER, text TEXT,
+            lemma TEXT, pos TEXT, grdic TEXT, stem TEXT, paradigm TEXT, trans_ru TEXT, trans_en TEXT);
+        CREATE TABLE IF NOT EXISTS paradigms (lexeme INTEGER, paradigm TEXT);
+        CREATE TABLE IF NOT EXISTS lemma_freqs (lemma TEXT PRIMARY KEY, freq INTEGER);
+        CREATE INDEX IF NOT EXISTS lexemes_fname ON lexemes (fname, line);
+        CREATE INDEX IF NOT EXISTS lexemes_text ON lexemes (text);
+        CREATE INDEX IF NOT EXISTS lexemes_lemma ON lexemes (lemma, pos);
+        CREATE INDEX IF NOT EXISTS lexemes_pos ON lexemes (pos);
+        CREATE INDEX IF NOT EXISTS lexemes_stem ON lexemes (stem);
+        CREATE INDEX IF NOT EXISTS paradigms_paradigm ON paradigms (paradigm);
+        CREATE INDEX IF NOT EXISTS paradigms_lexeme ON paradigms (lexeme);
+    """
+
+    def __init__(self, fname=LEXICON_STORE_FILE):
+        self.fname = fname
+        self.db = sqlite3.connect(fname)
+        if self.stored_version() not in (None, LEXICON_STORE_VERSION):
+            # Written by another version of this code: start from scratch
+            self.db.close()
+            os.remove(fname)
+            self.db = sqlite3.connect(fname)
+        with self.db:
+            self.db.executescript(self.SCHEMA)
+            self.db.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                            ('version', str(LEXICON_STORE_VERSION)))
+            self.db.execute('PRAGMA user_version = ' + str(LEXICON_STORE_VERSION))
+
+    def stored_version(self):
+        """
+        Return the version of the store in the opened file, or None
+        if the file is empty. Raise ValueError if the file is not
+        a lexicon store, so that it is never overwritten.
+        """
+        try:
+            tables = [row[0] for row in self.db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+            if len(tables) <= 0:
+                return None
+            userVersion = self.db.execute('PRAGMA user_version').fetchone()[0]
+            row = None
+            if 'meta' in tables:
+                row = self.db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        except sqlite3.DatabaseError:
+            row = None
+        if row is None or not row[0].isdigit() or userVersion not in (0, int(row[0])):
+            # Stores of version 1 did not set user_version
+            self.db.close()
+            raise ValueError(self.fname + ' exists and is not a lexicon store')
+        return int(row[0])
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def update(self, fnames):
+        """
+        Store the lexemes from the given lexeme files, reading only the
+        files that are not in the store yet or have changed since.
+        Return the list of files that were read.
+        """
+        updated = []
+        for fname in fnames:
+            digest = file_digest(fname)
+            row = self.db.execute('SELECT digest FROM sources WHERE fname = ?', (fname,)).fetchone()
+            if row is not None and row[0] == digest:
+                continue
+            with self.db:
+                self.db.execute('DELETE FROM paradigms WHERE lexeme IN '
+                                '(SELECT id FROM lexemes WHERE fname = ?)', (fname,))
+                self.db.execute('DELETE FROM lexemes WHERE fname = ?', (fname,))
+                lexemeRows = []
+                paradigmRows = []
+                lexemeId = self.db.execute('SELECT COALESCE(MAX(id), 0) FROM lexemes').fetchone()[0]
+                for lexeme in iter_lexemes(fname):
+                    lexemeId += 1
+                    lexemeRows.append((lexemeId, fname, lexeme.line, lexeme.text) + tuple(lexeme.table_row()))
+                    paradigmRows += [(lexemeId, p) for p in lexeme.paradigms]
+                self.db.executemany('INSERT INTO lexemes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', lexemeRows)
+                self.db.executemany('INSERT INTO paradigms VALUES (?, ?)', paradigmRows)
+                self.db.execute('INSERT OR REPLACE INTO sources VALUES (?, ?)', (fname, digest))
+            updated.append(fname)
+        return updated
+
+    def update_frequencies(self, fnameWordlist='wordlists/wordlist.csv',
+                           fnameAnalyzed='wordlists/wordlist_analyzed.txt'):
+        """
+        Count the lemma frequencies again if the frequency list or the
+        analyzed word list have changed. Return the number of analyzed
+        words that are not in the frequency list, or None if nothing
+        had to be counted.
+        """
+        digest = file_digest(fnameWordlist) + ' ' + file_digest(fnameAnalyzed)
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'frequencies'").fetchone()
+        if row is not None and row[0] == digest:
+            return None
+        lemmaFreqs, nMissing = read_lemma_freqs(fnameWordlist, fnameAnalyzed)
+        with self.db:
+            self.db.execute('DELETE FROM lemma_freqs')
+            self.db.executemany('INSERT INTO lemma_freqs VALUES (?, ?)', lemmaFreqs.items())
+            self.db.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', ('frequencies', digest))
+        return nMissing
+
+    def lemma_freqs(self):
+        return dict(self.db.execute('SELECT lemma, freq FROM lemma_freqs'))
+
+    def lexemes(self, fnames=None, lemma=None, pos=None, stem=None, paradigm=None):
+        """
+        Return the stored lexemes that match all given conditions,
+        as Lexeme objects, in the order of files and lines.
+        """
+        conditions = []
+        params = []
+        if fnames is not None:
+            conditions.append('fname IN (' + ', '.join('?' * len(fnames)) + ')')
+            params += fnames
+        for column, value in (('lemma', lemma), ('pos', pos), ('stem', stem)):
+            if value is not None:
+                conditions.append(column + ' = ?')
+                params.append(value)
+        if paradigm is not None:
+            conditions.append('id IN (SELECT lexeme FROM paradigms WHERE paradigm = ?)')
+            params.append(paradigm)
+        query = ('SELECT fname, line, text, lemma, pos, grdic, stem, paradigm, trans_ru, trans_en '
+                 'FROM lexemes')
+        if len(conditions) > 0:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY fname, line'
+        return [Lexeme(row[0], row[1], row[2], row=row[3:]) for row in self.db.execute(query, params)]
+
+    def entries(self, fname):
+        """
+        Return the line numbers and texts of the lexemes of one file
+        as (line, text) tuples in the order of lines, without making
+        Lexeme objects of them.
+        """
+        return self.db.execute('SELECT line, text FROM lexemes WHERE fname = ? ORDER BY line', (fname,)).fetchall()
+
+    def texts(self, fnames):
+        """
+        Return the set of texts of all lexemes in the given files.
+        """
+        query = 'SELECT DISTINCT text FROM lexemes WHERE fname IN (' + ', '.join('?' * len(fnames)) + ')'
+        return set(row[0] for row in self.db.execute(query, fnames))
+
+    def duplicates(self, fnames=None):
+        """
+        Return a list of lexemes that are written more than once
+        (in the given files), as lists of (file name, line number)
+        of all their occurrences.
+        """
+        query = 'SELECT fname, line, text FROM lexemes'
+        params = []
+        if fnames is not None:
+            query += ' WHERE fname IN (' + ', '.join('?' * len(fnames)) + ')'
+            params = fnames
+        query = ('SELECT l.fname, l.line, l.text FROM (' + query + ') l JOIN (SELECT text FROM ('
+                 + query + ') GROUP BY text HAVING COUNT(*) > 1) d ON l.text = d.text '
+                 'ORDER BY l.text, l.fname, l.line')
+        duplicates = []
+        prevText = None
+        for fname, line, text in self.db.execute(query, params * 2):
+            if text != prevText:
+                duplicates.append([])
+                prevText = text
+            duplicates[-1].append((fname, line))
+        return duplicates
@@ -0,0 +1,223 @@
+import collections
+import threading
+import time
+
+# Stages whose time is measured. 'analysis' is the total time spent
+# on analyzing tokens, 'replacements', 'bad_analyses' and 'lex_rules' are parts of it.
+STAGES = ('load', 'analysis', 'replacements', 'bad_analyses', 'lex_rules', 'disambiguation', 'formatting')
+COUNTERS = ('tokens', 'analyses', 'unanalyzed', 'replacement_attempts', 'replacement_successes')
+PROMETHEUS_PREFIX = 'uniparser_udmurt_'
+
+
+class Metrics:
+    """
+    Timers and counters for the stages of the analysis.
+    Each timer has the number of calls and the total time
+    in seconds. Updating them only takes an addition, so they
+    are always on. They are not locked: if several threads
+    analyze with the same analyzer, use LockedMetrics.
+    """
+    def __init__(self):
+        self.counters = {}
+        self.timers = {}
+        self.clear()
+
+    def clear(self):
+        self.counters = {k: 0 for k in COUNTERS}
+        self.timers = {stage: [0, 0.0] for stage in STAGES}
+
+    def count(self, counter, n=1):
+        self.counters[counter] += n
+
+    def add_time(self, stage, seconds, n=1):
+        timer = self.timers[stage]
+        timer[0] += n
+        timer[1] += seconds
+
+    def add_token(self, nAnalyses, seconds):
+        """
+        Record the analysis of one token that took the given time
+        and produced nAnalyses analyses (0 if it was not analyzed).
+        """
+        self.counters['tokens'] += 1
+        self.counters['analyses'] += nAnalyses
+        if nAnalyses <= 0:
+            self.counters['unanalyzed'] += 1
+        timer = self.timers['analysis']
+        timer[0] += 1
+        timer[1] += seconds
+
+    def state(self):
+        """
+        Return the raw counts, which can be passed to merge()
+        in another process.
+        """
+        return dict(self.counters), {stage: list(timer) for stage, timer in self.timers.items()}
+
+    def merge(self, state):
+        """
+        Add the counts returned by state() of another Metrics object,
+        e.g. one from a worker process.
+        """
+        counters, timers = state
+        for k in COUNTERS:
+            self.counters[k] += counters[k]
+        for stage in STAGES:
+            self.timers[stage][0] += timers[stage][0]
+            self.timers[stage][1] += timers[stage][1]
+
+    def snapshot(self):
+        """
+        Return a dictionary with the counters, the timers
+        ({stage: {'calls': ..., 'seconds': ...}}) and the derived
+        values: analyses per token, unanalyzed rate and average
+        analysis time per token in milliseconds.
+        """
+        counters, timers = self.state()
+        nTokens = counters['tokens']
+        return {
+            'time': time.time(),
+            'counters': counters,
+            'timers': {stage: {'calls': timer[0], 'seconds': timer[1]} for stage, timer in timers.items()},
+            'analyses_per_token': counters['analyses'] / nTokens if nTokens > 0 else 0.0,
+            'unanalyzed_rate': counters['unanalyzed'] / nTokens if nTokens > 0 else 0.0,
+            'ms_per_token': timers['analysis'][1] * 1000 / nTokens if nTokens > 0 else 0.0
+        }
+
+
+class LockedMetrics(Metrics):
+    """
+    Metrics that take a lock on every update, for an analyzer
+    used by several threads at once.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        super().__init__()
+
+    def clear(self):
+        with self.lock:
+            super().clear()
+
+    def count(self, counter, n=1):
+        with self.lock:
+            super().count(counter, n=n)
+
+    def add_time(self, stage, seconds, n=1):
+        with self.lock:
+            super().add_time(stage, seconds, n=n)
+
+    def add_token(self, nAnalyses, seconds):
+        with self.lock:
+            super().add_token(nAnalyses, seconds)
+
+    def state(self):
+        with self.lock:
+            return super().state()
+
+    def merge(self, state):
+        with self.lock:
+            super().merge(state)
+
+
+class LatencyWindow:
+    """
+    Latencies (in seconds) of the last maxSize requests,
+    for percentiles that reflect the current load.
+    """
+    QUANTILES = (0.5, 0.9, 0.95, 0.99)
+
+    def __init__(self, maxSize=10000):
+        self.lock = threading.Lock()
+        self.latencies = collections.deque(maxlen=maxSize)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, seconds):
+        with self.lock:
+            self.latencies.append(seconds)
+            self.count += 1
+            self.total += seconds
+
+    def quantiles(self):
+        """
+        Return a dictionary {quantile: latency in seconds} for the
+        requests in the window (nearest-rank method).
+        """
+        with self.lock:
+            latencies = sorted(self.latencies)
+        if len(latencies) <= 0:
+            return {q: 0.0 for q in self.QUANTILES}
+        return {q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] for q in self.QUANTILES}
+
+    def snapshot(self):
+        """
+        Return a dictionary with the number of requests, the mean and
+        maximal latency and the percentiles (p50, p90...), in milliseconds.
+        """
+        quantiles = self.quantiles()
+        with self.lock:
+            snapshot = {
+                'requests': self.count,
+                'mean_ms': self.total * 1000 / self.count if self.count > 0 else 0.0,
+                'max_ms': max(self.latencies) * 1000 if len(self.latencies) > 0 else 0.0
+            }
+        for q, seconds in quantiles.items():
+            snapshot['p' + str(round(q * 100)) + '_ms'] = seconds * 1000
+        return snapshot
+
+
+def prometheus_labels(labels):
+    if len(labels) <= 0:
+        return ''
+    return '{' + ','.join(k + '="' + str(v).replace('\\', '\\\\').replace('"', '\\"') + '"'
+                          for k, v in sorted(labels.items())) + '}'
+
+
+def prometheus_text(snapshot, labels=None, cacheStats=None):
+    """
+    Return a snapshot (see Metrics.snapshot()) in the Prometheus
+    text exposition format. labels is a dictionary of labels added
+    to every sample, e.g. {'mode': 'strict'}.
+    """
+    if labels is None:
+        labels = {}
+    lines = []
+
+    def add_metric(name, metricType, helpText, samples):
+        lines.append('# HELP ' + PROMETHEUS_PREFIX + name + ' ' + helpText)
+        lines.append('# TYPE ' + PROMETHEUS_PREFIX + name + ' ' + metricType)
+        for sampleLabels, value in samples:
+            lines.append(PROMETHEUS_PREFIX + name + prometheus_labels(dict(labels, **sampleLabels))
+                         + ' ' + repr(float(value)))
+
+    for counter in COUNTERS:
+        add_metric(counter + '_total', 'counter', 'Number of ' + counter.replace('_', ' ') + '.',
+                   [({}, snapshot['counters'][counter])])
+    add_metric('stage_calls_total', 'counter', 'Number of times each stage was run.',
+               [({'stage': stage}, snapshot['timers'][stage]['calls']) for stage in STAGES])
+    add_metric('stage_seconds_total', 'counter', 'Time spent on each stage.',
+               [({'stage': stage}, snapshot['timers'][stage]['seconds']) for stage in STAGES])
+    add_metric('analyses_per_token', 'gauge', 'Average number of analyses per token.',
+               [({}, snapshot['analyses_per_token'])])
+    add_metric('unanalyzed_rate', 'gauge', 'Share of tokens without analyses.',
+               [({}, snapshot['unanalyzed_rate'])])
+    if cacheStats is not None:
+        for k in ('hits', 'misses', 'evictions'):
+            add_metric('cache_' + k + '_total', 'counter', 'Analysis cache ' + k + '.', [({}, cacheStats[k])])
+        add_metric('cache_size', 'gauge', 'Number of words in the analysis cache.', [({}, cacheStats['size'])])
+    return '\n'.join(lines) + '\n'
+
+
+def prometheus_latency(latencies, name='request_latency_seconds', labels=None):
+    """
+    Return the latencies in a LatencyWindow as a Prometheus summary.
+    """
+    if labels is None:
+        labels = {}
+    name = PROMETHEUS_PREFIX + name
+    lines = ['# HELP ' + name + ' Request latency.', '# TYPE ' + name + ' summary']
+    for q, seconds in latencies.quantiles().items():
+        lines.append(name + prometheus_labels(dict(labels, quantile=str(q))) + ' ' + repr(float(seconds)))
+    lines.append(name + '_sum' + prometheus_labels(labels) + ' ' + repr(float(latencies.total)))
+    lines.append(name + '_count' + prometheus_labels(labels) + ' ' + repr(float(latencies.count)))
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,366 @@
+import re
+
+rxPartSeparators = re.compile('[-=~<>{}\\[\\]]')
+rxStemMetachars = re.compile('[.|<>\\[\\]~0-9]')
+
+# For each non-standard orthography: character in the input ->
+# characters of the standard orthography it may stand for.
+# These are passed to the parser as character equivalences,
+# which makes stem and affix lookup orthography-insensitive.
+charEquivalences = {
+    'nodiacritics': {
+        'и': {'ӥ'},
+        'о': {'ӧ'},
+        'ж': {'ӝ'},
+        'з': {'ӟ'},
+        'ч': {'ӵ'},
+        'е': {'ё'}
+    },
+    'oldorth': {
+        "'": {'ъ'},
+        '‘': {'ъ'},
+        '’': {'ъ'},
+        'ь': {'ъ'},
+        'э': {'е'},
+        'е': {'ё'},
+        'і': {'и'},
+        'i': {'и'}
+    }
+}
+
+
+consonants = 'бвгжӟӝйкмпрфхцчӵшщ'
+vowels = 'аеёиӥоӧуыэюя'
+
+
+class SpellingRule:
+    """
+    Replacement of single characters, optionally only after one of
+    the characters in left and/or before one of the characters in right.
+    Rules without context are applied with str.replace(), the rest
+    are compiled into regexes.
+    """
+    def __init__(self, replacements, left=None, right=None):
+        self.replacements = replacements
+        self.left = left
+        self.right = right
+        self.rx = None
+        if left is not None or right is not None or any(c in replacements for c in replacements.values()):
+            pattern = '[' + re.escape(''.join(replacements)) + ']'
+            if left is not None:
+                pattern = '(?<=[' + re.escape(left) + '])' + pattern
+            if right is not None:
+                pattern += '(?=[' + re.escape(right) + '])'
+            self.rx = re.compile(pattern)
+
+    def apply(self, morph):
+        if self.rx is None:
+            for c in self.replacements:
+                if c in morph:
+                    morph = morph.replace(c, self.replacements[c])
+            return morph
+        if not any(c in morph for c in self.replacements):
+            return morph
+        return self.rx.sub(lambda m: self.replacements[m.group(0)], morph)
+
+
+spellingRules = {
+    'no_diacritics': SpellingRule({'ӥ': 'и', 'ӧ': 'о', 'ӝ': 'ж', 'ӟ': 'з', 'ӵ': 'ч', 'ё': 'е'}),
+    'yer_soft': SpellingRule({'ъ': 'ь'}, left=consonants, right='яеёюи'),
+    'yer_apostrophe': SpellingRule({'ъ': "'"}),
+    'yer_left_quote': SpellingRule({'ъ': '‘'}),
+    'yer_right_quote': SpellingRule({'ъ': '’'}),
+    'e_hard': SpellingRule({'е': 'э'}, left=consonants),
+    'yo_e': SpellingRule({'ё': 'е'}),
+    'i_cyrillic': SpellingRule({'и': 'і'}, right=vowels),
+    'i_latin': SpellingRule({'и': 'i'}, right=vowels)
+}
+
+# For each non-standard orthography, the spellings of a stem or an
+# inflection: each is produced by applying a chain of rules to the
+# standard spelling.
+variantChains = {
+    'nodiacritics': [
+        (),
+        ('no_diacritics',)
+    ],
+    'oldorth': [
+        (),
+        ('yer_soft', 'yer_apostrophe', 'e_hard'),
+        ('yer_soft', 'yer_right_quote', 'e_hard'),
+        ('yer_apostrophe', 'e_hard'),
+        ('yer_right_quote', 'e_hard'),
+        ('yer_soft', 'e_hard'),
+        ('e_hard',),
+        ('yer_soft', 'yer_apostrophe'),
+        ('yer_soft', 'yer_left_quote'),
+        ('yer_soft', 'yer_right_quote'),
+        ('yer_apostrophe',),
+        ('yer_left_quote',),
+        ('yer_right_quote',),
+        ('yer_apostrophe', 'yo_e'),
+        ('yer_left_quote', 'yo_e'),
+        ('yer_right_quote', 'yo_e'),
+        ('yer_soft', 'yer_apostrophe', 'yo_e'),
+        ('yer_soft', 'yer_left_quote', 'yo_e'),
+        ('yer_soft', 'yer_right_quote', 'yo_e'),
+        ('i_cyrillic',),
+        ('i_latin',),
+        ('i_cyrillic', 'yo_e'),
+        ('i_latin', 'yo_e')
+    ]
+}
+
+
+class VariantGenerator:
+    """
+    Generates all spellings of a stem or an inflection in a
+    non-standard orthography according to variantChains.
+    The chains are compiled into a plan for each combination of
+    characters the rules may touch: rules that cannot apply are left
+    out, identical chains are merged, and chains that start with the
+    same rules share the intermediate results. Morphs without any such
+    characters are returned as they are. Results are memoized, since
+    the same stems and inflections recur many times.
+    """
+    def __init__(self, orthography):
+        self.chains = [[spellingRules[ruleName] for ruleName in chain]
+                       for chain in variantChains[orthography]]
+        self.triggers = set()
+        for chain in self.chains:
+            for rule in chain:
+                self.triggers |= set(rule.replacements)
+        self.triggers = ''.join(sorted(self.triggers))
+        self.rxTriggers = re.compile('[' + re.escape(self.triggers) + ']')
+        # In the grammar files, diacriticless spellings follow
+        # the standard one, and old spellings are sorted.
+        self.sortVariants = (orthography != 'nodiacritics')
+        self.plans = {}         # characters present in the morph -> (steps, chainEnds)
+        self.memo = {}          # morph -> tuple of its spellings
+        self.memoJoined = {}    # morph -> its spellings joined with //
+
+    def compile_plan(self, present):
+        """
+        Return a list of steps and the indices of the steps where the
+        chains end for morphs that contain the characters in present.
+        Each step is a pair (index of the input step, rule); step 0 is
+        the morph itself.
+        """
+        steps = []
+        chainEnds = []
+        prefixes = {(): 0}
+        for chain in self.chains:
+            available = set(present)
+            relevantChain = []
+            for rule in chain:
+                if any(c in available for c in rule.replacements):
+                    relevantChain.append(rule)
+                    available |= set(rule.replacements.values())
+            relevantChain = tuple(relevantChain)
+            for i in range(1, len(relevantChain) + 1):
+                if relevantChain[:i] not in prefixes:
+                    steps.append((prefixes[relevantChain[:i - 1]], relevantChain[i - 1]))
+                    prefixes[relevantChain[:i]] = len(steps)
+            if prefixes[relevantChain] not in chainEnds:
+                chainEnds.append(prefixes[relevantChain])
+        return steps, chainEnds
+
+    def variants(self, morph):
+        """
+        Return a tuple with all spellings of the morph, including itself.
+        """
+        try:
+            return self.memo[morph]
+        except KeyError:
+            pass
+        present = ''.join(c for c in self.triggers if c in morph)
+        if len(present) <= 0:
+            variants = (morph,)
+        else:
+            try:
+                steps, chainEnds = self.plans[present]
+            except KeyError:
+                steps, chainEnds = self.plans[present] = self.compile_plan(present)
+            results = [morph]
+            for iInput, rule in steps:
+                results.append(rule.apply(results[iInput]))
+            variants = [results[i] for i in chainEnds]
+            if self.sortVariants:
+                variants = tuple(sorted(set(variants)))
+            else:
+                variants = tuple(dict.fromkeys(variants))
+        self.memo[morph] = variants
+        return variants
+
+    def join_variants(self, morph):
+        """
+        Return all spellings of the morph (a match object) separated
+        by //, as they are written in the grammar files.
+        """
+        morph = morph.group(0)
+        try:
+            return self.memoJoined[morph]
+        except KeyError:
+            self.memoJoined[morph] = '//'.join(self.variants(morph))
+            return self.memoJoined[morph]
+
+    def clear(self):
+        self.memo.clear()
+        self.memoJoined.clear()
+
+
+variantGenerators = {orthography: VariantGenerator(orthography) for orthography in variantChains}
+
+# Noun and verb stems in ӟ that take one of these paradigms get
+# its -soft counterpart as well in the nodiacritics grammar
+rxParadigmChange = re.compile('( stem: *[^\r\n]+ӟ\\.\n(?: [^\r\n]*\n)*)'
+                              '( paradigm: (?:Noun|connect_verbs)[^\r\n]+?[^C])((?:-consonant)?)\n',
+                              flags=re.DOTALL)
+
+
+def soft_paradigm(stem, paradigms):
+    """
+    Return the paradigm of a lexeme with the given stem and paradigm
+    fields that gets a -soft counterpart in the nodiacritics grammar
+    (see pre_build.russify()) and the name of that counterpart, or None
+    if there is none.
+    """
+    text = ' stem: ' + stem + '\n' + ''.join(' paradigm: ' + p + '\n' for p in paradigms)
+    m = rxParadigmChange.search(text)
+    if m is None:
+        return None
+    paradigm = m.group(2)[len(' paradigm: '):]
+    return paradigm + m.group(3), paradigm + '-soft'
+
+
+def nodiacritics_variants(morph):
+    """
+    Return the set of spellings of a stem or an inflection in
+    (possibly) diacriticless texts (see pre_build.russify()).
+    """
+    return set(variantGenerators['nodiacritics'].variants(morph))
+
+
+def oldorth_variants(morph):
+    """
+    Return the set of pre-standardized spellings of a stem
+    or an inflection (see pre_build.oldorth()).
+    """
+    return set(variantGenerators['oldorth'].variants(morph))
+
+
+variantFunctions = {
+    'nodiacritics': nodiacritics_variants,
+    'oldorth': oldorth_variants
+}
+
+
+class SpellingAligner:
+    """
+    Checks analyses found by the standard grammar with character
+    equivalences switched on against the spelling rules of a
+    non-standard orthography. The character equivalences alone are
+    too permissive: they allow any subset of characters in a word to
+    be non-standard, while the grammar of that orthography only has
+    the spellings the rules produce for each stem and each inflection
+    as a whole (see pre_build.add_variants()). The stems are respelled
+    by the parser before the inflexions are looked up (see
+    UdmurtParser.respell_states()), so only the rest of the word is
+    checked here.
+    """
+    def __init__(self, orthography):
+        self.orthography = orthography
+        self.generator = variantGenerators[orthography]
+        self.variantFunction = variantFunctions[orthography]
+        self.variants = {}      # morph -> set of its spellings
+
+    def morph_variants(self, morph):
+        try:
+            return self.variants[morph]
+        except KeyError:
+            self.variants[morph] = self.variantFunction(morph)
+            return self.variants[morph]
+
+    def stem_variants(self, stem):
+        """
+        Return the spellings of a stem (with its morph breaks and
+        metacharacters) in the order the grammar files list them.
+        """
+        return self.generator.variants(stem)
+
+    def morph_breaks(self, ana):
+        """
+        Return the set of positions in the word form of the analysis
+        where a morpheme ends, judging by its morpheme breakdown
+        and its stem. Return None if the breakdown does not match
+        the word form.
+        """
+        wf = ana.wf.lower()
+        breaks = {len(wf)}
+        iChar = 0
+        for c in ana.wfGlossed.lower():
+            if iChar < len(wf) and c == wf[iChar]:
+                iChar += 1
+            elif rxPartSeparators.search(c) is not None:
+                breaks.add(iChar)
+            else:
+                return None
+        if iChar < len(wf):
+            return None
+        # Inflections that follow the stem immediately are not
+        # always separated from it in the breakdown.
+        stem = rxStemMetachars.sub('', ana.stem).lower()
+        if 0 < len(stem) < len(wf) and wf.startswith(stem):
+            breaks.add(len(stem))
+        return breaks
+
+    def align(self, word, ana):
+        """
+        Check if the word could be written in the non-standard
+        orthography as a spelling of the analysis ana, whose stem
+        is already spelled as in the word. If so, rewrite the word form
+        and its morpheme breakdown in the spelling of the word and
+        return True. Otherwise, return False.
+        With replacements, the word may differ from the word form in
+        the stem (see Parser.find_stems()): then only the part after
+        the stem is rewritten, and the caller has to check the distance.
+        """
+        wf = ana.wf
+        if wf is None:
+            return False
+        if wf == word:
+            return True
+        stem = rxStemMetachars.sub('', ana.stem).lower()
+        stemEnd = len(stem)
+        if len(stem) <= 0 or not wf.lower().startswith(stem):
+            # The stem is not a prefix of the word form, so all
+            # morphemes are checked
+            stemEnd = 0
+        shift = len(word) - len(wf)
+        if shift != 0 and (stemEnd <= 0 or stemEnd + shift < 0):
+            return False
+        respelled = wf[:stemEnd] + word[stemEnd + shift:]
+        breaks = self.morph_breaks(ana)
+        if breaks is not None:
+            morphStart = stemEnd
+            for morphEnd in sorted(breaks):
+                if morphEnd <= stemEnd:
+                    continue
+                morphStd = wf[morphStart:morphEnd].lower()
+                morph = respelled[morphStart:morphEnd]
+                if morph != morphStd and morph not in self.morph_variants(morphStd):
+                    return False
+                morphStart = morphEnd
+        # If the breakdown does not match the word form, there is
+        # no telling where the morphemes are, so the word is accepted
+        wfGlossed = ''
+        iChar = 0
+        for c in ana.wfGlossed:
+            if iChar < len(wf) and c.lower() == wf[iChar].lower():
+                wfGlossed += respelled[iChar]
+                iChar += 1
+            else:
+                wfGlossed += c
+        ana.wf = respelled
+        ana.wfGlossed = wfGlossed
+        return True
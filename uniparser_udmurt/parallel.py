@@ -0,0 +1,281 @@
+import gc
+import multiprocessing
+import os
+import threading
+import time
+from uniparser_morph.morph_parser import Parser
+
+# Threads started by this package (the profiler, the batching thread,
+# the thread that writes the input of CG3) have names with this prefix
+THREAD_PREFIX = 'uniparser-udmurt-'
+
+# The analyzer of a worker process, set by init_worker() when the worker
+# starts. Workers are forked, so they share its grammar with the parent
+# process copy-on-write instead of receiving it through a pipe.
+_analyzer = None
+
+# Number of pools whose workers are running with the objects of the
+# parent process frozen (see WorkerPool.start()), and whether gc.freeze()
+# had been called by someone else before the first of them
+_freezeLock = threading.Lock()
+_frozenPools = 0
+_frozenBefore = False
+
+
+def fork_available():
+    return 'fork' in multiprocessing.get_all_start_methods()
+
+
+def running_threads():
+    """
+    Return the names of the threads of this package that are
+    running in this process.
+    """
+    return [thread.name for thread in threading.enumerate() if thread.name.startswith(THREAD_PREFIX)]
+
+
+def fork_safe():
+    """
+    Return True if worker processes can be forked now: forking is
+    available and none of the threads of this package is running,
+    since a thread that holds a lock at the moment of the fork would
+    leave it locked forever in the workers.
+    """
+    return fork_available() and len(running_threads()) <= 0
+
+
+def init_worker(analyzer):
+    global _analyzer
+    _analyzer = analyzer
+
+
+def freeze_objects():
+    global _frozenPools, _frozenBefore
+    with _freezeLock:
+        if _frozenPools <= 0:
+            _frozenBefore = gc.get_freeze_count() > 0
+        _frozenPools += 1
+        gc.freeze()
+
+
+def unfreeze_objects():
+    global _frozenPools
+    with _freezeLock:
+        _frozenPools -= 1
+        if _frozenPools <= 0 and not _frozenBefore:
+            gc.unfreeze()
+
+
+def split_chunks(items, nChunks, minChunkSize=50):
+    """
+    Split a list into consecutive chunks, several per worker,
+    so that slow chunks do not keep other workers idle.
+    """
+    chunkSize = max(minChunkSize, len(items) // (nChunks * 4) + 1)
+    return [items[i:i + chunkSize] for i in range(0, len(items), chunkSize)]
+
+
+def flatten_words(words, tokens):
+    """
+    Collect all strings from a (possibly nested) list of words into
+    the tokens list. Return a skeleton of the list where each string
+    is replaced with None.
+    """
+    if type(words) == str:
+        tokens.append(words)
+        return None
+    elif type(words) == list:
+        return [flatten_words(w, tokens) for w in words]
+    return []
+
+
+def unflatten_words(skeleton, results):
+    """
+    Put the results (an iterator) into the skeleton
+    returned by flatten_words().
+    """
+    if skeleton is None:
+        return next(results)
+    return [unflatten_words(s, results) for s in skeleton]
+
+
+def worker_stats():
+    """
+    Return the statistics collected in the worker
+    since the beginning of the chunk.
+    """
+    return {'cascade': _analyzer.cascadeStats.stages, 'metrics': _analyzer.metrics.state()}
+
+
+def analyze_chunk(args):
+    words, replacementsAllowed = args
+    t1 = time.time()
+    _analyzer.cascadeStats.clear()
+    _analyzer.metrics.clear()
+    records = []
+    for word in words:
+        tWord = time.perf_counter()
+        wordRecords = _analyzer.lookup_records(word.lower(), replacementsAllowed=replacementsAllowed)
+        _analyzer.metrics.add_token(len(wordRecords), time.perf_counter() - tWord)
+        records.append(wordRecords)
+    return os.getpid(), len(words), time.time() - t1, records, worker_stats()
+
+
+def analyze_freq_chunk(args):
+    tokens, replacementsAllowed, glossing = args
+    t1 = time.time()
+    _analyzer.cascadeStats.clear()
+    _analyzer.metrics.clear()
+    results = []
+    for token in tokens:
+        analyses = _analyzer.m.parse(token, replacementsAllowed=replacementsAllowed)
+        if len(analyses) <= 0:
+            results.append(None)
+        else:
+            results.append(Parser.ana2xml(token, analyses, glossing=glossing))
+    return os.getpid(), len(tokens), time.time() - t1, results, worker_stats()
+
+
+class WorkerPool:
+    """
+    Worker processes forked from an analyzer that are kept for several
+    calls, e.g. for all batches of a text stream, so that they are only
+    forked once. The workers have a copy of the analyzer as it was at
+    the moment of the fork, so they are forked again if lexicon shards
+    have been loaded in the main process since then.
+    """
+    def __init__(self, analyzer, workers):
+        self.analyzer = analyzer
+        self.workers = workers
+        self.pool = None
+        self.lexicons = None    # shards loaded when the workers were forked
+
+    def start(self):
+        """
+        Fork the workers. Raise RuntimeError if the threads of this
+        package are running (see fork_safe()).
+        """
+        threads = running_threads()
+        if len(threads) > 0:
+            raise RuntimeError('Worker processes cannot be forked while these threads are running: '
+                               + ', '.join(threads))
+        # Objects that exist at the moment of the fork are never
+        # collected in the workers, so their memory pages are not
+        # touched by the garbage collector and stay shared.
+        freeze_objects()
+        try:
+            self.pool = multiprocessing.get_context('fork').Pool(self.workers, initializer=init_worker,
+                                                                  initargs=(self.analyzer,))
+        except Exception:
+            unfreeze_objects()
+            raise
+        self.lexicons = set(self.analyzer.lexicons)
+
+    def imap(self, func, chunks):
+        if self.pool is not None and self.lexicons != self.analyzer.lexicons:
+            self.close()
+        if self.pool is None:
+            self.start()
+        return self.pool.imap(func, chunks)
+
+    def close(self):
+        if self.pool is None:
+            return
+        self.pool.terminate()
+        self.pool.join()
+        self.pool = None
+        unfreeze_objects()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+
+def run_parallel(analyzer, func, chunks, workers, pool=None):
+    """
+    Process the chunks in the workers of the pool (or in a pool forked
+    for this call if there is none) and return the list of results in
+    the original order, along with the throughput of each worker:
+    {pid: {'tokens': ..., 'time': ..., 'words_per_second': ...}}.
+    Cascade statistics and metrics collected in the workers are
+    added to those of the analyzer.
+    """
+    if pool is None:
+        with WorkerPool(analyzer, workers) as pool:
+            return run_parallel(analyzer, func, chunks, workers, pool=pool)
+    workerStats = {}
+    results = []
+    for pid, nTokens, chunkTime, chunkResults, stats in pool.imap(func, chunks):
+        results += chunkResults
+        analyzer.cascadeStats.merge(stats['cascade'])
+        analyzer.metrics.merge(stats['metrics'])
+        if pid not in workerStats:
+            workerStats[pid] = {'tokens': 0, 'time': 0.0}
+        workerStats[pid]['tokens'] += nTokens
+        workerStats[pid]['time'] += chunkTime
+    for stats in workerStats.values():
+        stats['words_per_second'] = stats['tokens'] / stats['time'] if stats['time'] > 0 else 0.0
+    return results, workerStats
+
+
+def analyze_words_parallel(analyzer, words, workers, replacementsAllowed=0, pool=None):
+    """
+    Analyze a (possibly nested) list of words in several processes
+    (those of the WorkerPool, if one is given). Return the list of frozen
+    analysis records for each word in the same structure as the original
+    list, and the statistics for each worker.
+    """
+    tokens = []
+    skeleton = flatten_words(words, tokens)
+    chunks = [(chunk, replacementsAllowed) for chunk in split_chunks(tokens, workers)]
+    records, workerStats = run_parallel(analyzer, analyze_chunk, chunks, workers, pool=pool)
+    if len(analyzer.shards.lazy) > 0:
+        # Lexicon shards are loaded in the main process, so that
+        # the workers forked next time have them too
+        misses = [i for i in range(len(tokens)) if len(records[i]) <= 0]
+        loaded = False
+        for i in misses:
+            loaded = analyzer.shards.load_for(tokens[i]) or loaded
+        if loaded:
+            for i in misses:
+                records[i] = analyzer.lookup_records(tokens[i].lower(), replacementsAllowed=replacementsAllowed)
+    return unflatten_words(skeleton, iter(records)), workerStats
+
+
+def parse_freq_list_parallel(analyzer, fnameIn, sep, fnameParsed, fnameUnparsed,
+                             glossing, workers, replacementsAllowed=0):
+    """
+    Parallel version of Parser.parse_freq_list(). Return total number
+    of tokens, the rate of the parsed tokens, and the statistics for
+    each worker.
+    """
+    try:
+        with open(fnameIn, 'r', encoding='utf-8-sig') as fIn:
+            lines = [(x[0].strip(), int(x[1].strip()))
+                     for x in [line.split(sep) for line in fIn if len(line) > 2]]
+    except IOError:
+        analyzer.m.raise_error('The frequency list could not be opened.')
+        return 0, 0.0, {}
+    except ValueError:
+        analyzer.m.raise_error('Wrong format of the frequency list.')
+        return 0, 0.0, {}
+    lines.sort(key=lambda x: (-x[1], x[0]))
+    chunks = [([token for token, freq in chunk], replacementsAllowed, glossing)
+              for chunk in split_chunks(lines, workers)]
+    results, workerStats = run_parallel(analyzer, analyze_freq_chunk, chunks, workers)
+    parsedTokenFreqs = 0
+    unparsedTokenFreqs = 0
+    with open(fnameParsed, 'w', encoding='utf-8') as fParsed, \
+            open(fnameUnparsed, 'w', encoding='utf-8') as fUnparsed:
+        for (token, freq), result in zip(lines, results):
+            if result is None:
+                fUnparsed.write(token + '\n')
+                unparsedTokenFreqs += freq
+            else:
+                fParsed.write(result + '\n')
+                parsedTokenFreqs += freq
+    if parsedTokenFreqs + unparsedTokenFreqs <= 0:
+        return len(lines), 0.0, workerStats
+    return len(lines), parsedTokenFreqs / (parsedTokenFreqs + unparsedTokenFreqs), workerStats
@@ -0,0 +1,306 @@
+import copy
+import re
+import time
+import textdistance
+from uniparser_morph.morph_parser import Parser, ParseState
+from uniparser_morph.common_functions import remove_morph_breaks
+from .orthography import SpellingAligner, charEquivalences, soft_paradigm
+from .rule_index import BadAnalysisIndex, LexRuleIndex
+
+# Minimal lengths of a word and of the part of it a stem matches
+# for the search with replacements
+MIN_REPLACEMENT_WORD_LEN = 8
+MIN_REPLACEMENT_STEM_LEN = 6
+# Suffixes that Lexeme.generate_redupl_paradigm() and
+# Lexeme.generate_regex_paradigm() add to the paradigm names
+rxParadigmFork = re.compile('[~=].*')
+
+
+class UdmurtParser(Parser):
+    """
+    Morphological parser with Udmurt-specific additions
+    to the lookup procedure.
+    """
+    MIN_REPLACEMENT_WORD_LEN = MIN_REPLACEMENT_WORD_LEN
+    MIN_REPLACEMENT_STEM_LEN = MIN_REPLACEMENT_STEM_LEN
+    # Words that are not searched with replacements (mostly Russian borrowings)
+    rxNoReplacements = re.compile('-|ая$|ого$|кое$|р[яы]м?$|рт(ы|ов)$|ами$|ств[оае]м?$|[нцгх]и[яию]$|ией$|'
+                                  'публик[ие]$|[бвгжкмрфхцчшщ]ь[ея][мй]?$|[рн]т[ыае]$|шие$|ч[её]та$|[ое]ва$|шь$|[ией]те$|'
+                                  '[ео]вка$|цы$|няя$|нее$|[иаоеу]ты$|[бвгджзйклмнпрстфхцчшщ]но$|кин[оае]$|'
+                                  '[ео]в[оа][мй]?$|дане$', flags=re.I)
+
+    def __init__(self, g, verbose=0, parsingMethod='fst', errorHandler=None):
+        super().__init__(g, verbose=verbose, parsingMethod=parsingMethod,
+                         errorHandler=errorHandler)
+        self.spellingAligner = None     # set if the input is normalized at lookup time
+        self.respelled = {}             # (sublexeme, stem spelling) -> its respelled copy
+        self.stemIndex = None           # StemIndex used for the search with replacements
+        self.metrics = None             # Metrics of the analyzer, if the parser stages are timed
+        self.badAnalysisIndex = None    # BadAnalysisIndex used instead of g.badAnalyses
+        self.lexRuleIndex = None        # LexRuleIndex used instead of g.lexRulesByLemma/Stem
+        self.index_rules()
+
+    def __getstate__(self):
+        # The stem index and the metrics belong to the analyzer,
+        # they are not part of the snapshot
+        state = self.__dict__.copy()
+        state['stemIndex'] = None
+        state['metrics'] = None
+        return state
+
+    def index_rules(self):
+        """
+        Compile the bad analysis templates and the lexical rules of
+        the grammar into indexes (see rule_index.py). They are saved
+        in the snapshot together with the parser.
+        """
+        self.badAnalysisIndex = BadAnalysisIndex(self.g)
+        self.lexRuleIndex = LexRuleIndex(self.g)
+
+    def set_orthography(self, orthography):
+        """
+        Make the parser accept words written in a non-standard
+        orthography ('nodiacritics' or 'oldorth') while using the
+        standard grammar, whose character equivalences are replaced
+        with the ones of that orthography. The stems are respelled
+        as the grammar of that orthography has them when they are
+        found (see respell_states()), and the sublexemes it adds with
+        other paradigms are added to the grammar (see add_soft_paradigms()).
+        """
+        if orthography is None or orthography == 'strict':
+            self.spellingAligner = None
+        else:
+            self.g.charEquiv = charEquivalences[orthography]
+            self.spellingAligner = SpellingAligner(orthography)
+            self.respelled = {}
+            self.add_soft_paradigms(self.g.lexemes)
+
+    def add_lexemes(self, lexemes, paradigms):
+        """
+        Add the stems of lexemes loaded after the parser was initialized
+        (see UdmurtAnalyzer.load_lexicon()) and the affixes of the new
+        paradigms created for them, in the same way as fill_stems()
+        and fill_affixes() do for the whole grammar.
+        """
+        if self.parsingMethod != 'fst':
+            self.raise_error('Lexemes can only be added with the fst parsing method.')
+            return
+        for l in lexemes:
+            for sl in l.subLexemes:
+                if self.rxFirstNonEmptyPart.search(sl.stem) is None:
+                    self.add_all_wordforms(l)
+                    break
+                self.stemFst.add_stem(sl)
+        for l in lexemes:
+            for sl in l.subLexemes:
+                if not sl.noIncorporation and self.rxFirstNonEmptyPart.search(sl.stem) is not None:
+                    self.incorpFst.add_incorp_stem(sl)
+        for p in paradigms:
+            self.paradigmFsts[p] = self.make_paradigm_fst(self.g.paradigms[p])
+        self.add_soft_paradigms(lexemes)
+
+    def fork_paradigm(self, sl, paradigm):
+        """
+        Return the name of the version of the paradigm made for the
+        sublexeme by Lexeme.generate_redupl_paradigm() and
+        Lexeme.generate_regex_paradigm(), creating it if needed.
+        """
+        if len(paradigm) <= 0:
+            return paradigm
+        paradigm = self.g.paradigms[paradigm].fork_redupl(sl)
+        paradigm = self.g.paradigms[paradigm].fork_regex(sl)
+        if self.parsingMethod == 'fst' and paradigm not in self.paradigmFsts:
+            self.paradigmFsts[paradigm] = self.make_paradigm_fst(self.g.paradigms[paradigm])
+        return paradigm
+
+    def add_soft_paradigms(self, lexemes):
+        """
+        If the parser reads diacriticless texts, add the sublexemes
+        with the -soft paradigms that the nodiacritics grammar has for
+        some stems in ӟ (see orthography.soft_paradigm()) to the lexemes,
+        the grammar and the stem FSTs.
+        """
+        if self.spellingAligner is None or self.spellingAligner.orthography != 'nodiacritics':
+            return
+        for lex in lexemes:
+            paradigms = soft_paradigm(lex.stem, lex.paradigms)
+            if paradigms is None:
+                continue
+            paradigm, softParadigm = paradigms
+            subLexemes = []
+            for sl in lex.subLexemes:
+                if rxParadigmFork.sub('', sl.paradigm) != paradigm:
+                    continue
+                # Same as what Lexeme.add_derivations() does
+                for newParadigm in (softParadigm, '#deriv#paradigm#' + softParadigm):
+                    if newParadigm in self.g.paradigms:
+                        slNew = copy.copy(sl)
+                        slNew.paradigm = self.fork_paradigm(slNew, newParadigm)
+                        subLexemes.append(slNew)
+            lex.subLexemes += subLexemes
+            for sl in subLexemes:
+                try:
+                    self.g.lexByParadigm[sl.paradigm].append((lex, sl))
+                except KeyError:
+                    self.g.lexByParadigm[sl.paradigm] = [(lex, sl)]
+                if self.rxFirstNonEmptyPart.search(sl.stem) is None:
+                    continue
+                self.stemFst.add_stem(sl)
+                if not sl.noIncorporation:
+                    self.incorpFst.add_incorp_stem(sl)
+
+    def find_stems(self, word, replacementsAllowed=0):
+        """
+        Find all possible stems in the given token.
+        Return a list of corresponding state instances.
+        If replacements are allowed and there is a stem index, only look
+        for the stems the index proposes instead of searching the whole
+        stem FST with replacements.
+        """
+        if replacementsAllowed <= 0:
+            states = super().find_stems(word, replacementsAllowed=replacementsAllowed)
+        elif self.metrics is None:
+            states = self.find_stems_replaced(word, replacementsAllowed)
+        else:
+            t1 = time.perf_counter()
+            states = self.find_stems_replaced(word, replacementsAllowed)
+            self.metrics.count('replacement_attempts')
+            self.metrics.add_time('replacements', time.perf_counter() - t1)
+        if self.spellingAligner is not None:
+            states = self.respell_states(states, replacementsAllowed=replacementsAllowed)
+        return states
+
+    def find_stems_replaced(self, word, replacementsAllowed):
+        if (self.stemIndex is None or self.parsingMethod != 'fst'
+                or replacementsAllowed > self.stemIndex.maxDistance):
+            return super().find_stems(word, replacementsAllowed=replacementsAllowed)
+        # Search in a copy of the parser, so that the parser itself
+        # keeps the full stem FST for other calls
+        parser = copy.copy(self)
+        parser.stemFst = self.stemIndex.candidate_fst(self.stemFst, word,
+                                                      minStemLen=self.MIN_REPLACEMENT_STEM_LEN)
+        return Parser.find_stems(parser, word, replacementsAllowed=replacementsAllowed)
+
+    def respell_states(self, states, replacementsAllowed=0):
+        """
+        With a non-standard orthography (see set_orthography()), replace
+        the sublexeme of each state with a copy whose stem is spelled
+        as in the word, like the sublexemes of the grammar of that
+        orthography (see pre_build.add_variants()). States whose stems
+        are spelled in a way the spelling rules do not allow are left out.
+        With replacements, the spelling of the stem in the word is not
+        known, so there is a state for each spelling.
+        """
+        respelled = []
+        for state in states:
+            sl = state.sl
+            start = state.stemCorrStart
+            spelling = state.wf[state.wfCorrStart:state.wfCorrStart + state.corrLength]
+            stems = self.spellingAligner.stem_variants(sl.stemParts)
+            if replacementsAllowed <= 0:
+                stems = [stem for stem in stems
+                         if remove_morph_breaks(stem)[start:start + state.corrLength].lower() == spelling.lower()]
+            else:
+                # Where the stem matches the word with the replacements,
+                # as in Parser.find_stems()
+                rxSpelling = re.compile(re.escape(spelling).replace(self.WILDCARD, '.'))
+            for stem in stems:
+                if replacementsAllowed > 0:
+                    m = rxSpelling.search(remove_morph_breaks(stem))
+                    start = -1 if m is None else m.start()
+                if stem == sl.stemParts:
+                    if start == state.stemCorrStart:
+                        respelled.append(state)
+                        continue
+                    slNew = sl
+                else:
+                    slNew = self.respelled_sublexeme(sl, stem)
+                respelled.append(ParseState(state.wf, slNew, state.wfCorrStart, start, state.corrLength))
+        return respelled
+
+    def respelled_sublexeme(self, sl, stem):
+        """
+        Return a copy of the sublexeme with another spelling of its stem
+        and the version of the paradigm made for that spelling, since the
+        regex tests of the inflexions may depend on it.
+        """
+        try:
+            return self.respelled[sl, stem]
+        except KeyError:
+            pass
+        slNew = copy.copy(sl)
+        slNew.stemParts = stem
+        slNew.stem = remove_morph_breaks(stem)
+        slNew.paradigm = self.fork_paradigm(slNew, rxParadigmFork.sub('', sl.paradigm))
+        self.respelled[sl, stem] = slNew
+        return slNew
+
+    def get_wordforms(self, state, replacementsAllowed=0):
+        """
+        Return a list of Wordform objects for the state after the loop
+        has been finished, or None. With a non-standard orthography,
+        the inflexions are respelled as in the word (see
+        orthography.SpellingAligner.align()) before the word form
+        is compared to the word.
+        """
+        if self.spellingAligner is None:
+            return super().get_wordforms(state, replacementsAllowed=replacementsAllowed)
+        wordforms = super().get_wordforms(state, replacementsAllowed=float('inf') if replacementsAllowed > 0 else 0)
+        if wordforms is None:
+            return None
+        wordforms = [wf for wf in wordforms
+                     if self.spellingAligner.align(state.wf, wf)
+                     and (wf.wf == state.wf
+                          or textdistance.damerau_levenshtein.distance(wf.wf, state.wf) <= replacementsAllowed)]
+        if len(wordforms) <= 0:
+            return None
+        return wordforms
+
+    def investigate_states(self, states, replacementsAllowed=0):
+        """
+        Investigate all states corresponding to the stems found by the stem FST.
+        Return a set of all possible analyses.
+        """
+        if replacementsAllowed <= 0 or self.metrics is None:
+            return super().investigate_states(states, replacementsAllowed=replacementsAllowed)
+        t1 = time.perf_counter()
+        analysesSet = super().investigate_states(states, replacementsAllowed=replacementsAllowed)
+        self.metrics.add_time('replacements', time.perf_counter() - t1, n=0)
+        if len(analysesSet) > 0:
+            self.metrics.count('replacement_successes')
+        return analysesSet
+
+    def is_bad_analysis(self, analyses, i_ana):
+        """
+        Check if the analysis with the index i_ana in the list of
+        analyses is conditionally or unconditionally bad, based on
+        the checks in bad_analyses.txt.
+        """
+        if self.metrics is None:
+            if self.badAnalysisIndex is None:
+                return super().is_bad_analysis(analyses, i_ana)
+            return self.badAnalysisIndex.is_bad(self, analyses, i_ana)
+        t1 = time.perf_counter()
+        if self.badAnalysisIndex is None:
+            result = super().is_bad_analysis(analyses, i_ana)
+        else:
+            result = self.badAnalysisIndex.is_bad(self, analyses, i_ana)
+        self.metrics.add_time('bad_analyses', time.perf_counter() - t1)
+        return result
+
+    def apply_lex_rules(self, ana):
+        """
+        Return the set of copies of the analysis enhanced by the
+        lexical rules that apply to it (empty if there are none).
+        """
+        if self.metrics is None:
+            if self.lexRuleIndex is None:
+                return super().apply_lex_rules(ana)
+            return self.lexRuleIndex.apply(ana)
+        t1 = time.perf_counter()
+        if self.lexRuleIndex is None:
+            result = super().apply_lex_rules(ana)
+        else:
+            result = self.lexRuleIndex.apply(ana)
+        self.metrics.add_time('lex_rules', time.perf_counter() - t1)
+        return result
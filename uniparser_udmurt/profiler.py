@@ -0,0 +1,92 @@
+import os
+import sys
+import threading
+from collections import Counter
+
+
+class SamplingProfiler:
+    """
+    Statistical profiler that looks at the Python stack of one
+    thread at regular intervals from a background thread. It costs
+    nothing while it is not running, and little while it is, since
+    the profiled code is not traced. Samples can be written in the
+    collapsed stack format used by flame graph tools.
+    """
+    def __init__(self, interval=0.005, threadId=None, maxDepth=200):
+        self.interval = interval
+        self.threadId = threadId
+        self.maxDepth = maxDepth
+        self.samples = Counter()    # stack (tuple of function names, outermost first) -> number of samples
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stopEvent = threading.Event()
+
+    def start(self):
+        """
+        Start sampling the thread given in the constructor,
+        or the thread that calls start().
+        """
+        if self.thread is not None:
+            return
+        if self.threadId is None:
+            self.threadId = threading.get_ident()
+        self.stopEvent.clear()
+        self.thread = threading.Thread(target=self.run, name='uniparser-udmurt-profiler', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.stopEvent.set()
+        self.thread.join()
+        self.thread = None
+
+    def running(self):
+        return self.thread is not None
+
+    def run(self):
+        while not self.stopEvent.wait(self.interval):
+            frame = sys._current_frames().get(self.threadId)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.maxDepth:
+                code = frame.f_code
+                stack.append(code.co_name + ' (' + os.path.basename(code.co_filename)
+                             + ':' + str(code.co_firstlineno) + ')')
+                frame = frame.f_back
+            del frame
+            with self.lock:
+                self.samples[tuple(reversed(stack))] += 1
+
+    def clear(self):
+        with self.lock:
+            self.samples.clear()
+
+    def collapsed(self):
+        """
+        Return the samples in the collapsed stack format:
+        one line per stack, functions separated by semicolons,
+        followed by the number of samples.
+        """
+        with self.lock:
+            return ''.join(';'.join(stack) + ' ' + str(n) + '\n'
+                           for stack, n in sorted(self.samples.items()))
+
+    def top(self, n=20):
+        """
+        Return the n functions most often found on top of the stack,
+        as a list of (function, samples on top of the stack,
+        samples anywhere in the stack).
+        """
+        selfSamples = Counter()
+        totalSamples = Counter()
+        with self.lock:
+            for stack, nSamples in self.samples.items():
+                if len(stack) <= 0:
+                    continue
+                selfSamples[stack[-1]] += nSamples
+                for function in set(stack):
+                    totalSamples[function] += nSamples
+        return [(function, nSelf, totalSamples[function])
+                for function, nSelf in selfSamples.most_common(n)]
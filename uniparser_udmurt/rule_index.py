@@ -0,0 +1,328 @@
+"""
+Indexes of the rules applied to each analysis after parsing: the
+templates of wrong analyses (bad_analyses.txt) and the lexical rules
+(lex_rules.txt). In the files, all conditions are regexes, but most
+of them describe one literal word form, lemma or stem, or a few of
+them. The indexes find the rules that may apply to an analysis with
+a dictionary lookup, so that only the rules with truly pattern-based
+conditions have to be tried on every analysis.
+"""
+import copy
+import re
+from uniparser_morph.common_functions import check_for_regex, wfPropertyFields
+
+MAX_LITERAL_VALUES = 64     # larger finite patterns are treated as regexes
+# Fields of the analyses the bad analysis templates are indexed by, most selective first
+KEY_FIELDS = ('wf', 'lemma', 'stem', 'gloss', 'gramm')
+rxLiteralTest = re.compile('^(\\^?)([^\\\\.^$*+?{}\\[\\]()|]*)(\\.\\*)?$')
+
+
+def expand_alternatives(pattern, pos, end, maxValues):
+    """
+    Expand the alternatives of a regex, starting at pos, up to the end
+    or to a closing parenthesis. Return the set of strings, the position
+    where the expansion stopped and the number of alternatives.
+    Raise ValueError if the regex is not understood or describes
+    more than maxValues strings.
+    """
+    values = set()
+    nAlternatives = 0
+    while True:
+        seqValues, pos = expand_sequence(pattern, pos, end, maxValues)
+        values |= seqValues
+        nAlternatives += 1
+        if len(values) > maxValues:
+            raise ValueError('Too many values: ' + pattern)
+        if pos < end and pattern[pos] == '|':
+            pos += 1
+            continue
+        return values, pos, nAlternatives
+
+
+def expand_sequence(pattern, pos, end, maxValues):
+    """
+    Expand one alternative of a regex (see expand_alternatives()).
+    Return the set of strings and the position where it ends.
+    """
+    values = {''}
+    while pos < end and pattern[pos] not in '|)':
+        c = pattern[pos]
+        if c == '(':
+            if pattern.startswith('(?:', pos):
+                start = pos + 3
+            elif pattern.startswith('(?', pos):
+                raise ValueError('Unsupported group: ' + pattern)
+            else:
+                start = pos + 1
+            item, pos, _ = expand_alternatives(pattern, start, end, maxValues)
+            if pos >= end or pattern[pos] != ')':
+                raise ValueError('Unbalanced parentheses: ' + pattern)
+            pos += 1
+        elif c == '[':
+            close = pattern.find(']', pos + 1)
+            chars = pattern[pos + 1:close]
+            if close < 0 or close >= end or len(chars) <= 0 or any(ch in '^-\\[' for ch in chars):
+                raise ValueError('Unsupported character set: ' + pattern)
+            item = set(chars)
+            pos = close + 1
+        elif c == '\\':
+            if pos + 1 >= end or pattern[pos + 1].isalnum():
+                raise ValueError('Unsupported escape: ' + pattern)
+            item = {pattern[pos + 1]}
+            pos += 2
+        elif c in '.^$*+?{}]':
+            raise ValueError('Not a finite pattern: ' + pattern)
+        else:
+            item = {c}
+            pos += 1
+        if pos < end and pattern[pos] == '?':
+            item = item | {''}
+            pos += 1
+        if pos < end and pattern[pos] in '*+?{':
+            raise ValueError('Not a finite pattern: ' + pattern)
+        values = {v + i for v in values for i in item}
+        if len(values) > maxValues:
+            raise ValueError('Too many values: ' + pattern)
+    return values, pos
+
+
+def literal_values(pattern, maxValues=MAX_LITERAL_VALUES):
+    """
+    If the regex is anchored at both ends (^...$, as the patterns
+    of bad analysis templates) and only matches a small finite set of
+    strings, return that set, so that re.search(pattern, s) succeeds
+    if and only if s is in it. Otherwise, return None.
+    Only literal characters, character sets without ranges, groups
+    with alternatives and the ? quantifier are understood.
+    """
+    if len(pattern) < 2 or pattern[0] != '^' or pattern[-1] != '$' or pattern.endswith('\\$'):
+        return None
+    end = len(pattern) - 1
+    try:
+        values, pos, nAlternatives = expand_alternatives(pattern, 1, end, maxValues)
+    except ValueError:
+        return None
+    # ^a|b$ means "starts with a or ends with b"
+    if pos != end or nAlternatives > 1:
+        return None
+    return values
+
+
+def literal_affixes(pattern, maxValues=MAX_LITERAL_VALUES):
+    """
+    Same as literal_values(), but also understand anchored regexes
+    that start or end with .* (e.g. ^(ке|ту)ртт.*$). Return a tuple
+    (position, values), where position is 'full', 'prefix' or 'suffix',
+    such that each string the regex matches is one of the values,
+    starts with one of them or ends with one of them, respectively.
+    Otherwise, return None.
+    """
+    values = literal_values(pattern, maxValues=maxValues)
+    if values is not None:
+        return 'full', values
+    if pattern.endswith('.*$') and not pattern.endswith('\\.*$'):
+        values = literal_values(pattern[:-3] + '$', maxValues=maxValues)
+        if values is not None:
+            return 'prefix', values
+    if pattern.startswith('^.*'):
+        values = literal_values('^' + pattern[3:], maxValues=maxValues)
+        if values is not None:
+            return 'suffix', values
+    return None
+
+
+class TemplateIndex:
+    """
+    Index of bad analysis templates (dictionaries {field: compiled
+    regex}) by the literal values, prefixes or suffixes of one of
+    their fields. Templates without such a field are kept in
+    a residual list.
+    """
+    def __init__(self, templates, items=None):
+        """
+        items are the objects returned for the templates (by default,
+        the templates themselves).
+        """
+        if items is None:
+            items = templates
+        # (field, position, length) -> {value: [item]}, where length
+        # is the length of the prefixes or suffixes (0 for full values)
+        self.tables = {}
+        self.residual = []
+        for template, item in zip(templates, items):
+            key = self.template_key(template)
+            if key is None:
+                self.residual.append(item)
+                continue
+            field, position, values = key
+            for value in values:
+                length = len(value) if position != 'full' else 0
+                table = self.tables.setdefault((field, position, length), {})
+                table.setdefault(value, []).append(item)
+
+    @staticmethod
+    def template_key(template):
+        """
+        Choose the field the template is indexed by: the first of
+        KEY_FIELDS with a finite set of values, or, if there is none,
+        with a finite set of non-empty prefixes or suffixes. Return
+        a tuple (field, position, values) or None.
+        """
+        affixKey = None
+        for field in KEY_FIELDS:
+            rx = template.get(field)
+            if not hasattr(rx, 'pattern'):
+                continue
+            affixes = literal_affixes(rx.pattern)
+            if affixes is None:
+                continue
+            position, values = affixes
+            if position == 'full':
+                return field, position, values
+            if affixKey is None and '' not in values:
+                affixKey = field, position, values
+        return affixKey
+
+    def __len__(self):
+        return len(self.residual) + len(set(id(item) for table in self.tables.values()
+                                            for items in table.values() for item in items))
+
+    def candidates(self, ana):
+        """
+        Return the list of items whose templates the analysis may
+        conform to. The templates still have to be checked.
+        """
+        result = self.residual
+        values = ana.__dict__
+        for (field, position, length), table in self.tables.items():
+            value = values.get(field)
+            if type(value) != str:
+                continue
+            if position == 'prefix':
+                value = value[:length]
+            elif position == 'suffix':
+                value = value[len(value) - length:]
+            items = table.get(value)
+            if items is not None:
+                result = result + items
+        return result
+
+
+class BadAnalysisIndex:
+    """
+    Indexed version of the unconditional and conditional templates
+    in g.badAnalyses and g.badAnalysesConditional.
+    """
+    def __init__(self, g):
+        self.unconditional = TemplateIndex(g.badAnalyses)
+        self.conditional = TemplateIndex([badAna['remove'] for badAna in g.badAnalysesConditional],
+                                         items=g.badAnalysesConditional)
+
+    def is_bad(self, parser, analyses, i_ana):
+        """
+        Same as Parser.is_bad_analysis().
+        """
+        ana = analyses[i_ana]
+        for badAna in self.unconditional.candidates(ana):
+            if parser.analysis_conforms(ana, badAna):
+                return True
+        for badAna in self.conditional.candidates(ana):
+            if (parser.analysis_conforms(ana, badAna['remove'])
+                    and any(i != i_ana and parser.analysis_conforms(analyses[i], badAna['if_exists'])
+                            for i in range(len(analyses)))):
+                return True
+        return False
+
+
+class FieldTest:
+    """
+    Search condition of a lexical rule (a RegexTest) applied to
+    an analysis. Conditions that look for a literal substring or
+    prefix are checked without the regex.
+    """
+    def __init__(self, rxTest, errorHandler=None):
+        self.rxTest = rxTest
+        self.errorHandler = errorHandler
+        self.attr = None        # attribute of the analysis checked directly
+        if rxTest.field in ('stem', 'prev'):
+            self.attr = 'stem'
+        elif rxTest.field in wfPropertyFields:
+            self.attr = rxTest.field
+        self.prefix = None
+        self.substring = None
+        m = rxLiteralTest.search(rxTest.sTest)
+        if m is not None:
+            if len(m.group(1)) > 0:
+                self.prefix = m.group(2)
+            else:
+                self.substring = m.group(2)
+
+    def perform(self, ana):
+        if self.attr is None:
+            return check_for_regex(ana, self.rxTest, errorHandler=self.errorHandler,
+                                   checkWordform=True)
+        value = ana.__dict__[self.attr]
+        if self.substring is not None:
+            return self.substring in value
+        if self.prefix is not None:
+            return value.startswith(self.prefix)
+        return self.rxTest.perform(value)
+
+
+class LexRuleIndex:
+    """
+    Lexical rules of the grammar (g.lexRulesByLemma and g.lexRulesByStem)
+    with their search conditions compiled into FieldTest objects.
+    Conditions shared by several rules (most rules for verbs check
+    gramm for V,.*) are only checked once per analysis.
+    """
+    def __init__(self, g):
+        self.tests = []
+        testIds = {}
+        self.rulesByLemma = {}
+        self.rulesByStem = {}
+        for rulesByKey, compiledRules in ((g.lexRulesByLemma, self.rulesByLemma),
+                                          (g.lexRulesByStem, self.rulesByStem)):
+            for key, rules in rulesByKey.items():
+                compiledRules[key] = []
+                for rule in rules:
+                    ruleTests = []
+                    for rxTest in rule.searchFields:
+                        testKey = (rxTest.field, rxTest.sTest)
+                        if testKey not in testIds:
+                            testIds[testKey] = len(self.tests)
+                            self.tests.append(FieldTest(rxTest, errorHandler=g.errorHandler))
+                        ruleTests.append(testIds[testKey])
+                    compiledRules[key].append((rule, tuple(ruleTests)))
+
+    def __len__(self):
+        return len(self.rulesByLemma) + len(self.rulesByStem)
+
+    def apply(self, ana):
+        """
+        Same as Parser.apply_lex_rules(): return the set of copies of
+        the analysis enhanced by the rules that apply to it.
+        """
+        enhancements = set()
+        rulesByLemma = self.rulesByLemma.get(ana.lemma)
+        rulesByStem = self.rulesByStem.get(ana.stem)
+        if rulesByLemma is None and rulesByStem is None:
+            return enhancements
+        results = {}
+        for rules in (rulesByLemma, rulesByStem):
+            if rules is None:
+                continue
+            for rule, ruleTests in rules:
+                for iTest in ruleTests:
+                    try:
+                        result = results[iTest]
+                    except KeyError:
+                        result = results[iTest] = self.tests[iTest].perform(ana)
+                    if not result:
+                        break
+                else:
+                    # Same as LexRule.apply()
+                    newAna = copy.deepcopy(ana)
+                    newAna.otherData += rule.addFields
+                    enhancements.add(newAna)
+        return enhancements
@@ -0,0 +1,207 @@
+"""
+Local HTTP server that analyzes words sent as JSON. Concurrent
+requests are analyzed together (see UdmurtAnalyzer.analyze_async()).
+
+    python -m uniparser_udmurt.server --port 8080
+
+POST /analyze with {"words": ["Мон", "тонэ", "яратӥсько"]} returns
+{"analyses": [...]}. The request may also contain "format" ("json"
+(default), "xml" or "conll"), "disambiguate" (false by default) and
+"replacements" (0 by default). GET /stats returns the latency
+percentiles, batch sizes and analyzer metrics as JSON, GET /metrics
+returns the same in the Prometheus format.
+
+Run with --help for all options.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from .cli import add_analyzer_arguments, analyzer_from_args
+from .metrics import LatencyWindow, prometheus_latency
+
+FORMATS = ('json', 'xml', 'conll')
+MAX_BODY_SIZE = 16 * 1024 * 1024
+STATUS_TEXTS = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    413: 'Payload Too Large',
+    500: 'Internal Server Error'
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def check_words(words):
+    """
+    Check that words is a string or a (possibly nested) list of strings.
+    """
+    if type(words) == str:
+        return True
+    return type(words) == list and all(check_words(w) for w in words)
+
+
+class AnalysisServer:
+    """
+    Minimal HTTP/1.1 server (with keep-alive) on top of asyncio
+    streams that passes the requests to analyze_async().
+    """
+    def __init__(self, analyzer, host='127.0.0.1', port=8080):
+        self.analyzer = analyzer
+        self.host = host
+        self.port = port
+        self.server = None
+        self.latencies = LatencyWindow()
+
+    async def start(self):
+        """
+        Start listening. If port is 0, a free port is chosen and
+        stored in self.port.
+        """
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                requestLine = await reader.readline()
+                if len(requestLine) <= 0:
+                    break
+                parts = requestLine.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, _, value = line.decode('latin-1').partition(':')
+                    headers[key.strip().lower()] = value.strip()
+                if len(parts) != 3:
+                    status, contentType, body = self.error_response(HTTPError(400, 'Malformed request line'))
+                    keepAlive = False
+                else:
+                    method, path, version = parts
+                    length = int(headers.get('content-length', '0') or 0)
+                    if length > MAX_BODY_SIZE:
+                        status, contentType, body = self.error_response(HTTPError(413, 'Request is too large'))
+                        keepAlive = False
+                    else:
+                        data = await reader.readexactly(length) if length > 0 else b''
+                        status, contentType, body = await self.dispatch(method, path.split('?')[0], data)
+                        connection = headers.get('connection', '').lower()
+                        keepAlive = (connection == 'keep-alive'
+                                     or (version == 'HTTP/1.1' and connection != 'close'))
+                writer.write(('HTTP/1.1 ' + str(status) + ' ' + STATUS_TEXTS[status] + '\r\n'
+                              + 'Content-Type: ' + contentType + '\r\n'
+                              + 'Content-Length: ' + str(len(body)) + '\r\n'
+                              + 'Connection: ' + ('keep-alive' if keepAlive else 'close') + '\r\n\r\n'
+                              ).encode('latin-1') + body)
+                await writer.drain()
+                if not keepAlive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    def error_response(self, err):
+        return err.status, 'application/json', json.dumps({'error': str(err)}).encode('utf-8')
+
+    async def dispatch(self, method, path, data):
+        """
+        Process one request. Return the status, content type and body.
+        """
+        try:
+            if path == '/analyze':
+                if method != 'POST':
+                    raise HTTPError(405, 'Use POST')
+                t1 = time.perf_counter()
+                result = await self.analyze(data)
+                self.latencies.add(time.perf_counter() - t1)
+                return 200, 'application/json', json.dumps(result, ensure_ascii=False).encode('utf-8')
+            elif path in ('/stats', '/metrics'):
+                if method != 'GET':
+                    raise HTTPError(405, 'Use GET')
+                if path == '/metrics':
+                    text = (self.analyzer.metrics_prometheus()
+                            + prometheus_latency(self.latencies, labels={'mode': self.analyzer.mode}))
+                    return 200, 'text/plain; version=0.0.4', text.encode('utf-8')
+                return 200, 'application/json', json.dumps(self.stats(), ensure_ascii=False).encode('utf-8')
+            raise HTTPError(404, 'Unknown path: ' + path)
+        except HTTPError as err:
+            return self.error_response(err)
+        except Exception as err:
+            return self.error_response(HTTPError(500, repr(err)))
+
+    async def analyze(self, data):
+        try:
+            request = json.loads(data.decode('utf-8'))
+        except ValueError:
+            raise HTTPError(400, 'The request is not valid JSON')
+        if type(request) != dict or 'words' not in request or not check_words(request['words']):
+            raise HTTPError(400, 'The request has to contain "words": a string or a (nested) list of strings')
+        format = request.get('format', 'json')
+        if format not in FORMATS:
+            raise HTTPError(400, 'Unknown format: ' + str(format))
+        replacementsAllowed = request.get('replacements', 0)
+        if type(replacementsAllowed) != int or not 0 <= replacementsAllowed <= 1:
+            raise HTTPError(400, '"replacements" has to be 0 or 1')
+        analyses = await self.analyzer.analyze_async(request['words'], format=format,
+                                                     disambiguate=bool(request.get('disambiguate', False)),
+                                                     replacementsAllowed=replacementsAllowed)
+        return {'analyses': analyses}
+
+    def stats(self):
+        return {
+            'latency': self.latencies.snapshot(),
+            'batching': self.analyzer.batching_stats(),
+            'metrics': self.analyzer.metrics_snapshot()
+        }
+
+
+def main(args=None):
+    argParser = argparse.ArgumentParser(prog='python -m uniparser_udmurt.server',
+                                        description='HTTP/JSON server for the Udmurt morphological analyzer.')
+    argParser.add_argument('--host', default='127.0.0.1')
+    argParser.add_argument('--port', type=int, default=8080, help='port to listen on (0: any free port)')
+    add_analyzer_arguments(argParser)
+    argParser.add_argument('--max-batch-size', type=int, default=256,
+                           help='maximal number of tokens analyzed at once')
+    argParser.add_argument('--max-wait', type=float, default=2.0,
+                           help='time (ms) a request can wait to be analyzed together with others')
+    args = argParser.parse_args(args)
+
+    a = analyzer_from_args(args)
+    a.set_batching(max_batch_size=args.max_batch_size, max_wait=args.max_wait / 1000)
+    a.initialize_parser()
+    server = AnalysisServer(a, host=args.host, port=args.port)
+
+    async def serve():
+        await server.start()
+        sys.stderr.write('Listening on http://' + args.host + ':' + str(server.port) + '\n')
+        sys.stderr.flush()
+        await server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        a.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
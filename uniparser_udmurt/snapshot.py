@@ -0,0 +1,208 @@
+import gc
+import hashlib
+import mmap
+import os
+import pickle
+import sys
+from uniparser_morph.ErrorHandler import ErrorHandler
+from uniparser_morph.morph_fst import MorphFSTState
+from .lexicon import LEXICON_SHARDS, shard_file
+
+try:
+    from importlib.metadata import version as package_version
+except ImportError:
+    from importlib_metadata import version as package_version
+
+
+SNAPSHOT_VERSION = 5
+SNAPSHOT_MAGIC = b'UDMGRAMMAR\n'
+SNAPSHOT_FILE = 'grammar.pickle'            # with all lexicon shards
+SNAPSHOT_CORE_FILE = 'grammar_core.pickle'  # without any
+SOURCE_FILES = (('paradigms.txt', 'lexemes.txt')
+                + tuple(shard_file(shard) for shard in sorted(LEXICON_SHARDS))
+                + ('lex_rules.txt', 'derivations.txt', 'stem_conversions.txt', 'clitics.txt', 'bad_analyses.txt'))
+RECURSION_LIMIT = 100000    # the stem and affix FSTs are deeply nested
+
+# path -> (size, modification time, MD5 hash) of the source files hashed so far
+_fileDigests = {}
+
+
+class SnapshotPickler(pickle.Pickler):
+    """
+    Pickler that leaves out the error handler, which holds
+    a file object and has to be recreated in each process anyway.
+    """
+    def persistent_id(self, obj):
+        if isinstance(obj, ErrorHandler):
+            return 'errorHandler'
+        return None
+
+
+class SnapshotUnpickler(pickle.Unpickler):
+    """
+    Unpickler that plugs the error handler of the current
+    process back into the grammar.
+    """
+    def __init__(self, f, errorHandler):
+        super().__init__(f)
+        self.errorHandler = errorHandler
+
+    def persistent_load(self, pid):
+        if pid == 'errorHandler':
+            return self.errorHandler
+        raise pickle.UnpicklingError('Unknown persistent id: ' + str(pid))
+
+
+def morph_version():
+    try:
+        return package_version('uniparser-morph')
+    except Exception:
+        return ''
+
+
+def source_file_digest(fname):
+    """
+    Return the MD5 hash of a file, or None if it does not exist.
+    A file is only hashed again if its size or modification time
+    has changed since it was last hashed in this process.
+    """
+    try:
+        stat = os.stat(fname)
+    except OSError:
+        return None
+    try:
+        size, mtime, digest = _fileDigests[fname]
+        if size == stat.st_size and mtime == stat.st_mtime_ns:
+            return digest
+    except KeyError:
+        pass
+    h = hashlib.md5()
+    with open(fname, 'rb') as fIn:
+        for chunk in iter(lambda: fIn.read(1 << 20), b''):
+            h.update(chunk)
+    _fileDigests[fname] = (stat.st_size, stat.st_mtime_ns, h.hexdigest())
+    return h.hexdigest()
+
+
+def source_digest(dirName):
+    """
+    Return a dictionary {filename: MD5 hash} for the grammar files
+    in the directory. Missing files have None as their hash.
+    """
+    return {fname: source_file_digest(os.path.join(dirName, fname)) for fname in SOURCE_FILES}
+
+
+def snapshot_file(lexicons):
+    """
+    Return the name of the snapshot file for a grammar with the
+    given lexicon shards (see lexicon.LEXICON_SHARDS) loaded.
+    """
+    lexicons = sorted(lexicons)
+    if lexicons == sorted(LEXICON_SHARDS):
+        return SNAPSHOT_FILE
+    if len(lexicons) <= 0:
+        return SNAPSHOT_CORE_FILE
+    return 'grammar_' + '_'.join(lexicons) + '.pickle'
+
+
+def snapshot_header(dirName, lexicons):
+    """
+    Return the header that describes what a snapshot of the
+    grammar in dirName with the given lexicon shards was built from.
+    """
+    return {
+        'version': SNAPSHOT_VERSION,
+        'python': list(sys.version_info[:2]),
+        'uniparser_morph': morph_version(),
+        'sources': source_digest(dirName),
+        'lexicons': sorted(lexicons)
+    }
+
+
+def save_snapshot(analyzer, dirName, fname=None):
+    """
+    Write the loaded grammar and the initialized parser of the analyzer
+    to a binary snapshot file. The header of the file records the
+    hashes of the source files and the lexicon shards loaded, so that
+    stale snapshots can be detected.
+    """
+    if fname is None:
+        fname = os.path.join(dirName, snapshot_file(analyzer.lexicons))
+    analyzer.initialize_parser()
+    recursionLimit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(recursionLimit, RECURSION_LIMIT))
+    try:
+        with open(fname + '.tmp', 'wb') as fOut:
+            fOut.write(SNAPSHOT_MAGIC)
+            pickle.dump(snapshot_header(dirName, analyzer.lexicons), fOut, protocol=pickle.HIGHEST_PROTOCOL)
+            # FST states are compared by their numbers, so the states added
+            # after loading (e.g. with a lexicon shard) have to get new ones
+            SnapshotPickler(fOut, protocol=pickle.HIGHEST_PROTOCOL).dump((analyzer.g, analyzer.m,
+                                                                          MorphFSTState.lastID))
+        os.replace(fname + '.tmp', fname)
+    finally:
+        sys.setrecursionlimit(recursionLimit)
+
+
+def load_snapshot(dirName, errorHandler, fname=None, lexicons=()):
+    """
+    Load the grammar with the given lexicon shards and the parser from
+    a snapshot file. The file is unpickled from a memory map, which
+    saves reading it into a buffer first; the objects themselves are
+    created anew in each process. Return a tuple (g, m) or None if the
+    snapshot is missing or does not match the current source files,
+    Python or uniparser-morph version.
+    """
+    if fname is None:
+        fname = os.path.join(dirName, snapshot_file(lexicons))
+    if not os.path.exists(fname):
+        return None
+    with open(fname, 'rb') as fIn:
+        try:
+            mm = mmap.mmap(fIn.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            return None
+    try:
+        if mm.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+            return None
+        try:
+            header = pickle.load(mm)
+        except Exception:
+            return None
+        if header != snapshot_header(dirName, lexicons):
+            return None
+        recursionLimit = sys.getrecursionlimit()
+        sys.setrecursionlimit(max(recursionLimit, RECURSION_LIMIT))
+        gcEnabled = gc.isenabled()
+        # Millions of objects are created here, none of which are garbage,
+        # so collecting while loading only wastes time.
+        gc.disable()
+        try:
+            g, m, lastStateId = SnapshotUnpickler(mm, errorHandler).load()
+        except Exception:
+            return None
+        finally:
+            if gcEnabled:
+                gc.enable()
+            sys.setrecursionlimit(recursionLimit)
+    finally:
+        mm.close()
+    MorphFSTState.lastID = max(MorphFSTState.lastID, lastStateId)
+    return g, m
+
+
+def load_grammar_snapshot(dirName, errorHandler, lexicons=()):
+    """
+    Load the snapshot with the given lexicon shards or, if there is
+    none, the one with the core lexicon, to which the shards can then
+    be added. Return a tuple (g, m, shards loaded) or None if neither
+    snapshot is up to date.
+    """
+    snapshot = load_snapshot(dirName, errorHandler, lexicons=lexicons)
+    if snapshot is not None:
+        return snapshot + (set(lexicons),)
+    if len(lexicons) > 0:
+        snapshot = load_snapshot(dirName, errorHandler, lexicons=())
+        if snapshot is not None:
+            return snapshot + (set(),)
+    return None
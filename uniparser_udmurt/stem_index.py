@@ -0,0 +1,293 @@
+try:
+    from importlib.resources import files, as_file
+except ImportError:
+    from importlib_resources import files, as_file
+import gc
+import json
+import os
+import pickle
+import threading
+from uniparser_morph.morph_fst import MorphFST
+from .snapshot import morph_version
+from .lexicon import LEXICON_SHARDS
+from .wordform_index import grammar_digest
+
+STEM_INDEX_VERSION = 1
+STEM_INDEX_MAGIC = b'UDMSTEMINDEX\n'
+MAX_DISTANCE = 1    # number of replacements the index can propose stems for
+
+
+def stem_index_file(mode, normalize=False):
+    """
+    Return the path to the stem index for the given mode.
+    """
+    if normalize:
+        return files('uniparser_udmurt.data_' + mode) / 'stems_normalized.idx'
+    return files('uniparser_udmurt.data_' + mode) / 'stems.idx'
+
+
+def char_table(charEquiv):
+    """
+    Return a translation table that replaces each character with
+    one representative of the characters considered equivalent to it
+    in the grammar (g.charEquiv), so that equivalent spellings get
+    the same index keys.
+    """
+    parent = {}
+
+    def find(c):
+        while parent.get(c, c) != c:
+            c = parent[c]
+        return c
+
+    for c in charEquiv:
+        for cEquiv in charEquiv[c]:
+            root1, root2 = find(c), find(cEquiv)
+            if root1 != root2:
+                parent[max(root1, root2)] = min(root1, root2)
+    return str.maketrans({c: find(c) for c in parent})
+
+
+def deletions(s):
+    """
+    Return the string itself and all strings that can be
+    obtained from it by deleting one character.
+    """
+    return {s} | {s[:i] + s[i + 1:] for i in range(len(s))}
+
+
+def within_one_edit(s1, s2):
+    """
+    Check if the strings are equal or differ by one substitution,
+    insertion, deletion or swap of two adjacent characters.
+    """
+    if s1 == s2:
+        return True
+    if abs(len(s1) - len(s2)) > 1:
+        return False
+    i = 0
+    while i < len(s1) and i < len(s2) and s1[i] == s2[i]:
+        i += 1
+    if len(s1) > len(s2):
+        return s1[i + 1:] == s2[i:]
+    if len(s1) < len(s2):
+        return s1[i:] == s2[i + 1:]
+    return (s1[i + 1:] == s2[i + 1:]
+            or (i + 1 < len(s1) and s1[i] == s2[i + 1] and s1[i + 1] == s2[i]
+                and s1[i + 2:] == s2[i + 2:]))
+
+
+def fst_paths(fst):
+    """
+    Return the paths from the start state of the FST to all states
+    that have objects (sublexemes) attached to them. In a path,
+    empty transitions (to loop states) are represented by dots,
+    as in the strings passed to MorphFST.add_string().
+    """
+    children = {}
+    for (state, c), nextStates in fst.transitions.items():
+        stateChildren = children.setdefault(state.id, [])
+        for nextState in nextStates:
+            stateChildren.append((c if len(c) > 0 else '.', nextState))
+    paths = []
+    stack = [(fst.startState, '')]
+    while len(stack) > 0:
+        state, path = stack.pop()
+        if state.obj is not None and len(path) > 0:
+            paths.append(path)
+        for c, nextState in children.get(state.id, []):
+            stack.append((nextState, path + c))
+    return paths
+
+
+def fst_states(fst, path):
+    """
+    Return the states of the FST reached by following the path
+    from the start state along all transitions that match it,
+    or an empty list if there is no such path.
+    """
+    states = [fst.startState]
+    for c in path:
+        nextStates = {}
+        for state in states:
+            for nextState in fst.transitions.get((state, c if c != '.' else ''), ()):
+                nextStates[nextState.id] = nextState
+        if len(nextStates) <= 0:
+            return []
+        states = list(nextStates.values())
+    return states
+
+
+def write_stem_index(analyzer, fname=None):
+    """
+    Write a symmetric deletion index of the stems in the stem FST
+    of the analyzer to a file. Each path to a stem in the FST is
+    indexed by one of its parts: the part before the first dot if
+    the stem has to start at the beginning of the word, otherwise its
+    longest part. Keys are these parts and all strings obtained from
+    them by deleting one character, so that a part and a string one
+    replacement away from it always share a key.
+    """
+    if fname is None:
+        with as_file(stem_index_file(analyzer.dataMode, analyzer.normalize)) as path:
+            fname = str(path)
+    analyzer.initialize_parser()
+    # The index is always built with all lexicon shards
+    for shard in LEXICON_SHARDS:
+        analyzer.load_lexicon(shard)
+    charTable = char_table(analyzer.g.charEquiv)
+    paths = sorted(set(fst_paths(analyzer.m.stemFst)))
+    anchored = {}       # keys for stems at the beginning of the word
+    unanchored = {}     # keys for stems anywhere in the word
+    alwaysPaths = []    # stems without letters in their first or longest part
+    maxKeyLen = 0
+    for iPath, path in enumerate(paths):
+        parts = path.translate(charTable).split('.')
+        if len(parts[0]) > 0:
+            table = anchored
+            key = parts[0]
+        else:
+            table = unanchored
+            key = max(parts, key=len)
+        if len(key) <= 0:
+            alwaysPaths.append(iPath)
+            continue
+        maxKeyLen = max(maxKeyLen, len(key))
+        for variant in deletions(key):
+            try:
+                table[variant].append(iPath)
+            except KeyError:
+                table[variant] = [iPath]
+    anchored = {k: tuple(v) for k, v in anchored.items()}
+    unanchored = {k: tuple(v) for k, v in unanchored.items()}
+    header = {
+        'version': STEM_INDEX_VERSION,
+        'mode': analyzer.dataMode,
+        'normalize': analyzer.normalize,
+        'uniparser_morph': morph_version(),
+        'sources': grammar_digest(analyzer),
+        'max_distance': MAX_DISTANCE,
+        'max_key_length': maxKeyLen
+    }
+    with open(fname + '.tmp', 'wb') as fOut:
+        fOut.write(STEM_INDEX_MAGIC)
+        fOut.write(json.dumps(header, sort_keys=True).encode('utf-8') + b'\n')
+        pickle.dump((paths, anchored, unanchored, alwaysPaths), fOut, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(fname + '.tmp', fname)
+    return len(paths)
+
+
+class StemIndex:
+    """
+    Index written by write_stem_index(). It proposes the stems
+    that can be found in a word with at most one replacement, so that
+    the search with replacements only has to go through them instead
+    of the whole stem FST. The tables are loaded on first use.
+    """
+    def __init__(self, fname, charEquiv):
+        self.fname = fname
+        with open(fname, 'rb') as fIn:
+            if fIn.read(len(STEM_INDEX_MAGIC)) != STEM_INDEX_MAGIC:
+                raise ValueError('Not a stem index: ' + fname)
+            self.header = json.loads(fIn.readline().decode('utf-8'))
+        self.maxDistance = self.header.get('max_distance', 0)
+        self.maxKeyLen = self.header.get('max_key_length', 0)
+        self.charTable = char_table(charEquiv)
+        self.lock = threading.Lock()
+        self.paths = None
+        self.anchored = None
+        self.unanchored = None
+        self.alwaysPaths = None
+
+    def load(self):
+        with self.lock:
+            if self.paths is not None:
+                return
+            gcEnabled = gc.isenabled()
+            gc.disable()
+            try:
+                with open(self.fname, 'rb') as fIn:
+                    fIn.read(len(STEM_INDEX_MAGIC))
+                    fIn.readline()
+                    paths, anchored, unanchored, alwaysPaths = pickle.load(fIn)
+            finally:
+                if gcEnabled:
+                    gc.enable()
+            self.anchored, self.unanchored, self.alwaysPaths = anchored, unanchored, alwaysPaths
+            self.paths = paths
+
+    def candidate_paths(self, word):
+        """
+        Return the paths (see fst_paths()) of all stems whose indexed
+        part is at most one replacement away from a substring of the
+        word (a prefix, for the stems that start at the beginning of
+        the word).
+        """
+        if self.paths is None:
+            self.load()
+        word = word.translate(self.charTable)
+        found = set()
+        maxLen = min(len(word), self.maxKeyLen + self.maxDistance)
+        for end in range(1, maxLen + 1):
+            for variant in deletions(word[:end]):
+                found.update(self.anchored.get(variant, ()))
+        if len(self.unanchored) > 0:
+            for start in range(len(word)):
+                for end in range(start + 1, min(len(word), start + maxLen) + 1):
+                    for variant in deletions(word[start:end]):
+                        found.update(self.unanchored.get(variant, ()))
+        # Keys that share a deletion may still be two replacements apart
+        paths = [self.paths[i] for i in self.alwaysPaths]
+        for i in sorted(found):
+            parts = self.paths[i].translate(self.charTable).split('.')
+            if len(parts[0]) > 0:
+                key = parts[0]
+                starts = [0]
+            else:
+                key = max(parts, key=len)
+                starts = range(len(word))
+            if any(within_one_edit(key, word[start:start + keyLen])
+                   for start in starts
+                   for keyLen in range(len(key) - 1, len(key) + 2)):
+                paths.append(self.paths[i])
+        return paths
+
+    def candidate_fst(self, stemFst, word, minStemLen=0):
+        """
+        Return a small FST with the candidate stems for the word,
+        with the same paths to them as in the full stem FST, so that
+        MorphFST.transduce() finds exactly the same stems in it.
+        Stems with fewer than minStemLen - 2 letters are left out:
+        the parser rejects them anyway (see MIN_REPLACEMENT_STEM_LEN).
+        """
+        fst = MorphFST(stemFst.g)
+        for path in self.candidate_paths(word):
+            if len(path) - path.count('.') + self.maxDistance + 1 < minStemLen:
+                continue
+            for state in fst_states(stemFst, path):
+                if state.obj is None:
+                    continue
+                for obj in state.obj:
+                    fst.add_string(path, obj)
+        return fst
+
+
+def load_stem_index(analyzer):
+    """
+    Open the stem index for the mode of the analyzer. Return None
+    if there is no index or it was built with another grammar.
+    """
+    with as_file(stem_index_file(analyzer.dataMode, analyzer.normalize)) as fname:
+        if not os.path.exists(fname):
+            return None
+        try:
+            index = StemIndex(str(fname), analyzer.g.charEquiv)
+        except (ValueError, OSError):
+            return None
+    if (index.header.get('version') != STEM_INDEX_VERSION
+            or index.header.get('mode') != analyzer.dataMode
+            or index.header.get('normalize') != analyzer.normalize
+            or index.header.get('uniparser_morph') != morph_version()
+            or index.header.get('sources') != grammar_digest(analyzer)):
+        return None
+    return index
@@ -0,0 +1,193 @@
+try:
+    from importlib.resources import files, as_file
+except ImportError:
+    from importlib_resources import files, as_file
+import json
+import mmap
+import os
+import struct
+from uniparser_morph.wordform import Wordform
+from .snapshot import source_digest, morph_version
+from .lexicon import LEXICON_SHARDS
+
+INDEX_VERSION = 1
+INDEX_MAGIC = b'UDMWFINDEX\n'
+
+
+def index_file(mode, normalize=False):
+    """
+    Return the path to the word form index for the given mode.
+    """
+    if normalize:
+        return files('uniparser_udmurt.data_' + mode) / 'wordforms_normalized.idx'
+    return files('uniparser_udmurt.data_' + mode) / 'wordforms.idx'
+
+
+def grammar_digest(analyzer):
+    """
+    Return the hashes of the grammar files the analyzer was loaded from.
+    """
+    with as_file(files(analyzer.dirName)) as dataDir:
+        return source_digest(str(dataDir))
+
+
+def wordform2record(ana):
+    """
+    Return a list with all the values of the analysis that end up
+    in its XML or JSON representation, except for the word form.
+    """
+    return [ana.lemma, ana.gramm, ana.stem, ana.gloss, ana.wfGlossed,
+            ana.wfGlossedStd, ana.glossByLang, [list(kv) for kv in ana.otherData],
+            [wordform2record(sw) for sw in ana.subwords]]
+
+
+def record2wordform(g, record, wf):
+    """
+    Recreate a Wordform object from a list returned by wordform2record().
+    """
+    ana = Wordform(g, wf=wf)
+    ana.lemma, ana.gramm, ana.stem, ana.gloss, ana.wfGlossed,\
+        ana.wfGlossedStd, ana.glossByLang, otherData, subwords = record
+    ana.glossByLang = dict(ana.glossByLang)
+    ana.otherData = [tuple(kv) for kv in otherData]
+    ana.subwords = [record2wordform(g, sw, '') for sw in subwords]
+    return ana
+
+
+def write_wordform_index(analyzer, words, fname=None):
+    """
+    Analyze the words with the analyzer (without replacements)
+    and write the analyses to a binary index file. The file
+    contains a sorted table of lowercase word forms with offsets
+    into a block of JSON-encoded analyses, so that it can be
+    searched without loading it into memory.
+    """
+    if fname is None:
+        with as_file(index_file(analyzer.dataMode, analyzer.normalize)) as path:
+            fname = str(path)
+    analyzer.initialize_parser()
+    # The index is always built with all lexicon shards
+    for shard in LEXICON_SHARDS:
+        analyzer.load_lexicon(shard)
+    entries = {}
+    for word in words:
+        key = word.lower()
+        if key in entries:
+            continue
+        entries[key] = json.dumps([wordform2record(ana) for ana in analyzer.m.parse(key)],
+                                  ensure_ascii=False).encode('utf-8')
+    keys = sorted(k.encode('utf-8') for k in entries)
+    header = {
+        'version': INDEX_VERSION,
+        'mode': analyzer.dataMode,
+        'normalize': analyzer.normalize,
+        'uniparser_morph': morph_version(),
+        'sources': grammar_digest(analyzer)
+    }
+    keyOffsets = [0]
+    valueOffsets = [0]
+    for k in keys:
+        keyOffsets.append(keyOffsets[-1] + len(k))
+        valueOffsets.append(valueOffsets[-1] + len(entries[k.decode('utf-8')]))
+    with open(fname + '.tmp', 'wb') as fOut:
+        fOut.write(INDEX_MAGIC)
+        fOut.write(json.dumps(header, sort_keys=True).encode('utf-8') + b'\n')
+        fOut.write(struct.pack('<Q', len(keys)))
+        fOut.write(struct.pack('<' + str(len(keyOffsets)) + 'Q', *keyOffsets))
+        fOut.write(struct.pack('<' + str(len(valueOffsets)) + 'Q', *valueOffsets))
+        for k in keys:
+            fOut.write(k)
+        for k in keys:
+            fOut.write(entries[k.decode('utf-8')])
+    os.replace(fname + '.tmp', fname)
+    return len(keys)
+
+
+class WordformIndex:
+    """
+    Read-only, memory-mapped table of precomputed analyses
+    written by write_wordform_index().
+    """
+    def __init__(self, fname):
+        with open(fname, 'rb') as fIn:
+            self.mm = mmap.mmap(fIn.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mm.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+            raise ValueError('Not a word form index: ' + fname)
+        self.header = json.loads(self.mm.readline().decode('utf-8'))
+        self.n = struct.unpack('<Q', self.mm.read(8))[0]
+        self.keyOffsetsStart = self.mm.tell()
+        self.valueOffsetsStart = self.keyOffsetsStart + 8 * (self.n + 1)
+        self.keysStart = self.valueOffsetsStart + 8 * (self.n + 1)
+        self.valuesStart = self.keysStart + self.offset(self.keyOffsetsStart, self.n)
+
+    def __len__(self):
+        return self.n
+
+    def offset(self, tableStart, i):
+        return struct.unpack_from('<Q', self.mm, tableStart + 8 * i)[0]
+
+    def key(self, i):
+        return self.mm[self.keysStart + self.offset(self.keyOffsetsStart, i):
+                       self.keysStart + self.offset(self.keyOffsetsStart, i + 1)]
+
+    def lookup(self, word):
+        """
+        Return the list of records for a lowercase word form,
+        or None if it is not in the index.
+        """
+        bWord = word.encode('utf-8')
+        lo, hi = 0, self.n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            k = self.key(mid)
+            if k < bWord:
+                lo = mid + 1
+            elif k > bWord:
+                hi = mid
+            else:
+                return json.loads(self.mm[self.valuesStart + self.offset(self.valueOffsetsStart, mid):
+                                          self.valuesStart + self.offset(self.valueOffsetsStart, mid + 1)])
+        return None
+
+    def close(self):
+        self.mm.close()
+
+
+class IndexedLookup:
+    """
+    Lookup stage that takes the records of a lowercase word from
+    a WordformIndex and only calls parse(word, replacementsAllowed)
+    for the words that are not there or when replacements are allowed.
+    """
+    def __init__(self, index, parse):
+        self.index = index
+        self.parse = parse
+
+    def records(self, word, replacementsAllowed=0):
+        if replacementsAllowed <= 0:
+            records = self.index.lookup(word)
+            if records is not None:
+                return records
+        return self.parse(word, replacementsAllowed=replacementsAllowed)
+
+
+def load_wordform_index(analyzer):
+    """
+    Open the word form index for the mode of the analyzer. Return
+    None if there is no index or it was built with another grammar.
+    """
+    with as_file(index_file(analyzer.dataMode, analyzer.normalize)) as fname:
+        if not os.path.exists(fname):
+            return None
+        try:
+            index = WordformIndex(str(fname))
+        except (ValueError, OSError, struct.error):
+            return None
+    if (index.header.get('version') != INDEX_VERSION
+            or index.header.get('mode') != analyzer.dataMode
+            or index.header.get('normalize') != analyzer.normalize
+            or index.header.get('uniparser_morph') != morph_version()
+            or index.header.get('sources') != grammar_digest(analyzer)):
+        index.close()
+        return None
+    return index
@@ -0,0 +1,385 @@
+"""
+Incremental update of the analyzed frequency list (the files written
+by pre_build.parse_wordlists()) after the lexicon, the lexical rules
+or the bad analysis templates have been edited.
+The state of the grammars the list was analyzed with is saved next
+to it. When the grammars change, the states are compared and only the
+words the differences may concern are analyzed again: the words that
+contain a stem of an added or removed lexeme or, if they may only be
+analyzed with a replacement, something within one edit from it, and
+the words that have an analysis with the lemma of a lexeme whose
+translations have changed. Changes in the other grammar files
+(paradigms etc.) cannot be traced to words and require a full rebuild.
+"""
+try:
+    from importlib.resources import files, as_file
+except ImportError:
+    from importlib_resources import files, as_file
+import hashlib
+import html
+import json
+import os
+import re
+from bisect import bisect_right
+from .lexicon import iter_lexemes, LEXICON_SHARDS, shard_file, rxFreqLemma, file_digest
+from .orthography import charEquivalences
+from .rule_index import TemplateIndex
+from .snapshot import source_digest, morph_version
+from .parser import MIN_REPLACEMENT_WORD_LEN, MIN_REPLACEMENT_STEM_LEN
+
+WORDLIST_STATE_VERSION = 1
+WORDLIST_STATE_FILE = 'wordlist_state.json'
+WORDLIST_MODES = ('strict', 'nodiacritics')     # grammars parse_wordlists() uses
+LEXEME_FILES = tuple(shard_file(shard) for shard in [None] + sorted(LEXICON_SHARDS))
+RULE_FILES = LEXEME_FILES + ('lex_rules.txt', 'bad_analyses.txt')
+# Characters of the nodiacritics orthography -> characters they may stand for
+FOLD_TABLE = str.maketrans({cStd: c for c, cStds in charEquivalences['nodiacritics'].items() for cStd in cStds})
+rxStemVariants = re.compile('[^ |/]+')
+rxStemPieces = re.compile('[^.<>\\[\\]~&0-9_]+')
+rxTransLine = re.compile('^ +trans_[^\r\n]*\n', flags=re.MULTILINE)
+rxLexRule = re.compile('^-lex_rule *\n((?:[ \t][^\r\n]*\n|[ \t]*\n)*)', flags=re.MULTILINE)
+rxLexRuleKey = re.compile('^ +(lex|stem) *: *([^\r\n]*?) *$', flags=re.MULTILINE)
+
+
+def fold(s):
+    """
+    Lowercase the string and remove the diacritics, so that words
+    of both orthographies contain the folded stems of their lexemes.
+    """
+    return s.lower().translate(FOLD_TABLE)
+
+
+def text_digest(text):
+    return hashlib.md5(text.encode('utf-8')).hexdigest()[:16]
+
+
+def stem_keys(stems, minLength=0):
+    """
+    Return the set of strings every word form built from the stems
+    contains (after fold()): the longest part of each stem variant
+    that has no metacharacters in it. Only take the variants that
+    have at least minLength letters.
+    """
+    keys = set()
+    for stem in stems:
+        for variant in rxStemVariants.findall(stem):
+            pieces = rxStemPieces.findall(variant)
+            if sum(len(piece) for piece in pieces) >= minLength:
+                keys.add(fold(max(pieces, key=len, default='')))
+    return keys
+
+
+def lexeme_entry(lexeme):
+    """
+    Return the description of a lexeme kept in the state: [lemmata,
+    stem keys, keys of the stems long enough to be found with a
+    replacement, digest of the entry without translations].
+    """
+    stems = lexeme.values('stem') or lexeme.values('lex')
+    return [lexeme.values('lex'), sorted(stem_keys(stems)),
+            sorted(stem_keys(stems, minLength=MIN_REPLACEMENT_STEM_LEN)),
+            text_digest(rxTransLine.sub('', lexeme.text))]
+
+
+def grammar_state(dirName):
+    """
+    Return the state of the grammar in a data directory: the hashes
+    of the grammar files other than the lexicon and the rules, the
+    descriptions of the lexemes and the keys of the lexical rules by
+    the hashes of their texts, and the bad analysis templates.
+    """
+    state = {
+        'files': {fname: digest for fname, digest in source_digest(dirName).items()
+                  if fname not in RULE_FILES},
+        'lexemes': {},
+        'lex_rules': {},
+        'bad_analyses': []
+    }
+    for fname in LEXEME_FILES:
+        fname = os.path.join(dirName, fname)
+        if os.path.exists(fname):
+            for lexeme in iter_lexemes(fname):
+                state['lexemes'][text_digest(lexeme.text)] = lexeme_entry(lexeme)
+    fname = os.path.join(dirName, 'lex_rules.txt')
+    if os.path.exists(fname):
+        with open(fname, 'r', encoding='utf-8-sig') as fIn:
+            text = fIn.read()
+        for m in rxLexRule.finditer(text):
+            rule = m.group(1).strip()
+            # The rules are found by stem if there is one, otherwise by lemma
+            keys = dict(rxLexRuleKey.findall(rule.split(' -add')[0]))
+            if 'stem' in keys:
+                state['lex_rules'][text_digest(rule)] = ['stem', keys['stem']]
+            elif 'lex' in keys:
+                state['lex_rules'][text_digest(rule)] = ['lex', keys['lex']]
+    fname = os.path.join(dirName, 'bad_analyses.txt')
+    if os.path.exists(fname):
+        with open(fname, 'r', encoding='utf-8-sig') as fIn:
+            state['bad_analyses'] = sorted(json.dumps(template, ensure_ascii=False, sort_keys=True)
+                                           for template in json.load(fIn))
+    return state
+
+
+def grammar_states():
+    """
+    Return the states of the grammars of WORDLIST_MODES.
+    """
+    states = {}
+    for mode in WORDLIST_MODES:
+        with as_file(files('uniparser_udmurt.data_' + mode)) as dataDir:
+            states[mode] = grammar_state(str(dataDir))
+    return states
+
+
+def load_wordlist_state(dirName):
+    try:
+        with open(os.path.join(dirName, WORDLIST_STATE_FILE), 'r', encoding='utf-8') as fIn:
+            state = json.load(fIn)
+    except (IOError, ValueError):
+        return None
+    if state.get('version') != WORDLIST_STATE_VERSION or state.get('uniparser_morph') != morph_version():
+        return None
+    return state
+
+
+def save_wordlist_state(dirName, grammars, sources, outputs):
+    """
+    Save the state of the grammars the word lists in dirName were
+    analyzed with. sources are the hashes of the code that analyzed
+    them, outputs are the names of the files written.
+    """
+    state = {
+        'version': WORDLIST_STATE_VERSION,
+        'uniparser_morph': morph_version(),
+        'sources': sources,
+        'outputs': {fname: file_digest(os.path.join(dirName, fname)) for fname in outputs},
+        'grammars': grammars
+    }
+    with open(os.path.join(dirName, WORDLIST_STATE_FILE), 'w', encoding='utf-8') as fOut:
+        json.dump(state, fOut, ensure_ascii=False, separators=(',', ':'))
+
+
+def template_pattern(value):
+    # Same as Grammar.compile_ana_template()
+    return re.compile('^' + value.strip('^$') + '$')
+
+
+def near_pattern(key):
+    """
+    Return a regex that finds the key with at most one character
+    inserted, deleted, replaced or two adjacent characters swapped,
+    which is what a search with one replacement may correct.
+    """
+    variants = {re.escape(key)}
+    for i in range(len(key) + 1):
+        variants.add(re.escape(key[:i]) + '.' + re.escape(key[i:]))
+        if i < len(key):
+            variants.add(re.escape(key[:i] + key[i + 1:]))
+            variants.add(re.escape(key[:i]) + '.' + re.escape(key[i + 1:]))
+        if i < len(key) - 1:
+            variants.add(re.escape(key[:i] + key[i + 1] + key[i] + key[i + 2:]))
+    return re.compile('|'.join(sorted(variants)))
+
+
+class WordSearch:
+    """
+    Folded words joined into one string, so that all words that
+    contain a substring can be found with str.find().
+    """
+    def __init__(self, words):
+        self.words = words
+        self.starts = []
+        folded = []
+        pos = 1
+        for word in words:
+            self.starts.append(pos)
+            folded.append(fold(word))
+            pos += len(folded[-1]) + 1
+        self.folded = folded
+        self.text = '\n' + '\n'.join(folded) + '\n'
+
+    def containing(self, s):
+        """
+        Return the set of indexes of the words that contain s.
+        """
+        if len(s) <= 0:
+            return set(range(len(self.words)))
+        result = set()
+        pos = self.text.find(s)
+        while pos >= 0:
+            i = bisect_right(self.starts, pos) - 1
+            result.add(i)
+            if i + 1 >= len(self.starts):
+                break
+            pos = self.text.find(s, self.starts[i + 1])
+        return result
+
+    def near(self, key):
+        """
+        Return the set of indexes of the words that contain the key
+        with at most one edit (see near_pattern()). Each such word
+        contains either the first half of the key without its last
+        character or the second half.
+        """
+        half = len(key) // 2
+        candidates = self.containing(key[:half][:-1]) | self.containing(key[half:])
+        rx = near_pattern(key)
+        return set(i for i in candidates if rx.search(self.folded[i]) is not None)
+
+
+class WordlistChanges:
+    """
+    Differences between two states of the grammars (see grammar_states())
+    in terms of the words they may affect.
+    A change can affect the words analyzed with a replacement and the
+    words whose analyses with a replacement were rejected by
+    pre_build.match_analyzed_line() even if they do not contain the
+    stems literally, but only if the stems are long enough to be
+    found with a replacement (see Parser.find_stems()).
+    """
+    def __init__(self, oldGrammars, newGrammars):
+        self.rebuild = False    # the differences cannot be traced to words
+        self.keys = set()       # stem keys: words that contain them may be affected
+        self.nearKeys = set()   # words that may be analyzed with a replacement and
+                                # contain them with at most one edit may be affected
+        self.lemmas = set()     # words that have analyses with these lemmata are affected
+        self.nLexemes = 0
+        self.nLexRules = 0
+        self.nBadAnalyses = 0
+        if sorted(oldGrammars) != sorted(newGrammars):
+            self.rebuild = True
+            return
+        for mode in newGrammars:
+            old, new = oldGrammars[mode], newGrammars[mode]
+            if old['files'] != new['files']:
+                self.rebuild = True
+                return
+            self.compare_lexemes(old['lexemes'], new['lexemes'])
+            lemmaKeys = self.lemma_keys(old['lexemes'], new['lexemes'])
+            for ruleId in set(old['lex_rules']) ^ set(new['lex_rules']):
+                field, value = old['lex_rules'].get(ruleId) or new['lex_rules'][ruleId]
+                self.nLexRules += 1
+                if field == 'stem':
+                    self.keys |= stem_keys([value])
+                    self.nearKeys |= stem_keys([value], minLength=MIN_REPLACEMENT_STEM_LEN)
+                else:
+                    self.add_lemma(value, lemmaKeys)
+            oldTemplates, newTemplates = set(old['bad_analyses']), set(new['bad_analyses'])
+            for template in oldTemplates ^ newTemplates:
+                self.nBadAnalyses += 1
+                self.add_bad_analysis(json.loads(template), template in newTemplates, lemmaKeys)
+                if self.rebuild:
+                    return
+
+    def __bool__(self):
+        return self.nLexemes + self.nLexRules + self.nBadAnalyses > 0
+
+    def compare_lexemes(self, oldLexemes, newLexemes):
+        """
+        Lexemes whose entries only differ in translations are found
+        by lemma, all other added and removed lexemes, by stem.
+        """
+        removedByText = {}
+        for lexemeId in oldLexemes:
+            if lexemeId not in newLexemes:
+                entry = oldLexemes[lexemeId]
+                removedByText.setdefault(entry[3], []).append(entry)
+        for lexemeId in newLexemes:
+            if lexemeId in oldLexemes:
+                continue
+            entry = newLexemes[lexemeId]
+            self.nLexemes += 1
+            sameText = removedByText.get(entry[3])
+            if sameText:
+                sameText.pop()
+                self.lemmas.update(entry[0])
+            else:
+                self.keys.update(entry[1])
+                self.nearKeys.update(entry[2])
+        for entries in removedByText.values():
+            for entry in entries:
+                self.nLexemes += 1
+                self.keys.update(entry[1])
+                self.nearKeys.update(entry[2])
+
+    @staticmethod
+    def lemma_keys(*lexemeDicts):
+        """
+        Return a dictionary {lemma: (stem keys, near keys)}.
+        """
+        lemmaKeys = {}
+        for lexemes in lexemeDicts:
+            for lemmas, keys, nearKeys, _ in lexemes.values():
+                for lemma in lemmas:
+                    if lemma not in lemmaKeys:
+                        lemmaKeys[lemma] = (set(), set())
+                    lemmaKeys[lemma][0].update(keys)
+                    lemmaKeys[lemma][1].update(nearKeys)
+        return lemmaKeys
+
+    def add_lemma(self, lemma, lemmaKeys):
+        """
+        Add a change that can only affect the existing analyses
+        with the lemma, or remove them.
+        """
+        self.lemmas.add(lemma)
+        if lemma in lemmaKeys:
+            self.nearKeys |= lemmaKeys[lemma][1]
+
+    def add_bad_analysis(self, template, added, lemmaKeys):
+        """
+        A template is traced to words by its literal word form values
+        (see TemplateIndex.template_key()), otherwise by the lemmata
+        it matches. A new template can only remove existing analyses,
+        a template that has been removed may let through analyses of
+        any word with these lemmata.
+        """
+        if 'remove' in template and 'if_exists' in template:
+            template = template['remove']
+        template = {field: template_pattern(value) for field, value in template.items() if type(value) == str}
+        key = TemplateIndex.template_key(template)
+        if key is not None and key[0] == 'wf':
+            field, position, values = key
+            for value in values:
+                self.keys.add(fold(value))
+                # Words analyzed with a replacement are long
+                if position != 'full' or len(value) >= MIN_REPLACEMENT_WORD_LEN - 1:
+                    self.nearKeys.add(fold(value))
+        elif 'lemma' in template:
+            rx = template['lemma']
+            for lemma in lemmaKeys:
+                if rx.search(lemma) is None:
+                    continue
+                if added:
+                    self.add_lemma(lemma, lemmaKeys)
+                else:
+                    self.keys |= lemmaKeys[lemma][0]
+                    self.nearKeys |= lemmaKeys[lemma][1]
+        else:
+            self.rebuild = True
+
+    def affected_words(self, results):
+        """
+        Return the set of words that have to be analyzed again.
+        results is a dictionary {word: (stage, line)} with the current
+        analyses (stage 3 means one replacement, None, unanalyzed).
+        """
+        words = sorted(results)
+        affected = set()
+        if len(self.keys) > 0:
+            search = WordSearch(words)
+            for key in self.keys:
+                affected.update(words[i] for i in search.containing(key))
+        if len(self.nearKeys) > 0:
+            r1Words = [word for word in words
+                       if results[word][0] in (3, None) and len(word) >= MIN_REPLACEMENT_WORD_LEN]
+            search = WordSearch(r1Words)
+            for key in self.nearKeys:
+                affected.update(r1Words[i] for i in search.near(key))
+        if len(self.lemmas) > 0:
+            for word in words:
+                stage, line = results[word]
+                if line is not None and any(html.unescape(lemma) in self.lemmas
+                                            for lemma in rxFreqLemma.findall(line)):
+                    affected.add(word)
+        return affected